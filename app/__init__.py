@@ -37,4 +37,20 @@ def create_app():
     app.register_blueprint(list_blueprint, url_prefix='/api')
     app.register_blueprint(reader_blueprint, url_prefix='/reader')
 
+    # Dựng sẵn index gợi ý tìm kiếm ở nền để phím gõ đầu tiên không phải chờ build
+    if not app.config.get('TESTING'):
+        from .suggest_index import suggest_index
+        suggest_index.warm_up(app)
+
+    # Chapter được làm mới ở nền theo độ ưu tiên; route của người đọc chỉ đọc DB.
+    # Với reloader của Werkzeug chỉ process con (WERKZEUG_RUN_MAIN) chạy worker, không chạy ở process cha
+    reloader_parent = app.debug and os.environ.get('WERKZEUG_RUN_MAIN') != 'true'
+    if not app.config.get('TESTING') and not reloader_parent:
+        if app.config.get('CHAPTER_SCHEDULER_ENABLED'):
+            from .chapter_scheduler import chapter_scheduler
+            chapter_scheduler.start(app)
+        elif app.config.get('CHAPTER_SCHEDULER_ENABLED') is False:
+            print("[ChapterScheduler] Disabled in this process: manga without chapters are only synced by "
+                  "`python -m app.chapter_scheduler` or a process with CHAPTER_SCHEDULER_ENABLED=1")
+
     return app
\ No newline at end of file
@@ -0,0 +1,85 @@
+# app/at_home.py
+# Cache kết quả /at-home/server/{chapterId} (baseUrl, hash, danh sách file ảnh) cho trang đọc.
+# baseUrl của MediaDex@Home chỉ dùng được ~15 phút nên mỗi entry sống AT_HOME_TTL (chừa thời gian
+# để trình duyệt tải hết ảnh); reload / quay lại chapter trong khoảng đó không gọi MangaDex nữa.
+# Nhiều request cùng một chapter lúc cache trống chỉ tạo một lời gọi API (single-flight).
+import threading
+import time
+from collections import OrderedDict
+
+from .mangadex_client import INTERACTIVE_MAX_WAIT, get_client
+
+AT_HOME_TTL = 10 * 60
+AT_HOME_CACHE_SIZE = 2048
+# Hạn chót của một lời gọi: chờ limiter tối đa AT_HOME_MAX_WAIT giây (hết lượt thì RateLimitTimeout),
+# rồi một lần gửi duy nhất với timeout (connect, read) - không retry urllib3, không chờ-gửi-lại khi 429.
+AT_HOME_MAX_WAIT = INTERACTIVE_MAX_WAIT
+AT_HOME_TIMEOUT = (3, 10)
+AT_HOME_DEADLINE = AT_HOME_MAX_WAIT + sum(AT_HOME_TIMEOUT)
+# request đi sau chờ lời gọi đang chạy tối đa ngần này giây (hạn chót của lời gọi + 1 giây dư)
+AT_HOME_WAIT = AT_HOME_DEADLINE + 1
+
+_lock = threading.Lock()
+_cache = OrderedDict()   # chapter_id -> (hết hạn lúc, dict at-home), cuối = dùng gần nhất
+_inflight = {}           # chapter_id -> _Call đang gọi API
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def _fetch(chapter_id):
+    data = get_client().api_get(f"/at-home/server/{chapter_id}", timeout=AT_HOME_TIMEOUT,
+                                interactive=True, max_wait=AT_HOME_MAX_WAIT)
+    return {
+        'base_url': data['baseUrl'],
+        'hash': data['chapter']['hash'],
+        'files': list(data['chapter']['data']),
+    }
+
+
+def get_at_home(chapter_id):
+    """
+    {'base_url', 'hash', 'files'} của chapter, từ cache nếu còn hạn. Lỗi của lời gọi API
+    (kể cả cho các request đang chờ cùng chapter) được raise lại, không cache.
+    """
+    key = str(chapter_id).lower()
+    with _lock:
+        entry = _cache.get(key)
+        if entry and entry[0] > time.monotonic():
+            _cache.move_to_end(key)
+            return entry[1]
+        call = _inflight.get(key)
+        leader = call is None
+        if leader:
+            call = _inflight[key] = _Call()
+
+    if not leader:
+        if not call.done.wait(AT_HOME_WAIT):
+            raise TimeoutError(f"Timed out waiting for at-home server of chapter {key}")
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    try:
+        call.result = _fetch(key)
+        with _lock:
+            _cache[key] = (time.monotonic() + AT_HOME_TTL, call.result)
+            _cache.move_to_end(key)
+            while len(_cache) > AT_HOME_CACHE_SIZE:
+                _cache.popitem(last=False)
+        return call.result
+    except Exception as e:
+        call.error = e
+        raise
+    finally:
+        with _lock:
+            _inflight.pop(key, None)
+        call.done.set()
+
+
+def image_urls(at_home):
+    return [f"{at_home['base_url']}/data/{at_home['hash']}/{name}" for name in at_home['files']]
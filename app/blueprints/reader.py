@@ -1,10 +1,10 @@
 from flask import Blueprint, render_template, redirect, url_for, request, jsonify, flash
 from flask_login import login_required, current_user
-from ..reader_controller import get_chapter, get_first_chapter, get_next_chapter, get_prev_chapter, save_reading_history, get_available_langs, get_continue_chapter, get_chapter_list
-from app.models import Chapter, ReadingHistory, Manga
+from ..reader_controller import get_chapter, get_first_chapter_id, get_next_chapter_id, get_prev_chapter_id, save_reading_history, get_available_langs, get_continue_chapter, get_chapter_list
+from app.models import ReadingHistory, Manga
 from uuid import uuid4
-import requests
 from .. import db
+from ..at_home import get_at_home, image_urls as at_home_image_urls
 
 reader = Blueprint('reader', __name__)
 
@@ -16,20 +16,20 @@ def available_langs(manga_id):
 @reader.route('/<uuid:manga_id>/start', methods=['GET'])
 def start_reading(manga_id):
     lang = request.args.get('lang', 'en')
-    chapter = get_first_chapter(manga_id, lang)
-    if not chapter:
+    chapter_id = get_first_chapter_id(manga_id, lang)
+    if not chapter_id:
         flash('No chapters available.')
         return redirect(url_for('main.manga_detail', manga_id=manga_id))
-    return redirect(url_for('reader.read_chapter', manga_id=manga_id, chapter_id=chapter.ChapterId))
+    return redirect(url_for('reader.read_chapter', manga_id=manga_id, chapter_id=chapter_id))
 
 @reader.route('/<uuid:manga_id>/continue', methods=['GET'])
 @login_required
 def continue_reading(manga_id):
-    chapter, lang = get_continue_chapter(current_user.UserId, manga_id)
-    if not chapter:
+    chapter_id, lang = get_continue_chapter(current_user.UserId, manga_id)
+    if not chapter_id:
         flash('No reading history. Starting from beginning.')
         return start_reading(manga_id)
-    return jsonify({'chapter_id': str(chapter.ChapterId), 'lang': lang})
+    return jsonify({'chapter_id': chapter_id, 'lang': lang})
 
 @reader.route('/<uuid:manga_id>/<uuid:chapter_id>', methods=['GET'])
 def read_chapter(manga_id, chapter_id):
@@ -43,23 +43,17 @@ def read_chapter(manga_id, chapter_id):
         flash('Chapter not available.')
         return redirect(url_for('main.manga_detail', manga_id=manga_id))
     
-    # Call MangaDex API
+    # MangaDex@Home server của chapter (cache theo TTL, xem app/at_home.py)
     try:
-        response = requests.get(f"https://api.mangadex.org/at-home/server/{chapter_id}")
-        response.raise_for_status()
-        data = response.json()
-        base_url = data['baseUrl']
-        hash_val = data['chapter']['hash']
-        filenames = data['chapter']['data']
-        image_urls = [f"{base_url}/data/{hash_val}/{f}" for f in filenames]
+        image_urls = at_home_image_urls(get_at_home(chapter_id))
     except Exception as e:
         flash('Failed to load chapter images.')
         image_urls = []
     
     # Check prev/next
     lang = chapter.TranslatedLang
-    has_next = get_next_chapter(manga_id, chapter.ChapterNumber, lang) is not None
-    has_prev = get_prev_chapter(manga_id, chapter.ChapterNumber, lang) is not None
+    has_next = get_next_chapter_id(manga_id, chapter_id, lang) is not None
+    has_prev = get_prev_chapter_id(manga_id, chapter_id, lang) is not None
     
     # Save history if user
     if current_user.is_authenticated:
@@ -70,17 +64,17 @@ def read_chapter(manga_id, chapter_id):
 @reader.route('/<uuid:manga_id>/next/<uuid:current_id>', methods=['GET'])
 def next_chapter(manga_id, current_id):
     lang = request.args.get('lang', 'en')
-    next_chap = get_next_chapter(manga_id, db.session.get(Chapter, current_id).ChapterNumber, lang)
-    if next_chap:
-        return jsonify({'chapter_id': str(next_chap.ChapterId)})
+    next_id = get_next_chapter_id(manga_id, current_id, lang)
+    if next_id:
+        return jsonify({'chapter_id': next_id})
     return jsonify({'end': True})
 
 @reader.route('/<uuid:manga_id>/prev/<uuid:current_id>', methods=['GET'])
 def prev_chapter(manga_id, current_id):
     lang = request.args.get('lang', 'en')
-    prev_chap = get_prev_chapter(manga_id, db.session.get(Chapter, current_id).ChapterNumber, lang)
-    if prev_chap:
-        return jsonify({'chapter_id': str(prev_chap.ChapterId)})
+    prev_id = get_prev_chapter_id(manga_id, current_id, lang)
+    if prev_id:
+        return jsonify({'chapter_id': prev_id})
     return jsonify({'end': True})
 
 @reader.route('/save-history', methods=['POST'])
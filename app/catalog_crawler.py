@@ -0,0 +1,77 @@
+# app/catalog_crawler.py
+# Crawler toàn bộ catalog MangaDex: duyệt /manga theo updatedAt tăng dần, mỗi trang 100 manga
+# (= một lô /statistics/manga), ingest song song bằng ingest_mangas() và lưu cursor vào SyncState
+# sau mỗi trang. Dừng giữa chừng (Ctrl+C, lỗi, --max-pages) thì lần chạy sau đi tiếp từ cursor.
+#
+#   python -m app.catalog_crawler --workers 4 --max-pages 50
+#   python -m app.catalog_crawler --reset --since 2024-01-01T00:00:00
+import argparse
+import logging
+
+from app.mangadex_api import (CONTENT_RATINGS, INGEST_WORKERS, connect_db, fetch_mangas_by_ids, ingest_mangas,
+                              iter_updated_since, load_sync_state, refresh_tag_dictionary,
+                              save_sync_state)
+
+logger = logging.getLogger(__name__)
+
+STATE_NAME = "catalog_crawler"
+# /manga trả tối đa 100 item mỗi trang, khớp với lô 100 id của /statistics/manga
+PAGE_LIMIT = 100
+SINCE_FORMAT = "%Y-%m-%dT%H:%M:%S"
+EPOCH = "2000-01-01T00:00:00"
+
+
+def _retry_failed(conn, state, workers):
+    """Ingest lại các manga lỗi ở lần chạy trước; giữ lại những cái vẫn lỗi."""
+    failed = state.get("failed", [])
+    if not failed:
+        return
+    logger.info(f"Ingest lại {len(failed)} manga lỗi từ lần chạy trước.")
+    mangas = fetch_mangas_by_ids(failed)
+    state["failed"] = ingest_mangas(mangas, max_workers=workers)
+    save_sync_state(conn, STATE_NAME, state)
+
+
+def crawl_catalog(workers=INGEST_WORKERS, max_pages=None, since=None, reset=False):
+    """
+    Chạy (tiếp) crawler. Cursor = (updatedAt của manga cuối đã xử lý, các id cùng updatedAt đó),
+    xem iter_updated_since. Trả về số manga đã ingest trong lần chạy này.
+    """
+    conn = connect_db()
+    try:
+        state = {} if reset else load_sync_state(conn, STATE_NAME)
+        if since:
+            state.update(since=since, seen=[])
+        state.setdefault("since", EPOCH)
+        state.setdefault("seen", [])
+        state.setdefault("failed", [])
+        # một lời gọi /manga/tag cho cả lần chạy, ghi luôn bảng Tag
+        refresh_tag_dictionary(conn)
+        _retry_failed(conn, state, workers)
+
+        ingested, pages = 0, 0
+        params = {"contentRating[]": CONTENT_RATINGS, "includes[]": ["cover_art", "author", "artist"]}
+        for fresh, since, seen in iter_updated_since("/manga", params, state["since"], state["seen"], PAGE_LIMIT):
+            pages += 1
+            failed = ingest_mangas(fresh, max_workers=workers)
+            ingested += len(fresh) - len(failed)
+            state.update(since=since, seen=seen, failed=sorted(set(state["failed"]) | set(failed)))
+            save_sync_state(conn, STATE_NAME, state)
+            logger.info(f"Trang {pages}: {len(fresh)} manga, cursor updatedAt={since}, "
+                        f"{len(state['failed'])} manga chờ ingest lại.")
+            if max_pages is not None and pages >= max_pages:
+                break
+        logger.info(f"Crawler dừng sau {pages} trang, đã ingest {ingested} manga.")
+        return ingested
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crawl toàn bộ catalog MangaDex vào DB (chạy lại để đi tiếp)")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS, help="Số manga ingest song song")
+    parser.add_argument("--max-pages", type=int, help="Dừng sau ngần này trang (100 manga/trang)")
+    parser.add_argument("--since", type=str, help=f"Bắt đầu từ updatedAt này ({SINCE_FORMAT})")
+    parser.add_argument("--reset", action="store_true", help="Bỏ cursor đã lưu, chạy lại từ đầu")
+    args = parser.parse_args()
+    crawl_catalog(workers=args.workers, max_pages=args.max_pages, since=args.since, reset=args.reset)
@@ -0,0 +1,203 @@
+# app/chapter_nav.py
+# Cấu trúc điều hướng chapter của từng manga cho trang đọc: mỗi ngôn ngữ một mảng (SortKey, ChapterId)
+# đã sắp xếp, tra first / next / prev bằng bisect. Giữ trong LRU theo MangaId (NAV_CACHE_SIZE manga),
+# nên lật trang không phải chạy 2-4 câu truy vấn chapter mỗi lần. Chapter ghi trong process này
+# (chapters_synced, manga_upserted) bỏ entry khỏi cache ngay; ghi từ process khác (worker riêng,
+# delta_sync, catalog_crawler, web worker khác) được phát hiện qua NAV_TTL + _stamp.
+import bisect
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+
+from sqlalchemy import func
+
+from . import db
+from .models import Chapter
+from .signals import chapters_synced, manga_upserted
+
+NAV_CACHE_SIZE = 512
+NAV_TTL = 60   # giây; quá hạn thì kiểm tra lại với DB (chapter do process khác ghi không phát signal ở đây)
+READER_LANGS = ('en', 'vi')
+
+
+def fallback_lang(lang):
+    return 'vi' if lang == 'en' else 'en'
+
+
+class ChapterNav:
+    """Chapter đọc được (IsUnavailable = 0) của một manga, sắp theo (SortKey, ChapterId) cho từng ngôn ngữ."""
+
+    def __init__(self, rows):
+        by_lang = {}
+        self.chapters = {}  # ChapterId (chữ thường) -> (lang, SortKey)
+        for chapter_id, lang, sort_key in rows:
+            key = sort_key if sort_key is not None else Decimal(0)
+            chapter_id = str(chapter_id).lower()
+            by_lang.setdefault(lang, []).append((key, chapter_id))
+            self.chapters[chapter_id] = (lang, key)
+        self._entries = {}  # lang -> [(SortKey, ChapterId)] đã sắp xếp
+        self._keys = {}     # lang -> [SortKey], song song với _entries
+        for lang, entries in by_lang.items():
+            entries.sort()
+            self._entries[lang] = entries
+            self._keys[lang] = [key for key, _ in entries]
+
+    def __len__(self):
+        return len(self.chapters)
+
+    def langs(self):
+        return sorted(self._entries)
+
+    def lang_of(self, chapter_id):
+        entry = self.chapters.get(str(chapter_id).lower())
+        return entry[0] if entry else None
+
+    def first(self, lang):
+        for candidate in (lang, fallback_lang(lang)):
+            if self._entries.get(candidate):
+                return self._entries[candidate][0][1]
+        return None
+
+    def next(self, chapter_id, lang):
+        """
+        Chapter đứng ngay sau chapter hiện tại theo (SortKey, ChapterId), ưu tiên `lang` rồi ngôn ngữ còn lại.
+        Trong cùng ngôn ngữ các chapter trùng SortKey ("Extra", oneshot) vẫn đi lần lượt theo ChapterId;
+        sang ngôn ngữ kia thì chỉ lấy SortKey lớn hơn hẳn, để không mở lại đúng chapter vừa đọc bằng bản dịch khác.
+        """
+        chapter_id = str(chapter_id).lower()
+        entry = self.chapters.get(chapter_id)
+        if not entry:
+            return None
+        for candidate in (lang, fallback_lang(lang)):
+            entries = self._entries.get(candidate, [])
+            if candidate == entry[0]:
+                i = bisect.bisect_right(entries, (entry[1], chapter_id))
+            else:
+                i = bisect.bisect_right(self._keys[candidate], entry[1]) if entries else 0
+            if i < len(entries):
+                return entries[i][1]
+        return None
+
+    def prev(self, chapter_id, lang):
+        """Chapter đứng ngay trước chapter hiện tại, cùng quy tắc với next()."""
+        chapter_id = str(chapter_id).lower()
+        entry = self.chapters.get(chapter_id)
+        if not entry:
+            return None
+        for candidate in (lang, fallback_lang(lang)):
+            entries = self._entries.get(candidate, [])
+            if candidate == entry[0]:
+                i = bisect.bisect_left(entries, (entry[1], chapter_id))
+            else:
+                i = bisect.bisect_left(self._keys[candidate], entry[1]) if entries else 0
+            if i > 0:
+                return entries[i - 1][1]
+        return None
+
+_lock = threading.Lock()
+_cache = OrderedDict()   # MangaId (chữ thường) -> _Entry, cuối = dùng gần nhất
+_building = {}           # MangaId -> _Build đang chạy, để bỏ kết quả build bị invalidate giữa chừng
+
+
+class _Entry:
+    def __init__(self, nav, stamp):
+        self.nav = nav
+        self.stamp = stamp
+        self.checked_at = time.monotonic()
+
+
+class _Build:
+    def __init__(self):
+        self.generation = 0
+        self.builders = 0
+
+
+def _stamp(manga_id):
+    """(số chapter, MAX(UpdatedAt)) của manga: đổi khi process khác (worker, delta_sync, crawler) ghi chapter."""
+    return tuple(db.session.query(func.count(Chapter.ChapterId), func.max(Chapter.UpdatedAt))
+                 .filter(Chapter.MangaId == manga_id).one())
+
+
+def _chapter_readable(manga_id, chapter_id):
+    return db.session.query(Chapter.ChapterId).filter(
+        Chapter.MangaId == manga_id,
+        Chapter.ChapterId == str(chapter_id),
+        Chapter.TranslatedLang.in_(READER_LANGS),
+        Chapter.IsUnavailable == False
+    ).first() is not None
+
+
+def build_nav(manga_id):
+    rows = db.session.query(Chapter.ChapterId, Chapter.TranslatedLang, Chapter.SortKey).filter(
+        Chapter.MangaId == manga_id,
+        Chapter.TranslatedLang.in_(READER_LANGS),
+        Chapter.IsUnavailable == False
+    ).all()
+    return ChapterNav(rows)
+
+
+def _build_and_cache(key):
+    with _lock:
+        build = _building.setdefault(key, _Build())
+        build.builders += 1
+        generation = build.generation
+    try:
+        stamp = _stamp(key)
+        nav = build_nav(key)
+    finally:
+        with _lock:
+            build.builders -= 1
+            if not build.builders:
+                _building.pop(key, None)
+    with _lock:
+        # chapter được sync trong lúc build thì không cache bản vừa đọc
+        if build.generation == generation and len(nav):
+            _cache[key] = _Entry(nav, stamp)
+            _cache.move_to_end(key)
+            while len(_cache) > NAV_CACHE_SIZE:
+                _cache.popitem(last=False)
+    return nav
+
+
+def get_nav(manga_id, chapter_id=None):
+    """
+    ChapterNav của manga (cần app context): lấy từ LRU, chưa có thì một câu SELECT rồi cache lại.
+    Entry cũ hơn NAV_TTL được so lại _stamp với DB; `chapter_id` có trong DB mà chưa có trong nav
+    (vừa được process khác ghi) thì build lại ngay.
+    """
+    key = str(manga_id).lower()
+    with _lock:
+        entry = _cache.get(key)
+        if entry is not None:
+            _cache.move_to_end(key)
+    if entry is None:
+        return _build_and_cache(key)
+
+    if time.monotonic() - entry.checked_at >= NAV_TTL:
+        if _stamp(key) != entry.stamp:
+            invalidate(key)
+            return _build_and_cache(key)
+        entry.checked_at = time.monotonic()
+
+    if chapter_id is not None and str(chapter_id).lower() not in entry.nav.chapters \
+            and _chapter_readable(key, chapter_id):
+        invalidate(key)
+        return _build_and_cache(key)
+    return entry.nav
+
+
+def invalidate(manga_id):
+    key = str(manga_id).lower()
+    with _lock:
+        _cache.pop(key, None)
+        build = _building.get(key)
+        if build is not None:
+            build.generation += 1
+
+
+@chapters_synced.connect
+@manga_upserted.connect
+def _on_chapters_changed(sender, manga_id=None, **extra):
+    if manga_id:
+        invalidate(manga_id)
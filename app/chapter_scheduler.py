@@ -0,0 +1,218 @@
+# app/chapter_scheduler.py
+# Worker nền làm mới chapter theo độ ưu tiên, để route của người đọc chỉ đọc DB local.
+# Mỗi vòng chọn tối đa BATCH_SIZE manga theo thứ tự:
+#   1. manga người đọc vừa mở mà DB chưa có chapter (request_sync ghi Manga.SyncRequestedAt)
+#   2. manga được đọc gần đây (ReadingHistory.ReadAt)
+#   3. manga nhiều follow nhất (MangaStatistics.Follows)
+#   4. manga lâu chưa sync nhất (Manga.LastSyncedAt, NULL trước), tối đa STALE_PER_TICK mỗi vòng
+# mỗi nhóm chỉ lấy manga có LastSyncedAt cũ hơn REFRESH_AFTER của nhóm đó. Sync xong ghi
+# Manga.LastSyncedAt và xoá SyncRequestedAt (data/alter-manga-last-synced.sql,
+# data/alter-manga-sync-requested.sql). Giữa hai vòng nghỉ BATCH_PAUSE giây để worker không
+# chiếm hết bucket của MangaDexClient; người đọc còn có làn ưu tiên riêng trong RateLimiter.
+#
+# Mỗi process có RateLimiter riêng nên chỉ được chạy MỘT worker: hoặc bật
+# CHAPTER_SCHEDULER_ENABLED=1 cho đúng một process web, hoặc chạy riêng:
+#   python -m app.chapter_scheduler
+import argparse
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, or_, update
+
+from . import db
+from .chapter_sync import sync_manga_chapters
+from .models import Manga, MangaStatistics, ReadingHistory
+
+TICK_INTERVAL = 30          # giây nghỉ khi không còn manga đến hạn
+BATCH_SIZE = 10             # manga mỗi vòng
+STALE_PER_TICK = 2          # manga nhóm "lâu chưa sync" mỗi vòng, để lượt quét cả catalog đi chậm
+BATCH_PAUSE = 5             # giây nghỉ giữa hai vòng còn việc (request_sync vẫn đánh thức ngay)
+RECENT_READ_WINDOW = timedelta(days=3)
+REFRESH_AFTER = {
+    "requested": timedelta(0),
+    "recently_read": timedelta(hours=1),
+    "most_followed": timedelta(hours=6),
+    "stale": timedelta(days=1),
+}
+# manga sync lỗi thì để yên một lúc, tránh vòng nào cũng gọi lại đúng manga đó
+FAILURE_BACKOFF = timedelta(minutes=30)
+
+
+def _due(age, now):
+    cutoff = now - age
+    return or_(Manga.LastSyncedAt.is_(None), Manga.LastSyncedAt < cutoff)
+
+
+class ChapterScheduler:
+    def __init__(self, batch_size=BATCH_SIZE, tick_interval=TICK_INTERVAL,
+                 stale_per_tick=STALE_PER_TICK, batch_pause=BATCH_PAUSE):
+        self.batch_size = batch_size
+        self.tick_interval = tick_interval
+        self.stale_per_tick = stale_per_tick
+        self.batch_pause = batch_pause
+        self._lock = threading.Lock()
+        self._backoff = {}          # manga_id -> không thử lại trước thời điểm này
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def request(self, manga_id):
+        """
+        Đưa manga lên đầu hàng đợi (cần app context, không đụng tới mạng): ghi Manga.SyncRequestedAt
+        để worker ở bất kỳ process nào cũng thấy. Trả về True nếu đã ghi được.
+        """
+        try:
+            db.session.execute(update(Manga)
+                               .where(Manga.MangaId == str(manga_id), Manga.SyncRequestedAt.is_(None))
+                               .values(SyncRequestedAt=datetime.utcnow()))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"[ChapterScheduler] Error requesting sync for {manga_id}: {e}")
+            return False
+        self._wake.set()
+        return True
+
+    def pick(self, limit=None):
+        """Danh sách manga_id (chữ thường) cần sync ở vòng này, theo thứ tự ưu tiên."""
+        limit = limit or self.batch_size
+        now = datetime.utcnow()
+        picked = []
+
+        def add(manga_ids, cap=limit):
+            for manga_id in manga_ids:
+                key = str(manga_id).lower()
+                if len(picked) >= cap:
+                    return
+                if key in picked or self._backoff.get(key, now) > now:
+                    continue
+                picked.append(key)
+
+        add(manga_id for manga_id, in db.session.query(Manga.MangaId)
+            .filter(Manga.SyncRequestedAt.isnot(None))
+            .order_by(Manga.SyncRequestedAt.asc())
+            .limit(limit * 2))
+
+        if len(picked) < limit:
+            last_read = func.max(ReadingHistory.ReadAt)
+            add(manga_id for manga_id, _ in db.session.query(ReadingHistory.MangaId, last_read)
+                .join(Manga, Manga.MangaId == ReadingHistory.MangaId)
+                .filter(ReadingHistory.ReadAt >= now - RECENT_READ_WINDOW,
+                        _due(REFRESH_AFTER["recently_read"], now))
+                .group_by(ReadingHistory.MangaId)
+                .order_by(last_read.desc())
+                .limit(limit * 2))
+
+        if len(picked) < limit:
+            follows = func.max(MangaStatistics.Follows)
+            add(manga_id for manga_id, _ in db.session.query(MangaStatistics.MangaId, follows)
+                .join(Manga, Manga.MangaId == MangaStatistics.MangaId)
+                .filter(_due(REFRESH_AFTER["most_followed"], now))
+                .group_by(MangaStatistics.MangaId)
+                .order_by(follows.desc())
+                .limit(limit * 2))
+
+        stale_cap = min(limit, len(picked) + self.stale_per_tick)
+        if len(picked) < stale_cap:
+            # SQL Server xếp NULL trước khi ASC: manga chưa sync lần nào lên đầu
+            add((manga_id for manga_id, in db.session.query(Manga.MangaId)
+                 .filter(_due(REFRESH_AFTER["stale"], now))
+                 .order_by(Manga.LastSyncedAt.asc())
+                 .limit(self.stale_per_tick * 2)), cap=stale_cap)
+
+        for key in [key for key, until in self._backoff.items() if until <= now]:
+            del self._backoff[key]
+        return picked
+
+    def _mark_synced(self, manga_id):
+        db.session.execute(update(Manga).where(Manga.MangaId == manga_id)
+                           .values(LastSyncedAt=datetime.utcnow(), SyncRequestedAt=None))
+        db.session.commit()
+
+    def run_once(self):
+        """Một vòng: sync các manga đến hạn (cần app context). Trả về số manga đã sync xong."""
+        synced = 0
+        for manga_id in self.pick():
+            if self._stop.is_set():
+                break
+            try:
+                inserted, updated = sync_manga_chapters(manga_id)
+                self._mark_synced(manga_id)
+                synced += 1
+                if inserted or updated:
+                    print(f"[ChapterScheduler] {manga_id}: +{inserted} chapter mới, {updated} chapter cập nhật")
+            except Exception as e:
+                db.session.rollback()
+                self._backoff[manga_id] = datetime.utcnow() + FAILURE_BACKOFF
+                print(f"[ChapterScheduler] Error syncing chapters for {manga_id}: {e}")
+        return synced
+
+    def run_forever(self, app):
+        while not self._stop.is_set():
+            synced = 0
+            try:
+                with app.app_context():
+                    synced = self.run_once()
+            except Exception as e:
+                print(f"[ChapterScheduler] Error picking mangas: {e}")
+            # còn việc thì nghỉ BATCH_PAUSE rồi chạy vòng tiếp, hết việc thì chờ tới tick sau;
+            # request_sync trong process này đánh thức sớm
+            self._wake.wait(self.batch_pause if synced else self.tick_interval)
+            self._wake.clear()
+
+    def start(self, app):
+        """Chạy worker trên thread nền (một lần cho mỗi process)."""
+        with self._lock:
+            if self.running:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run_forever, args=(app,),
+                                            name="chapter-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+
+chapter_scheduler = ChapterScheduler()
+
+
+def request_sync(manga_id):
+    """Reader route gọi khi DB chưa có chapter: chỉ ghi yêu cầu vào DB, việc gọi MangaDex để worker làm."""
+    return chapter_scheduler.request(manga_id)
+
+
+if __name__ == "__main__":
+    from app import create_app
+    from config import Config
+
+    parser = argparse.ArgumentParser(description="Worker làm mới chapter từ MangaDex theo độ ưu tiên")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Số manga mỗi vòng")
+    parser.add_argument("--interval", type=int, default=TICK_INTERVAL, help="Số giây nghỉ khi không có manga đến hạn")
+    parser.add_argument("--stale-per-tick", type=int, default=STALE_PER_TICK,
+                        help="Số manga nhóm lâu chưa sync mỗi vòng")
+    parser.add_argument("--pause", type=float, default=BATCH_PAUSE, help="Số giây nghỉ giữa hai vòng còn việc")
+    parser.add_argument("--once", action="store_true", help="Chỉ chạy một vòng rồi thoát")
+    args = parser.parse_args()
+
+    # process này chính là worker: None để create_app() không khởi động thêm scheduler, cũng không cảnh báo
+    Config.CHAPTER_SCHEDULER_ENABLED = None
+    app = create_app()
+    scheduler = ChapterScheduler(batch_size=args.batch_size, tick_interval=args.interval,
+                                 stale_per_tick=args.stale_per_tick, batch_pause=args.pause)
+    if args.once:
+        with app.app_context():
+            scheduler.run_once()
+    else:
+        scheduler.start(app)
+        try:
+            while scheduler.running:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            scheduler.stop()
@@ -0,0 +1,118 @@
+# app/chapter_sync.py
+# Đồng bộ chapter của một manga từ /manga/{id}/feed: đi hết feed (500 chapter mỗi trang,
+# từ updatedAt mới nhất đang có trong DB nếu đã sync trước đó), mỗi trang một câu IN để biết
+# ChapterId nào đã có, rồi insert hàng loạt chapter mới và update hàng loạt chapter đã đổi.
+# Chạy trong job nền (chỉ cần app context, xem app/chapter_scheduler.py), không phải trong request của người đọc.
+from sqlalchemy import func, insert, update
+
+from . import db
+from .mangadex_api import CONTENT_RATINGS, chapter_row
+from .mangadex_client import get_client
+from .models import Chapter, Manga
+from .signals import chapters_synced
+
+FEED_LIMIT = 500
+FEED_LANGS = ["en", "vi"]
+# /manga/{id}/feed giới hạn offset + limit <= 10000; quá ngưỡng thì đi tiếp bằng updatedAtSince
+FEED_MAX_OFFSET = 10000
+FEED_TIMEOUT = (5, 30)
+SINCE_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+# các cột so sánh để biết chapter đã đổi
+CHAPTER_FIELDS = ("Type", "Volume", "ChapterNumber", "Title", "TranslatedLang", "Pages", "PublishAt",
+                  "ReadableAt", "IsUnavailable", "CreatedAt", "UpdatedAt", "SortKey")
+
+
+def _naive(value):
+    # DB lưu DateTime không timezone (giờ UTC của MangaDex)
+    return value.replace(tzinfo=None) if getattr(value, "tzinfo", None) else value
+
+
+def _row(chap, manga_id, reset_on_new_volume=False):
+    row = chapter_row(chap, manga_id, reset_on_new_volume)
+    row["ChapterId"] = row["ChapterId"].lower()
+    row["MangaId"] = str(manga_id).lower()
+    for key in ("PublishAt", "ReadableAt", "CreatedAt", "UpdatedAt"):
+        row[key] = _naive(row[key])
+    return row
+
+
+def iter_feed(manga_id, since=None, langs=FEED_LANGS, limit=FEED_LIMIT):
+    """Các trang của /manga/{id}/feed theo updatedAt tăng dần, bắt đầu từ `since` nếu có."""
+    client = get_client()
+    offset = 0
+    while True:
+        params = {
+            "translatedLanguage[]": langs,
+            "contentRating[]": CONTENT_RATINGS,
+            "order[updatedAt]": "asc",
+            "limit": limit,
+            "offset": offset,
+        }
+        if since:
+            params["updatedAtSince"] = since
+        page = client.api_get(f"/manga/{str(manga_id).lower()}/feed", params=params, timeout=FEED_TIMEOUT)
+        chapters = page.get("data", [])
+        if chapters:
+            yield chapters
+        if len(chapters) < limit:
+            return
+        offset += limit
+        if offset + limit > FEED_MAX_OFFSET:
+            # chạm trần offset: đi tiếp từ updatedAt của chapter cuối (trùng lặp được upsert bỏ qua)
+            since = _naive(chapter_row(chapters[-1], manga_id)["UpdatedAt"]).strftime(SINCE_FORMAT)
+            offset = 0
+
+
+def _apply_page(manga_id, chapters, reset_on_new_volume=False):
+    """Ghi một trang feed: một truy vấn IN lấy chapter đã có, insert / update hàng loạt."""
+    rows = {}
+    for chap in chapters:
+        if chap.get("id"):
+            row = _row(chap, manga_id, reset_on_new_volume)
+            rows[row["ChapterId"]] = row
+    if not rows:
+        return 0, 0
+    existing = {
+        str(chapter.ChapterId).lower(): chapter
+        for chapter in db.session.query(Chapter).filter(Chapter.ChapterId.in_(list(rows)))
+    }
+    new_rows = [row for key, row in rows.items() if key not in existing]
+    changed_rows = [
+        row for key, row in rows.items()
+        if key in existing and any(getattr(existing[key], field) != row[field] for field in CHAPTER_FIELDS)
+    ]
+    if new_rows:
+        db.session.execute(insert(Chapter), new_rows)
+    if changed_rows:
+        db.session.execute(update(Chapter), changed_rows)
+    return len(new_rows), len(changed_rows)
+
+
+def sync_manga_chapters(manga_id, full=False):
+    """
+    Đồng bộ chapter của một manga (cần app context). Mặc định chỉ lấy phần feed có updatedAt
+    từ mốc mới nhất trong DB; full=True đi lại toàn bộ feed. Commit sau mỗi trang.
+    Trả về (số chapter thêm mới, số chapter cập nhật).
+    """
+    manga_key = str(manga_id).lower()
+    since = None
+    if not full:
+        latest = db.session.query(func.max(Chapter.UpdatedAt)).filter(Chapter.MangaId == manga_key).scalar()
+        since = latest.strftime(SINCE_FORMAT) if latest else None
+    reset = bool(db.session.query(Manga.ChapterNumbersResetOnNewVolume).filter(Manga.MangaId == manga_key).scalar())
+    inserted = updated = 0
+    try:
+        for chapters in iter_feed(manga_key, since=since):
+            added, changed = _apply_page(manga_key, chapters, reset)
+            db.session.commit()
+            inserted += added
+            updated += changed
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        if inserted or updated:
+            chapters_synced.send(None, manga_id=manga_key)
+    return inserted, updated
+
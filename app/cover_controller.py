@@ -0,0 +1,252 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import threading
+import time
+import uuid
+
+from flask import current_app, make_response, request, url_for
+from sqlalchemy import func
+from sqlalchemy.orm import load_only
+
+from . import db
+from .cover_store import read_cover, store_cover
+from .mangadex_client import get_client
+from .models import Cover, MangaCover
+
+COVER_API_TIMEOUT = 6
+COVER_DOWNLOAD_TIMEOUT = 10
+# Cover của một CoverId không bao giờ đổi nội dung -> cho browser cache lâu
+COVER_MAX_AGE = 7 * 24 * 3600
+
+# Hàng đợi tải cover nền: tối đa bao nhiêu worker / job đang chờ,
+# và bao lâu mới thử lại manga mà lần trước tải thất bại
+PREFETCH_WORKERS = 4
+PREFETCH_MAX_PENDING = 500
+PREFETCH_RETRY_AFTER = 600
+
+_prefetch_lock = threading.Lock()
+_prefetch_executor = None
+_prefetch_pending = set()
+_prefetch_failed = {}
+
+
+def default_cover_url():
+    return url_for('static', filename='assets/default_cover.png')
+
+
+def manga_cover_url(manga_id, cover_id=None, size='small'):
+    """
+    URL của endpoint phục vụ ảnh bìa (thay cho data:image/...;base64 nhúng inline).
+    size: 'small' cho card listing, 'medium' cho trang chi tiết, 'original' cho ảnh gốc.
+    """
+    if cover_id:
+        return url_for('manga.manga_cover', manga_id=manga_id, cover_id=cover_id, size=size)
+    return url_for('manga.manga_cover', manga_id=manga_id, size=size)
+
+
+def guess_image_mimetype(data):
+    if data[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'image/png'
+    if data[:4] == b'GIF8':
+        return 'image/gif'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'image/jpeg'
+
+
+def get_cover_info(manga_id):
+    """Lấy thông tin cover từ API Mangadex, bao gồm cover_id."""
+    params = {"manga[]": manga_id, "limit": 1}
+    try:
+        data = get_client().api_get("/cover", params=params, timeout=COVER_API_TIMEOUT)
+        if data.get("data"):
+            cover = data["data"][0]
+            file_name = cover["attributes"]["fileName"]
+            cover_id = cover["id"]
+            return {"manga_id": manga_id, "cover_id": cover_id, "file_name": file_name}
+    except Exception as e:
+        print(f"Error fetching cover info for {manga_id}: {e}")
+    return None
+
+
+def fetch_and_store_manga_cover(manga_id):
+    """
+    Tải cover mới nhất của manga từ MangaDex và lưu vào MangaCover.
+    Trả về MangaCover vừa lưu, hoặc None nếu không tải được.
+    """
+    cover_info = get_cover_info(str(manga_id).lower())
+    if not cover_info:
+        return None
+
+    client = get_client()
+    image_url = client.cover_url(cover_info['manga_id'], cover_info['file_name'])
+    try:
+        response = client.download(image_url, timeout=COVER_DOWNLOAD_TIMEOUT)
+        response.raise_for_status()
+        new_cover = MangaCover(
+            MangaId=manga_id,
+            CoverId=uuid.UUID(cover_info['cover_id']),
+            FileName=cover_info['file_name'],
+            ContentHash=store_cover(response.content),
+            DownloadDate=datetime.utcnow()
+        )
+        db.session.add(new_cover)
+        db.session.commit()
+        return new_cover
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error downloading cover for {manga_id}: {e}")
+        return None
+
+
+def get_latest_cover_ids(manga_ids=None):
+    """
+    CoverId mới nhất của từng manga trong một query duy nhất
+    (ROW_NUMBER() OVER (PARTITION BY MangaId ORDER BY DownloadDate DESC)).
+    manga_ids=None lấy cho toàn bộ bảng (dùng khi build feed index).
+    Key của dict là str(MangaId).lower().
+    """
+    ranked = db.session.query(
+        MangaCover.MangaId,
+        MangaCover.CoverId,
+        func.row_number().over(
+            partition_by=MangaCover.MangaId,
+            order_by=MangaCover.DownloadDate.desc()
+        ).label('rn')
+    )
+    if manga_ids is not None:
+        keys = {str(mid).lower() for mid in manga_ids if mid}
+        if not keys:
+            return {}
+        ranked = ranked.filter(MangaCover.MangaId.in_(keys))
+    ranked = ranked.subquery()
+
+    rows = db.session.query(ranked.c.MangaId, ranked.c.CoverId).filter(ranked.c.rn == 1).all()
+    return {str(row.MangaId).lower(): row.CoverId for row in rows}
+
+
+def get_cover_urls(manga_ids):
+    """
+    Bản batch của get_cover_url cho các trang listing: {manga_id: cover_url}
+    với manga_id giữ nguyên như caller truyền vào.
+    Manga chưa có cover trả default cover ngay và được đưa vào hàng đợi tải nền.
+    """
+    manga_ids = [mid for mid in manga_ids if mid]
+    cover_ids = get_latest_cover_ids(manga_ids)
+
+    urls = {}
+    for mid in manga_ids:
+        cover_id = cover_ids.get(str(mid).lower())
+        if cover_id:
+            urls[mid] = manga_cover_url(mid, cover_id)
+        else:
+            enqueue_cover_fetch(mid)
+            urls[mid] = default_cover_url()
+    return urls
+
+
+def get_cover_url(manga_id):
+    """Trả về URL ảnh bìa cho <img src>; nếu DB chưa có thì trả default và tải nền."""
+    return get_cover_urls([manga_id])[manga_id]
+
+
+# ======================
+# Background prefetch
+# ======================
+
+def _get_prefetch_executor():
+    global _prefetch_executor
+    if _prefetch_executor is None:
+        _prefetch_executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="cover-prefetch")
+    return _prefetch_executor
+
+
+def enqueue_cover_fetch(manga_id):
+    """
+    Đưa manga vào hàng đợi tải cover nền. Không block request:
+    bỏ qua nếu manga đang chờ, hàng đợi đầy, hoặc vừa tải thất bại gần đây.
+    """
+    key = str(manga_id).lower()
+    with _prefetch_lock:
+        if key in _prefetch_pending or len(_prefetch_pending) >= PREFETCH_MAX_PENDING:
+            return False
+        failed_at = _prefetch_failed.get(key)
+        if failed_at and time.monotonic() - failed_at < PREFETCH_RETRY_AFTER:
+            return False
+        _prefetch_pending.add(key)
+        executor = _get_prefetch_executor()
+
+    app = current_app._get_current_object()
+    executor.submit(_prefetch_cover, app, manga_id, key)
+    return True
+
+
+def _prefetch_cover(app, manga_id, key):
+    ok = False
+    try:
+        with app.app_context():
+            # request khác có thể đã lưu cover trong lúc job nằm trong hàng đợi
+            exists = db.session.query(MangaCover.CoverId).filter(MangaCover.MangaId == manga_id).first()
+            ok = exists is not None or fetch_and_store_manga_cover(manga_id) is not None
+    except Exception as e:
+        print(f"[cover_prefetch] Error prefetching cover for {manga_id}: {e}")
+    finally:
+        with _prefetch_lock:
+            _prefetch_pending.discard(key)
+            if ok:
+                _prefetch_failed.pop(key, None)
+            else:
+                _prefetch_failed[key] = time.monotonic()
+
+
+def get_art_covers(manga_id):
+    """Metadata các cover của manga cho trang art gallery, không đụng tới cột blob."""
+    return Cover.query.options(load_only(
+        Cover.cover_id, Cover.manga_id, Cover.volume, Cover.locale,
+        Cover.fileName, Cover.version, Cover.updatedAt, Cover.content_hash
+    )).filter_by(manga_id=manga_id).all()
+
+
+def load_cover_bytes(digest, size, load_blob, save_digest):
+    """
+    Đọc variant `size` của ảnh từ cover_store. Cover cũ chưa có trong kho
+    (chỉ có blob trong DB) được chuyển sang kho ở lần phục vụ đầu tiên:
+    load_blob() trả blob, save_digest(digest) ghi lại hash vào DB.
+    """
+    data = read_cover(digest, size) if digest else None
+    if data is not None:
+        return data
+
+    blob = load_blob()
+    if not blob:
+        return None
+    digest = store_cover(blob)
+    try:
+        save_digest(digest)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"[cover_store] Error saving content hash {digest}: {e}")
+    return read_cover(digest, size) or blob
+
+
+def image_response(etag, last_modified, load_bytes, max_age=COVER_MAX_AGE):
+    """
+    Build response ảnh có ETag / Last-Modified / Cache-Control.
+    Conditional GET khớp ETag trả 304 ngay, không cần đọc blob từ DB.
+    """
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        data = load_bytes()
+        if data is None:
+            return None
+        response = make_response(data)
+        response.mimetype = guess_image_mimetype(data)
+
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    return response.make_conditional(request)
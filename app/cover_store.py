@@ -0,0 +1,109 @@
+"""
+Kho ảnh bìa trên đĩa, đánh địa chỉ theo nội dung (sha256).
+
+Mỗi ảnh được lưu một lần dưới <COVER_STORE_DIR>/<2 ký tự đầu hash>/<hash>.<variant>,
+kèm các bản thu nhỏ dựng sẵn để trang listing không phải kéo ảnh gốc ~400 KB
+qua ODBC chỉ để hiển thị thumbnail ~200px. DB chỉ giữ lại hash (ContentHash / content_hash).
+"""
+from io import BytesIO
+import hashlib
+import os
+
+from flask import current_app, has_app_context
+
+from config import Config
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow không bắt buộc: thiếu thì chỉ lưu bản gốc
+    Image = None
+
+# Chiều rộng tối đa (px) của từng bản thu nhỏ
+COVER_VARIANTS = {
+    "small": 256,
+    "medium": 512,
+}
+ORIGINAL = "original"
+THUMBNAIL_QUALITY = 85
+
+DEFAULT_STORE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "instance", "covers")
+
+
+def store_root():
+    if has_app_context():
+        return current_app.config.get("COVER_STORE_DIR") or os.path.join(current_app.instance_path, "covers")
+    # job ingestion / CLI không có app context: vẫn phải ghi vào cùng thư mục mà web server đọc
+    return Config.COVER_STORE_DIR or DEFAULT_STORE_DIR
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def variant_path(digest, variant=ORIGINAL, root=None):
+    root = root or store_root()
+    return os.path.join(root, digest[:2], f"{digest}.{variant}")
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _make_thumbnail(data, max_width):
+    img = Image.open(BytesIO(data))
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    if img.width > max_width:
+        img.thumbnail((max_width, max_width * 10))
+    out = BytesIO()
+    img.save(out, format="JPEG", quality=THUMBNAIL_QUALITY, optimize=True)
+    return out.getvalue()
+
+
+def store_cover(data, root=None):
+    """
+    Ghi ảnh vào kho và dựng sẵn các bản thu nhỏ. Trả về hash nội dung.
+    Ảnh đã có trong kho (cùng hash) thì không ghi lại.
+    """
+    digest = content_hash(data)
+    original = variant_path(digest, ORIGINAL, root)
+    if not os.path.exists(original):
+        _write_atomic(original, data)
+
+    if Image is not None:
+        for variant, max_width in COVER_VARIANTS.items():
+            path = variant_path(digest, variant, root)
+            if os.path.exists(path):
+                continue
+            try:
+                _write_atomic(path, _make_thumbnail(data, max_width))
+            except Exception as e:
+                print(f"[cover_store] Error building {variant} thumbnail for {digest}: {e}")
+    return digest
+
+
+def open_cover(digest, variant=ORIGINAL, root=None):
+    """
+    Đường dẫn file của variant yêu cầu; lùi về bản gốc nếu chưa có thumbnail.
+    Trả None nếu ảnh không có trong kho.
+    """
+    if not digest:
+        return None
+    if variant in COVER_VARIANTS:
+        path = variant_path(digest, variant, root)
+        if os.path.exists(path):
+            return path
+    path = variant_path(digest, ORIGINAL, root)
+    return path if os.path.exists(path) else None
+
+
+def read_cover(digest, variant=ORIGINAL, root=None):
+    path = open_cover(digest, variant, root)
+    if not path:
+        return None
+    with open(path, "rb") as f:
+        return f.read()
@@ -0,0 +1,121 @@
+# app/creator_index.py
+# Index creator -> manga trong bộ nhớ, dựng từ CreatorRelationship (RelatedType = 'manga').
+# Tên creator được chuẩn hoá và tra prefix theo từng đầu từ ("oda" khớp "Eiichiro Oda"),
+# nên lọc theo tác giả/hoạ sĩ chỉ là một lần bisect thay vì ILIKE trên cả bảng Creator.
+from bisect import bisect_left, insort
+
+from . import db
+from .memory_index import InMemoryIndex
+from .models import Creator, CreatorRelationship
+from .search_index import words
+from .signals import manga_upserted
+from .suggest_index import suggest_keys
+
+
+class CreatorIndex(InMemoryIndex):
+    def __init__(self):
+        super().__init__()
+        self._creators = {}        # creator key -> (CreatorId, Name)
+        self._mangas_of = {}       # creator key -> {manga key: MangaId}
+        self._creators_of = {}     # manga key -> set(creator key), để gỡ khi cập nhật
+        self._names = []           # [(khoá tên chuẩn hoá, creator key)] đã sort
+        self._indexed_names = {}   # creator key -> tên đã index
+
+    # ---------- build / refresh ----------
+
+    def _load(self, manga_ids=None):
+        query = db.session.query(CreatorRelationship.RelatedId, Creator.CreatorId, Creator.Name)\
+            .join(Creator, Creator.CreatorId == CreatorRelationship.CreatorId)\
+            .filter(CreatorRelationship.RelatedType == 'manga')
+        if manga_ids is not None:
+            query = query.filter(CreatorRelationship.RelatedId.in_(manga_ids))
+        return query.all()
+
+    def _index_name(self, creator_key, name):
+        # gọi khi đang giữ lock; tên đổi thì gỡ khoá cũ
+        old = self._indexed_names.get(creator_key)
+        if old == name:
+            return
+        if old is not None:
+            for pair in sorted((k, creator_key) for k in suggest_keys(old)):
+                i = bisect_left(self._names, pair)
+                if i < len(self._names) and self._names[i] == pair:
+                    del self._names[i]
+        for key in suggest_keys(name or ''):
+            insort(self._names, (key, creator_key))
+        self._indexed_names[creator_key] = name
+
+    def rebuild(self):
+        creators, mangas_of, creators_of, indexed_names = {}, {}, {}, {}
+        for manga_id, creator_id, name in self._load():
+            creator_key, manga_key = str(creator_id).lower(), str(manga_id).lower()
+            creators[creator_key] = (creator_id, name)
+            indexed_names[creator_key] = name
+            mangas_of.setdefault(creator_key, {})[manga_key] = manga_id
+            creators_of.setdefault(manga_key, set()).add(creator_key)
+        names = sorted((key, creator_key) for creator_key, name in indexed_names.items()
+                       for key in suggest_keys(name or ''))
+        with self._lock:
+            self._creators, self._mangas_of, self._creators_of = creators, mangas_of, creators_of
+            self._names, self._indexed_names = names, indexed_names
+            self._mark_built()
+
+    def refresh(self, dirty):
+        rows = self._load(list(dirty))
+        with self._lock:
+            for manga_key in dirty:
+                for creator_key in self._creators_of.pop(manga_key, ()):
+                    self._mangas_of.get(creator_key, {}).pop(manga_key, None)
+            for manga_id, creator_id, name in rows:
+                creator_key, manga_key = str(creator_id).lower(), str(manga_id).lower()
+                self._creators[creator_key] = (creator_id, name)
+                self._index_name(creator_key, name)
+                self._mangas_of.setdefault(creator_key, {})[manga_key] = manga_id
+                self._creators_of.setdefault(manga_key, set()).add(creator_key)
+
+    # ---------- truy vấn ----------
+
+    def _match(self, query):
+        """creator key có một từ trong tên bắt đầu bằng query."""
+        prefix = ' '.join(words(query))
+        if not prefix:
+            return set()
+        matched = set()
+        i = bisect_left(self._names, (prefix,))
+        while i < len(self._names) and self._names[i][0].startswith(prefix):
+            matched.add(self._names[i][1])
+            i += 1
+        return matched
+
+    def manga_ids_for_names(self, names):
+        """MangaId có ít nhất một creator khớp (prefix) với một trong các tên."""
+        self.ensure_fresh()
+        with self._lock:
+            result = {}
+            for name in names:
+                for creator_key in self._match(name):
+                    result.update(self._mangas_of.get(creator_key, {}))
+            return list(result.values())
+
+    def manga_ids_of_creator(self, creator_id):
+        self.ensure_fresh()
+        with self._lock:
+            return list(self._mangas_of.get(str(creator_id).lower(), {}).values())
+
+    def search(self, query, limit=5):
+        """[(CreatorId, Name)] khớp prefix, creator nhiều manga hơn xếp trước."""
+        self.ensure_fresh()
+        with self._lock:
+            matched = self._match(query)
+            ranked = sorted(matched, key=lambda key: (-len(self._mangas_of.get(key, ())),
+                                                      (self._creators[key][1] or '').casefold()))
+            return [self._creators[key] for key in ranked[:limit]]
+
+
+creator_index = CreatorIndex()
+
+
+@manga_upserted.connect
+def _on_manga_upserted(sender, manga_id=None, **extra):
+    if manga_id:
+        creator_index.mark_dirty(manga_id)
@@ -0,0 +1,150 @@
+# app/delta_sync.py
+# Đồng bộ tăng dần với MangaDex theo watermark updatedAt riêng cho từng loại dữ liệu
+# (manga, chapter, cover), lưu trong SyncState. Mỗi lần chạy chỉ hỏi những gì đã đổi sau
+# watermark và chỉ upsert các manga đã có trong DB (thêm manga mới là việc của catalog_crawler).
+#
+#   python -m app.delta_sync                  # cả ba loại
+#   python -m app.delta_sync --only chapter
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from app.mangadex_api import (CONTENT_RATINGS, INGEST_WORKERS, LANG_PRIORITY, chapter_row, chapter_sort_key,
+                              connect_db, cover_row, existing_ids, fetch_mangas_by_ids, ingest_mangas,
+                              iter_updated_since, load_sync_state, refresh_tag_dictionary, request_api,
+                              save_sync_state, since_param, upsert_chapter, upsert_covers)
+from app.signals import chapters_synced, manga_upserted
+
+logger = logging.getLogger(__name__)
+
+STATE_NAME = "delta_sync"
+ENTITIES = ("manga", "chapter", "cover")
+PAGE_LIMIT = 100
+SINCE_FORMAT = "%Y-%m-%dT%H:%M:%S"
+EPOCH = "2000-01-01T00:00:00"
+# /cover không lọc được theo updatedAtSince: duyệt updatedAt giảm dần, API giới hạn offset + limit <= 10000
+COVER_MAX_OFFSET = 10000
+
+
+def _initial_since(conn, table, column):
+    """Watermark lần chạy đầu: updatedAt mới nhất đang có trong DB."""
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT MAX([{column}]) FROM [dbo].[{table}]")
+    row = cursor.fetchone()
+    return row[0].strftime(SINCE_FORMAT) if row and row[0] else EPOCH
+
+
+def sync_manga(conn, mark, workers=INGEST_WORKERS):
+    """Manga đã đổi: upsert lại manga và các bảng con của nó, trừ chapter/cover (có watermark riêng)."""
+    options = dict(sync_chapters=False, sync_covers=False)
+    refresh_tag_dictionary(conn)
+    if mark.get("failed"):
+        mark["failed"] = ingest_mangas(fetch_mangas_by_ids(mark["failed"]), max_workers=workers, **options)
+        yield
+    params = {"contentRating[]": CONTENT_RATINGS, "includes[]": ["cover_art", "author", "artist"]}
+    updated = 0
+    for fresh, since, seen in iter_updated_since("/manga", params, mark["since"], mark.get("seen", []), PAGE_LIMIT):
+        known = existing_ids(conn, "Manga", "MangaId", [m["id"] for m in fresh])
+        changed = [m for m in fresh if str(m["id"]).upper() in known]
+        failed = ingest_mangas(changed, max_workers=workers, **options)
+        updated += len(changed) - len(failed)
+        mark.update(since=since, seen=seen, failed=sorted(set(mark.get("failed", [])) | set(failed)))
+        yield
+    logger.info(f"Delta manga: cập nhật {updated} manga, watermark {mark['since']}.")
+
+
+def sync_chapters(conn, mark, workers=INGEST_WORKERS):
+    """Chapter đã đổi (theo LANG_PRIORITY) của các manga có trong DB, một MERGE cho mỗi trang."""
+    params = {"translatedLanguage[]": LANG_PRIORITY, "contentRating[]": CONTENT_RATINGS}
+    updated = 0
+    for fresh, since, seen in iter_updated_since("/chapter", params, mark["since"], mark.get("seen", []), PAGE_LIMIT):
+        rows = [chapter_row(chap) for chap in fresh]
+        known = existing_ids(conn, "Manga", "MangaId", {row["MangaId"] for row in rows})
+        rows = [row for row in rows if row["MangaId"] in known]
+        # manga đánh số lại chapter mỗi volume: SortKey tính cả volume
+        resets = existing_ids(conn, "Manga", "MangaId", {row["MangaId"] for row in rows},
+                              where="[ChapterNumbersResetOnNewVolume] = 1")
+        for row in rows:
+            if row["MangaId"] in resets:
+                row["SortKey"] = chapter_sort_key(row["Volume"], row["ChapterNumber"], reset_on_new_volume=True)
+        upsert_chapter(conn, rows)
+        updated += len(rows)
+        mark.update(since=since, seen=seen)
+        for manga_id in {row["MangaId"] for row in rows}:
+            chapters_synced.send(None, manga_id=manga_id)
+        yield
+    logger.info(f"Delta chapter: cập nhật {updated} chương, watermark {mark['since']}.")
+
+
+def _changed_covers(since, seen):
+    """Các cover có updatedAt mới hơn watermark (duyệt từ mới nhất về, dừng ở watermark)."""
+    changed = []
+    offset = 0
+    while offset + PAGE_LIMIT <= COVER_MAX_OFFSET:
+        params = {"limit": PAGE_LIMIT, "offset": offset, "order[updatedAt]": "desc"}
+        page = request_api("/cover", params=params).get("data", [])
+        for cover in page:
+            updated_at = since_param(cover) or EPOCH
+            if updated_at < since or (updated_at == since and str(cover["id"]).upper() in seen):
+                return changed
+            changed.append(cover)
+        if len(page) < PAGE_LIMIT:
+            return changed
+        offset += PAGE_LIMIT
+    logger.warning(f"Delta cover: hơn {COVER_MAX_OFFSET} cover đổi kể từ {since}, phần cũ hơn bị bỏ qua.")
+    return changed
+
+
+def sync_covers(conn, mark, workers=INGEST_WORKERS):
+    """Cover đã đổi của các manga có trong DB: tải lại ảnh rồi upsert một lần."""
+    changed = _changed_covers(mark["since"], set(mark.get("seen", [])))
+    if changed:
+        newest = since_param(changed[0]) or mark["since"]
+        known = existing_ids(conn, "Manga", "MangaId",
+                             {rel["id"] for cover in changed for rel in cover.get("relationships", [])
+                              if rel.get("type") == "manga"})
+        changed_known = [cover for cover in changed
+                         if any(rel.get("type") == "manga" and str(rel["id"]).upper() in known
+                                for rel in cover.get("relationships", []))]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            rows = [row for row in pool.map(cover_row, changed_known) if row]
+        upsert_covers(conn, rows)
+        at_newest = {str(cover["id"]).upper() for cover in changed if since_param(cover) == newest}
+        seen = at_newest | set(mark.get("seen", [])) if newest == mark["since"] else at_newest
+        mark.update(since=newest, seen=sorted(seen))
+        for manga_id in {row["manga_id"] for row in rows}:
+            manga_upserted.send(None, manga_id=manga_id)
+        logger.info(f"Delta cover: cập nhật {len(rows)} cover, watermark {newest}.")
+    yield
+
+
+SYNCS = {
+    "manga": (sync_manga, "Manga", "UpdatedAt"),
+    "chapter": (sync_chapters, "Chapter", "UpdatedAt"),
+    "cover": (sync_covers, "Covers", "updatedAt"),
+}
+
+
+def delta_sync(entities=ENTITIES, workers=INGEST_WORKERS):
+    """Chạy delta sync cho các loại trong `entities`; watermark được lưu sau mỗi trang đã ghi xong."""
+    conn = connect_db()
+    try:
+        state = load_sync_state(conn, STATE_NAME)
+        for entity in entities:
+            sync, table, column = SYNCS[entity]
+            mark = state.setdefault(entity, {})
+            if "since" not in mark:
+                mark["since"] = _initial_since(conn, table, column)
+            for _ in sync(conn, mark, workers):
+                save_sync_state(conn, STATE_NAME, state)
+        return state
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Đồng bộ tăng dần manga / chapter / cover đã đổi trên MangaDex")
+    parser.add_argument("--only", choices=ENTITIES, action="append", help="Chỉ đồng bộ loại này (lặp lại được)")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS, help="Số manga / ảnh bìa xử lý song song")
+    args = parser.parse_args()
+    delta_sync(entities=args.only or ENTITIES, workers=args.workers)
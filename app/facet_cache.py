@@ -0,0 +1,75 @@
+# app/facet_cache.py
+# Cache các facet option của /advanced_search (tags, content rating, demographic, ngôn ngữ, status)
+# kèm số manga cho từng option. Tính một lần rồi giữ trong bộ nhớ theo TTL, thay vì chạy
+# 6 câu SELECT DISTINCT (trong đó có DISTINCT trên cả bảng Chapter) ở mỗi request.
+import threading
+import time
+
+from sqlalchemy import distinct, func
+
+from . import db
+from .models import Chapter, Manga, MangaTag, Tag
+from .signals import chapters_synced, manga_upserted, tags_updated
+
+FACET_TTL = 10 * 60
+# Ingestion ghi liên tục thì nhiều lần invalidate được gộp lại: tính lại sớm nhất sau ngần này giây
+FACET_INVALIDATE_DELAY = 60
+
+_lock = threading.Lock()
+_options = None
+_expires_at = 0.0
+
+
+def _value_counts(column, count_column):
+    rows = db.session.query(column, func.count(distinct(count_column)))\
+        .filter(column.isnot(None))\
+        .group_by(column)\
+        .order_by(column)\
+        .all()
+    return [(value, count) for value, count in rows if value]
+
+
+def compute_options():
+    """
+    Facet option kèm số manga. Phần tử đầu của mỗi tuple giữ nguyên như load_options() cũ
+    (tags: (TagId, GroupName, NameEn), còn lại: (value,)), số manga nằm ở cuối tuple.
+    """
+    tag_rows = db.session.query(Tag.TagId, Tag.GroupName, Tag.NameEn, func.count(MangaTag.MangaId))\
+        .outerjoin(MangaTag, MangaTag.TagId == Tag.TagId)\
+        .group_by(Tag.TagId, Tag.GroupName, Tag.NameEn)\
+        .order_by(Tag.GroupName, Tag.NameEn)\
+        .all()
+    return {
+        'tags': [(tag_id, group_name, name_en, count) for tag_id, group_name, name_en, count in tag_rows],
+        'ratings': _value_counts(Manga.ContentRating, Manga.MangaId),
+        'demographics': _value_counts(Manga.PublicationDemographic, Manga.MangaId),
+        'original_langs': _value_counts(Manga.OriginalLanguage, Manga.MangaId),
+        'translated_langs': _value_counts(Chapter.TranslatedLang, Chapter.MangaId),
+        'statuses': _value_counts(Manga.Status, Manga.MangaId),
+    }
+
+
+def get_options():
+    global _options, _expires_at
+    now = time.monotonic()
+    if _options is not None and now < _expires_at:
+        return _options
+    with _lock:
+        # request khác có thể vừa tính xong trong lúc chờ lock
+        if _options is None or time.monotonic() >= _expires_at:
+            _options = compute_options()
+            _expires_at = time.monotonic() + FACET_TTL
+        return _options
+
+
+def invalidate():
+    global _expires_at
+    with _lock:
+        _expires_at = min(_expires_at, time.monotonic() + FACET_INVALIDATE_DELAY)
+
+
+@manga_upserted.connect
+@chapters_synced.connect
+@tags_updated.connect
+def _on_catalog_changed(sender, **extra):
+    invalidate()
@@ -0,0 +1,334 @@
+# app/facet_index.py
+# Engine lọc facet trong bộ nhớ cho /advanced_search.
+# Mỗi manga được gán một số thứ tự (doc); mỗi giá trị facet (tag, content rating, demographic,
+# status, ngôn ngữ gốc, ngôn ngữ dịch, năm) giữ một bitmap là một int Python (bit doc = 1 nếu khớp).
+# Include/exclude tag và tổ hợp facet thành các phép &, |, & ~ trên int, chạy trong micro giây;
+# SQL chỉ còn dùng để hydrate đúng trang kết quả cuối cùng.
+from bisect import bisect_left, bisect_right, insort
+from collections import namedtuple
+
+from . import db
+from .memory_index import InMemoryIndex
+from .models import Chapter, Manga, MangaStatistics, MangaTag
+from .signals import chapters_synced, manga_upserted
+
+# Cột facet -> thuộc tính của FacetDoc (tag và ngôn ngữ dịch là đa trị)
+FACETS = ('tag', 'content_rating', 'demographic', 'status', 'original_lang', 'translated_lang', 'year')
+
+FacetDoc = namedtuple('FacetDoc', 'manga_id title content_rating demographic status original_lang year '
+                                  'follows rating tags translated_langs')
+
+
+def _title_key(doc):
+    return (doc.title or '').casefold()
+
+
+# Thứ tự sort của advanced_search: (sort key, giảm dần); NULL xếp như SQL Server (coalesce cũ)
+SORTS = {
+    'Title ASC': (_title_key, False),
+    'Title DESC': (_title_key, True),
+    'Year ASC': (lambda d: d.year or 0, False),
+    'Year DESC': (lambda d: d.year or 0, True),
+    'Rating DESC': (lambda d: d.rating if d.rating is not None else -1, True),
+    'Follows DESC': (lambda d: d.follows if d.follows is not None else -1, True),
+}
+
+
+# kết quả ít hơn ngần này thì sort thẳng các doc khớp; nhiều hơn thì đi dọc orders[sort] từ con trỏ
+SPARSE_HITS = 2000
+
+
+def iter_bits(bits):
+    """Các doc có bit = 1, tăng dần."""
+    text = bin(bits)[:1:-1]
+    i = text.find('1')
+    while i != -1:
+        yield i
+        i = text.find('1', i + 1)
+
+
+class FacetSnapshot:
+    """
+    Một phiên bản của index: doc, bitmap và thứ tự sort cùng một cách đánh số doc.
+    advanced_search chạy cả truy vấn (bitmap_for, filter, page) trên cùng một snapshot;
+    rebuild / refresh tạo snapshot mới rồi mới swap, không sửa snapshot đang được đọc.
+    """
+
+    def __init__(self, docs, doc_of, all_bits, bitmaps, orders):
+        self.docs = docs          # doc -> FacetDoc (None nếu manga đã bị xoá)
+        self.doc_of = doc_of      # manga key -> doc
+        self.all = all_bits
+        self.bitmaps = bitmaps    # facet -> {giá trị: bitmap}
+        self.orders = orders      # sort -> [(sort key, manga key)] tăng dần
+
+    def _any_of(self, facet, values):
+        bits = 0
+        for value in values:
+            bits |= self.bitmaps[facet].get(value, 0)
+        return bits
+
+    def bitmap_for(self, manga_ids):
+        """Bitmap của một tập MangaId bất kỳ (kết quả search index, creator, ...)."""
+        bits = 0
+        for mid in manga_ids:
+            n = self.doc_of.get(str(mid).lower())
+            if n is not None:
+                bits |= 1 << n
+        return bits
+
+    def filter(self, include_tags=(), exclude_tags=(), content_ratings=(), demographics=(), statuses=(),
+               original_langs=(), translated_langs=(), year_range=None, restrict=None):
+        """
+        Bitmap các manga khớp bộ lọc. Trong một facet là OR, giữa các facet là AND
+        (giống chuỗi filter SQL cũ). restrict: bitmap giới hạn thêm (vd. kết quả search text).
+        """
+        bits = self.all if restrict is None else self.all & restrict
+        if include_tags:
+            bits &= self._any_of('tag', [str(t).lower() for t in include_tags])
+        if exclude_tags:
+            bits &= ~self._any_of('tag', [str(t).lower() for t in exclude_tags])
+        for facet, values in (('content_rating', content_ratings), ('demographic', demographics),
+                              ('status', statuses), ('original_lang', original_langs),
+                              ('translated_lang', translated_langs)):
+            if values:
+                bits &= self._any_of(facet, values)
+        if year_range is not None:
+            low, high = year_range
+            bits &= self._any_of('year', [year for year in self.bitmaps['year'] if low <= year <= high])
+        return bits
+
+    def _cursor_doc(self, key):
+        n = self.doc_of.get(str(key).lower()) if key is not None else None
+        return n if n is not None and self.docs[n] is not None else None
+
+    def page(self, bits, sort_by, per_page, after=None, before=None, ranked_ids=None):
+        """
+        Trang kết quả của bitmap theo thứ tự sort_by, keyset theo (sort key, manga key) của item ở mép trang.
+        ranked_ids: thứ tự riêng (vd. độ liên quan từ search index) thay cho sort_by.
+        Trả về (MangaId của trang, manga key đầu, manga key cuối, còn trang trước, còn trang sau, tổng).
+        """
+        total = bits.bit_count()
+        after, before = self._cursor_doc(after), self._cursor_doc(before)
+        if ranked_ids is not None:
+            matched = set(iter_bits(bits))
+            hits = []
+            for mid in ranked_ids:
+                n = self.doc_of.get(str(mid).lower())
+                if n in matched:
+                    matched.discard(n)
+                    hits.append(n)
+            total = len(hits)
+            window, has_prev, has_next = _page_of_list(hits, per_page, after, before)
+        else:
+            sort = sort_by if sort_by in SORTS else None
+            if total <= SPARSE_HITS:
+                entry = lambda n: _sort_entry(sort, str(self.docs[n].manga_id).lower(), self.docs[n])
+                hits = sorted(iter_bits(bits), key=entry, reverse=_descending(sort))
+                window, has_prev, has_next = _page_of_list(hits, per_page, after, before)
+            else:
+                window, has_prev, has_next = self._walk_page(bits, sort, per_page, after, before)
+        ids = [self.docs[n].manga_id for n in window]
+        first_key = str(ids[0]).lower() if ids else None
+        last_key = str(ids[-1]).lower() if ids else None
+        return ids, first_key, last_key, has_prev, has_next, total
+
+    def _walk_page(self, bits, sort, per_page, after, before):
+        """
+        Trang của bitmap nhiều kết quả: đi dọc orders[sort] từ vị trí con trỏ (bisect theo sort entry),
+        thử bit từng doc, dừng khi đủ per_page + 1 doc khớp.
+        """
+        order, doc_of = self.orders[sort], self.doc_of
+        text = bin(bits)[:1:-1]   # text[n] == '1' nếu doc n khớp
+        descending = _descending(sort)
+
+        def entry_of(n):
+            key = str(self.docs[n].manga_id).lower()
+            return _sort_entry(sort, key, self.docs[n])
+
+        def walk(start, step, limit):
+            found = []
+            i = start
+            while 0 <= i < len(order) and len(found) < limit:
+                n = doc_of[order[i][-1]]
+                if n < len(text) and text[n] == '1':
+                    found.append(n)
+                i += step
+            return found
+
+        # hướng hiển thị: sort giảm dần thì đi ngược orders (tăng dần)
+        forward = -1 if descending else 1
+        if before is not None:
+            cursor = entry_of(before)
+            start = bisect_right(order, cursor) if descending else bisect_left(order, cursor) - 1
+            window = walk(start, -forward, per_page + 1)
+            has_prev = len(window) > per_page
+            window = window[:per_page][::-1]
+            has_next = bool(walk(start + forward, forward, 1))
+            return window, has_prev, has_next
+        if after is not None:
+            cursor = entry_of(after)
+            start = bisect_left(order, cursor) - 1 if descending else bisect_right(order, cursor)
+            has_prev = bool(walk(start - forward, -forward, 1))
+        else:
+            start = len(order) - 1 if descending else 0
+            has_prev = False
+        window = walk(start, forward, per_page + 1)
+        return window[:per_page], has_prev, len(window) > per_page
+
+
+def _page_of_list(hits, per_page, after, before):
+    """Trang trong một danh sách doc đã xếp đúng thứ tự hiển thị; con trỏ là doc ở mép trang."""
+    position = {n: i for i, n in enumerate(hits)}
+    start, end = 0, per_page
+    if before is not None and before in position:
+        end = position[before]
+        start = max(0, end - per_page)
+    elif after is not None and after in position:
+        start = position[after] + 1
+        end = start + per_page
+    return hits[start:end], start > 0, end < len(hits)
+
+def _sort_entry(sort, key, doc):
+    key_fn = SORTS[sort][0] if sort is not None else None
+    # MangaId (manga key) là cột phá hoà, cùng chiều với cột sort
+    return (key_fn(doc), key) if key_fn else (key,)
+
+
+def _descending(sort):
+    return sort is not None and SORTS[sort][1]
+
+
+def _move(order, old_entry, new_entry):
+    """Chuyển một doc từ old_entry sang new_entry trong `order` (None = không có), giữ order tăng dần."""
+    if old_entry is not None:
+        i = bisect_left(order, old_entry)
+        if i < len(order) and order[i] == old_entry:
+            del order[i]
+    if new_entry is not None:
+        insort(order, new_entry)
+
+class FacetIndex(InMemoryIndex):
+    def __init__(self):
+        super().__init__()
+        self._snapshot = FacetSnapshot([], {}, 0, {facet: {} for facet in FACETS},
+                                       {sort: [] for sort in (*SORTS, None)})
+
+    def snapshot(self):
+        """Snapshot hiện tại (đã cập nhật các manga dirty); dùng một snapshot cho cả một truy vấn."""
+        self.ensure_fresh()
+        return self._snapshot
+
+    # ---------- build / refresh ----------
+
+    def _load(self, manga_ids=None):
+        mangas = db.session.query(
+            Manga.MangaId, Manga.TitleEn, Manga.ContentRating, Manga.PublicationDemographic,
+            Manga.Status, Manga.OriginalLanguage, Manga.Year
+        )
+        stats = db.session.query(MangaStatistics.MangaId, MangaStatistics.Follows, MangaStatistics.AverageRating)\
+            .order_by(MangaStatistics.FetchedAt.asc())
+        tags = db.session.query(MangaTag.MangaId, MangaTag.TagId)
+        langs = db.session.query(Chapter.MangaId, Chapter.TranslatedLang)\
+            .filter(Chapter.TranslatedLang.isnot(None)).distinct()
+        if manga_ids is not None:
+            mangas = mangas.filter(Manga.MangaId.in_(manga_ids))
+            stats = stats.filter(MangaStatistics.MangaId.in_(manga_ids))
+            tags = tags.filter(MangaTag.MangaId.in_(manga_ids))
+            langs = langs.filter(Chapter.MangaId.in_(manga_ids))
+
+        # nhiều dòng MangaStatistics: dòng FetchedAt mới nhất ghi đè sau cùng
+        stat_of = {str(mid).lower(): (follows, rating) for mid, follows, rating in stats.all()}
+        tags_of, langs_of = {}, {}
+        for mid, tag_id in tags.all():
+            tags_of.setdefault(str(mid).lower(), set()).add(str(tag_id).lower())
+        for mid, lang in langs.all():
+            langs_of.setdefault(str(mid).lower(), set()).add(lang)
+
+        docs = {}
+        for row in mangas.all():
+            key = str(row.MangaId).lower()
+            follows, rating = stat_of.get(key, (None, None))
+            docs[key] = FacetDoc(row.MangaId, row.TitleEn, row.ContentRating, row.PublicationDemographic,
+                                 row.Status, row.OriginalLanguage, row.Year, follows, rating,
+                                 frozenset(tags_of.get(key, ())), frozenset(langs_of.get(key, ())))
+        return docs
+
+    @staticmethod
+    def _facet_values(doc):
+        yield from (('tag', tag_id) for tag_id in doc.tags)
+        yield from (('translated_lang', lang) for lang in doc.translated_langs)
+        for facet, value in (('content_rating', doc.content_rating), ('demographic', doc.demographic),
+                             ('status', doc.status), ('original_lang', doc.original_lang), ('year', doc.year)):
+            if value is not None:
+                yield facet, value
+
+    def rebuild(self):
+        # doc đánh số theo MangaId để thứ tự build ổn định, không phụ thuộc thứ tự dòng SQL trả về
+        loaded = self._load()
+        docs, doc_of, all_bits = [], {}, 0
+        bitmaps = {facet: {} for facet in FACETS}
+        for key in sorted(loaded):
+            doc = loaded[key]
+            n = len(docs)
+            docs.append(doc)
+            doc_of[key] = n
+            all_bits |= 1 << n
+            for facet, value in self._facet_values(doc):
+                bitmaps[facet][value] = bitmaps[facet].get(value, 0) | (1 << n)
+        orders = {sort: sorted(_sort_entry(sort, key, docs[n]) for key, n in doc_of.items())
+                  for sort in (*SORTS, None)}
+        with self._lock:
+            self._snapshot = FacetSnapshot(docs, doc_of, all_bits, bitmaps, orders)
+            self._mark_built()
+
+    def refresh(self, dirty):
+        loaded = self._load(list(dirty))
+        with self._lock:
+            old = self._snapshot
+            # copy-on-write: request đang đọc snapshot cũ không thấy trạng thái dở dang
+            docs, doc_of, all_bits = list(old.docs), dict(old.doc_of), old.all
+            bitmaps = {facet: dict(values) for facet, values in old.bitmaps.items()}
+            orders = {sort: list(order) for sort, order in old.orders.items()}
+            for key in dirty:
+                n = doc_of.get(key)
+                old_doc = docs[n] if n is not None else None
+                if old_doc is not None:
+                    # gỡ bit của dữ liệu cũ
+                    for facet, value in self._facet_values(old_doc):
+                        bitmap = bitmaps[facet].get(value, 0) & ~(1 << n)
+                        if bitmap:
+                            bitmaps[facet][value] = bitmap
+                        else:
+                            bitmaps[facet].pop(value, None)
+                doc = loaded.get(key)
+                if doc is None:
+                    if n is not None:
+                        all_bits &= ~(1 << n)
+                        docs[n] = None
+                        del doc_of[key]
+                        for sort in orders:
+                            _move(orders[sort], _sort_entry(sort, key, old_doc), None)
+                    continue
+                if n is None:
+                    n = len(docs)
+                    docs.append(doc)
+                    doc_of[key] = n
+                    all_bits |= 1 << n
+                else:
+                    docs[n] = doc
+                for facet, value in self._facet_values(doc):
+                    bitmaps[facet][value] = bitmaps[facet].get(value, 0) | (1 << n)
+                for sort in orders:
+                    old_entry = _sort_entry(sort, key, old_doc) if old_doc is not None else None
+                    _move(orders[sort], old_entry, _sort_entry(sort, key, doc))
+            self._snapshot = FacetSnapshot(docs, doc_of, all_bits, bitmaps, orders)
+
+
+facet_index = FacetIndex()
+
+
+@manga_upserted.connect
+@chapters_synced.connect
+def _on_manga_changed(sender, manga_id=None, **extra):
+    if manga_id:
+        facet_index.mark_dirty(manga_id)
@@ -0,0 +1,174 @@
+# app/feed_index.py
+# Index feed dựng sẵn trong bộ nhớ cho /home, /recently_added, /latest_updates, /updates.
+# Thay vì join Manga + MangaCover + MangaStatistics, sort và OFFSET mỗi request,
+# mỗi feed giữ một mảng sort key đã sắp xếp; đọc một trang chỉ là slice / bisect,
+# SQL chỉ còn dùng để hydrate đúng các manga trên trang.
+from bisect import bisect_left, bisect_right, insort
+from collections import namedtuple
+from datetime import datetime
+
+from dateutil.relativedelta import relativedelta
+
+from . import db
+from .cover_controller import get_latest_cover_ids
+from .memory_index import InMemoryIndex
+from .models import Manga, MangaStatistics
+from .signals import chapters_synced, manga_upserted
+
+# /home: manga hot cập nhật trong 4 tháng tính tới mốc cố định (giữ nguyên như route cũ)
+HOT_REFERENCE_DATE = datetime(2025, 9, 21, 2, 50)
+HOT_WINDOW = relativedelta(months=4)
+
+FeedEntry = namedtuple('FeedEntry', 'manga_id created_at updated_at follows average_rating cover_id hot')
+
+
+def _desc(value):
+    # sort key giảm dần, NULL xếp cuối giống ORDER BY ... DESC của SQL Server
+    if value is None:
+        return (1, 0)
+    if isinstance(value, datetime):
+        value = value.timestamp()
+    return (0, -value)
+
+
+FEEDS = {
+    'hot': lambda e: _desc(e.follows),
+    'recent': lambda e: _desc(e.created_at),
+    'latest': lambda e: _desc(e.updated_at),
+}
+
+
+def manga_key(manga_id):
+    return str(manga_id).lower()
+
+
+class FeedIndex(InMemoryIndex):
+    def __init__(self):
+        super().__init__()
+        self._entries = {}
+        self._keys = {feed: [] for feed in FEEDS}
+
+    # ---------- build / refresh ----------
+
+    def _load_entries(self, manga_ids=None):
+        cutoff = HOT_REFERENCE_DATE - HOT_WINDOW
+        query = db.session.query(
+            Manga.MangaId, Manga.CreatedAt, Manga.UpdatedAt,
+            Manga.TitleEn, Manga.ContentRating, Manga.PublicationDemographic, Manga.Status, Manga.Year,
+            MangaStatistics.Follows, MangaStatistics.AverageRating
+        ).outerjoin(MangaStatistics, Manga.MangaId == MangaStatistics.MangaId)\
+            .order_by(MangaStatistics.FetchedAt.asc())
+        if manga_ids is not None:
+            query = query.filter(Manga.MangaId.in_(manga_ids))
+
+        cover_ids = get_latest_cover_ids(manga_ids)
+
+        entries = {}
+        # nhiều dòng MangaStatistics cho một manga: dòng FetchedAt mới nhất ghi đè sau cùng
+        for row in query.all():
+            key = manga_key(row.MangaId)
+            hot = (
+                row.UpdatedAt is not None and row.UpdatedAt >= cutoff
+                and None not in (row.TitleEn, row.ContentRating, row.PublicationDemographic, row.Status, row.Year)
+                and row.Follows is not None and row.AverageRating is not None
+            )
+            entries[key] = FeedEntry(row.MangaId, row.CreatedAt, row.UpdatedAt,
+                                     row.Follows, row.AverageRating, cover_ids.get(key), hot)
+        return entries
+
+    def _sort_key(self, feed, key, entry):
+        return FEEDS[feed](entry) + (key,)
+
+    def _in_feed(self, feed, entry):
+        return entry.hot if feed == 'hot' else True
+
+    def rebuild(self):
+        entries = self._load_entries()
+        keys = {
+            feed: sorted(self._sort_key(feed, k, e) for k, e in entries.items() if self._in_feed(feed, e))
+            for feed in FEEDS
+        }
+        with self._lock:
+            self._entries = entries
+            self._keys = keys
+            self._mark_built()
+
+    def refresh(self, dirty):
+        fresh = self._load_entries(list(dirty))
+        with self._lock:
+            for key in dirty:
+                old = self._entries.pop(key, None)
+                if old is not None:
+                    for feed, keys in self._keys.items():
+                        if self._in_feed(feed, old):
+                            sk = self._sort_key(feed, key, old)
+                            i = bisect_left(keys, sk)
+                            if i < len(keys) and keys[i] == sk:
+                                del keys[i]
+                new = fresh.get(key)
+                if new is not None:
+                    self._entries[key] = new
+                    for feed, keys in self._keys.items():
+                        if self._in_feed(feed, new):
+                            insort(keys, self._sort_key(feed, key, new))
+
+    # ---------- đọc ----------
+
+    def _feed_keys(self, feed, only):
+        if only is None:
+            return self._keys[feed]
+        return sorted(
+            self._sort_key(feed, k, self._entries[k])
+            for k in {manga_key(mid) for mid in only}
+            if k in self._entries and self._in_feed(feed, self._entries[k])
+        )
+
+    def page(self, feed, page, per_page, only=None):
+        """
+        Trang `page` của feed: (entries, total).
+        only: tập MangaId giới hạn feed (vd. manga trong list của user cho /updates).
+        """
+        self.ensure_fresh()
+        with self._lock:
+            keys = self._feed_keys(feed, only)
+            # như paginate(error_out=False): page < 1 coi là trang 1
+            start = (max(page, 1) - 1) * per_page
+            entries = [self._entries[sk[-1]] for sk in keys[start:start + per_page]]
+            return entries, len(keys)
+
+    def seek(self, feed, cursor_key, limit, reverse=False, only=None):
+        """
+        Keyset: `limit` entry ngay sau (reverse=False) hoặc ngay trước (reverse=True)
+        sort key `cursor_key` (None = đầu feed).
+        Trả về (entries, sort keys tương ứng, vị trí entry đầu, total).
+        """
+        self.ensure_fresh()
+        with self._lock:
+            keys = self._feed_keys(feed, only)
+            if cursor_key is None:
+                start = 0
+            elif reverse:
+                start = max(0, bisect_left(keys, tuple(cursor_key)) - limit)
+            else:
+                start = bisect_right(keys, tuple(cursor_key))
+            if reverse and cursor_key is not None:
+                end = bisect_left(keys, tuple(cursor_key))
+            else:
+                end = start + limit
+            page_keys = keys[start:end]
+            return [self._entries[sk[-1]] for sk in page_keys], page_keys, start, len(keys)
+
+
+feed_index = FeedIndex()
+
+
+@manga_upserted.connect
+def _on_manga_upserted(sender, manga_id=None, **extra):
+    if manga_id:
+        feed_index.mark_dirty(manga_id)
+
+
+@chapters_synced.connect
+def _on_chapters_synced(sender, manga_id=None, **extra):
+    if manga_id:
+        feed_index.mark_dirty(manga_id)
@@ -1,80 +1,16 @@
 # mini-demo/app/list_routes.py
-from flask import Blueprint, request, jsonify, render_template, abort, url_for, current_app
+from flask import Blueprint, request, jsonify, render_template, abort
 from flask_login import login_required, current_user
 from app import db
-from app.models import List, ListManga, ListFollower, Manga, User, MangaCover
+from app.models import List, ListManga, ListFollower, Manga, User
+from app.cover_controller import get_cover_urls
+from app.search_index import search_index
 from datetime import datetime
 from sqlalchemy import or_, func
 import uuid
-import base64
-import requests
 
 list_bp = Blueprint("lists", __name__)
 
-# -------------------------
-# Helper: build cover_url for a Manga
-# -------------------------
-def _get_cover_url_for_manga(manga):
-    """
-    Return a URL that can be placed into <img src="...">:
-      - data:image/... base64 if we have ImageData in MangaCover
-      - if not, try MangaDex API to download, save to MangaCover and return base64
-      - otherwise return static default cover url
-    This mirrors the logic used in your main routes (home/recently_added/etc).
-    """
-    # 1) try to find cached cover in MangaCover
-    try:
-        mc = MangaCover.query.filter_by(MangaId=manga.MangaId).order_by(MangaCover.DownloadDate.desc()).first()
-    except Exception:
-        mc = None
-
-    if mc and getattr(mc, "ImageData", None):
-        try:
-            b64 = base64.b64encode(mc.ImageData).decode("utf-8")
-            return f"data:image/jpeg;base64,{b64}"
-        except Exception:
-            pass
-
-    # 2) try MangaDex API (best-effort, short timeouts)
-    try:
-        manga_id_str = str(manga.MangaId).lower()
-        api_resp = requests.get("https://api.mangadex.org/cover", params={"manga[]": manga_id_str, "limit": 1}, headers={"Referer": "https://mangadex.org"}, timeout=6)
-        api_resp.raise_for_status()
-        data = api_resp.json()
-        if data.get("data"):
-            cover_item = data["data"][0]
-            file_name = cover_item.get("attributes", {}).get("fileName")
-            cover_id = cover_item.get("id")
-            if file_name and cover_id:
-                image_url = f"https://uploads.mangadex.org/covers/{manga_id_str}/{file_name}"
-                img_resp = requests.get(image_url, timeout=10)
-                if img_resp.status_code == 200:
-                    image_data = img_resp.content
-                    # store into MangaCover if model exists
-                    try:
-                        # CoverId in your model appears to be UUID-like; attempt to coerce
-                        new_mc = MangaCover(
-                            MangaId=manga.MangaId,
-                            CoverId=uuid.UUID(cover_id) if cover_id else None,
-                            FileName=file_name,
-                            ImageData=image_data,
-                            DownloadDate=datetime.utcnow()
-                        )
-                        db.session.add(new_mc)
-                        db.session.commit()
-                    except Exception:
-                        db.session.rollback()
-                    # return base64 data uri
-                    b64 = base64.b64encode(image_data).decode("utf-8")
-                    return f"data:image/jpeg;base64,{b64}"
-    except Exception:
-        # network error / api blocked — ignore and fallthrough to default
-        current_app.logger.debug("Failed to fetch cover for %s from MangaDex", getattr(manga, "MangaId", None), exc_info=True)
-
-    # 3) fallback static
-    return url_for("static", filename="assets/default_cover.png")
-
-
 # -------------------------
 # Helper serializers
 # -------------------------
@@ -350,9 +286,10 @@ def public_view(slug):
 
     owner = User.query.filter_by(UserId=l.UserId).first()
     # enrich items with cover_url and pass to template as list of dicts
+    cover_urls = get_cover_urls([m.MangaId for _, m in items])
     items_enriched = []
     for li, m in items:
-        cover_url = _get_cover_url_for_manga(m)
+        cover_url = cover_urls[m.MangaId]
         items_enriched.append({"list_item": li, "manga": m, "cover_url": cover_url})
 
     list_meta = l
@@ -379,10 +316,10 @@ def get_list_items(list_id):
         q = q.order_by(ListManga.AddedAt.desc())
 
     items = q.all()
+    cover_urls = get_cover_urls([m.MangaId for _, m in items])
     items_serialized = []
     for li, m in items:
-        # TẠO COVER URL HOÀN CHỈNH TẠI ĐÂY
-        cover_url = _get_cover_url_for_manga(m) 
+        cover_url = cover_urls[m.MangaId]
         items_serialized.append({
             "manga_id": str(m.MangaId),
             "title": getattr(m, "TitleEn", "") or "",
@@ -441,19 +378,16 @@ def search_manga():
     if not q:
         return jsonify({"results": []})
 
-    like = f"%{q}%"
-    # note: Manga model doesn't have Title fallback column; search TitleEn and alt titles if you want more
-    results = (
-        db.session.query(Manga)
-        .filter(Manga.TitleEn.ilike(like))
-        .limit(limit)
-        .all()
-    )
+    # search index: TitleEn + alt titles + description, đã xếp hạng theo độ liên quan
+    manga_ids = search_index.search(q, limit=limit)
+    by_id = {m.MangaId: m for m in db.session.query(Manga).filter(Manga.MangaId.in_(manga_ids)).all()} if manga_ids else {}
+    results = [by_id[mid] for mid in manga_ids if mid in by_id]
+    cover_urls = get_cover_urls([m.MangaId for m in results])
     out = []
     for m in results:
         out.append({
             "manga_id": str(m.MangaId),
             "title": getattr(m, "TitleEn", "") or "",
-            "cover_url": _get_cover_url_for_manga(m)
+            "cover_url": cover_urls[m.MangaId]
         })
     return jsonify({"results": out})
@@ -3,12 +3,17 @@ import pyodbc
 import requests
 import json
 import datetime
+import decimal
 import time
 import uuid
 import logging
-from urllib3.util.retry import Retry
-from requests.adapters import HTTPAdapter
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from config import Config
+from app.cover_store import store_cover
+from app.mangadex_client import API_BASE_URL, get_client
+from app.signals import manga_upserted, tags_updated
 
 # Cấu hình logging
 logging.basicConfig(
@@ -22,14 +27,16 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Thông số
-BASE_URL = "https://api.mangadex.org"
-HEADERS = {
-    "User-Agent": "Mozilla/5.0",
-    "Referer": "https://mangadex.org/"
-}
+BASE_URL = API_BASE_URL
 MAX_RETRIES = 5
-MIN_DELAY = 0.25
+# Số lời gọi API song song khi ingest một manga (chapter, cover, creator) và số manga ingest cùng lúc
+FETCH_WORKERS = 8
+INGEST_WORKERS = 4
 LANG_PRIORITY = ["vi", "en"]
+# Mặc định /manga, /chapter bỏ qua pornographic; các job đồng bộ lấy đủ mọi content rating
+CONTENT_RATINGS = ["safe", "suggestive", "erotica", "pornographic"]
+
+_fetch_pool = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="mangadex-fetch")
 
 # Kết nối DB
 def connect_db():
@@ -47,29 +54,56 @@ def connect_db():
         logger.error(f"Lỗi kết nối cơ sở dữ liệu: {e}")
         raise
 
-# Hàm gọi API
+def existing_ids(conn, table, column, ids, where=None):
+    """Các id (viết hoa) trong `ids` đã có trong [dbo].[table] (thêm điều kiện `where` nếu có)."""
+    ids = [str(i).upper() for i in ids]
+    found = set()
+    cursor = conn.cursor()
+    extra = f" AND ({where})" if where else ""
+    for i in range(0, len(ids), 500):
+        batch = ids[i:i + 500]
+        cursor.execute(f"SELECT [{column}] FROM [dbo].[{table}] WHERE [{column}] IN ({', '.join('?' * len(batch))}){extra}",
+                       batch)
+        found.update(str(row[0]).upper() for row in cursor.fetchall())
+    return found
+
+# Trạng thái job đồng bộ (bảng SyncState, xem data/create-sync-state.sql): JSON theo tên job
+def load_sync_state(conn, name):
+    cursor = conn.cursor()
+    cursor.execute("SELECT State FROM [dbo].[SyncState] WHERE Name = ?", (name,))
+    row = cursor.fetchone()
+    return json.loads(row[0]) if row and row[0] else {}
+
+def save_sync_state(conn, name, state):
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            MERGE INTO [dbo].[SyncState] AS target
+            USING (VALUES (?, ?)) AS source (Name, State)
+            ON target.Name = source.Name
+            WHEN MATCHED THEN
+                UPDATE SET State = source.State, UpdatedAt = SYSUTCDATETIME()
+            WHEN NOT MATCHED THEN
+                INSERT (Name, State) VALUES (source.Name, source.State);
+        """, (name, json.dumps(state, ensure_ascii=False)))
+        conn.commit()
+    except pyodbc.Error as e:
+        conn.rollback()
+        logger.error(f"Lỗi lưu trạng thái đồng bộ {name}: {e}")
+        raise
+
+# Hàm gọi API (qua client dùng chung: pool kết nối, keep-alive, retry, rate limit theo X-RateLimit-*)
 def request_api(endpoint, params=None):
     logger.debug(f"Yêu cầu API: {BASE_URL + endpoint} với params: {params}")
-    session = requests.Session()
-    retries = Retry(total=MAX_RETRIES, backoff_factor=2, status_forcelist=[429, 500, 502, 503, 504])
-    session.mount('https://', HTTPAdapter(max_retries=retries))
+    client = get_client()
     try:
-        time.sleep(MIN_DELAY)
-        resp = session.get(BASE_URL + endpoint, params=params, headers=HEADERS, timeout=15)
-        if resp.status_code == 429:
-            retry_after = int(resp.headers.get('Retry-After', 60))
-            logger.warning(f"Rate limited. Chờ {retry_after} giây.")
-            time.sleep(retry_after)
-            return request_api(endpoint, params)
+        resp = client.get(client.api_url(endpoint), params=params)
         resp.raise_for_status()
         logger.debug(f"Yêu cầu API thành công: {endpoint}")
         return resp.json()
     except requests.exceptions.RequestException as e:
         logger.error(f"Lỗi yêu cầu API {endpoint}: {e}")
         raise
-    finally:
-        session.close()
-        logger.debug("Đã đóng session API.")
 
 # Hàm parse datetime
 def parse_dt(s):
@@ -105,418 +139,170 @@ def create_manga_link_url(provider, value):
     logger.debug(f"URL được tạo: {url}")
     return url
 
-# Hàm upsert các bảng
-def upsert_manga(conn, manga_list):
-    cursor = conn.cursor()
-    for manga in manga_list:
-        manga_id_upper = str(manga['MangaId']).upper()
-        logger.info(f"Xử lý upsert manga ID: {manga_id_upper}")
-        try:
-            cursor.execute("""
-                MERGE INTO [dbo].[Manga] AS target
-                USING (VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)) 
-                AS source (MangaId, Type, TitleEn, ChapterNumbersResetOnNewVolume, ContentRating, CreatedAt, UpdatedAt, IsLocked, LastChapter, LastVolume, LatestUploadedChapter, OriginalLanguage, PublicationDemographic, State, Status, Year, OfficialLinks)
-                ON target.MangaId = source.MangaId
-                WHEN MATCHED AND (
-                    target.Type != source.Type OR
-                    target.TitleEn != source.TitleEn OR
-                    target.ChapterNumbersResetOnNewVolume != source.ChapterNumbersResetOnNewVolume OR
-                    target.ContentRating != source.ContentRating OR
-                    target.CreatedAt != source.CreatedAt OR
-                    target.UpdatedAt != source.UpdatedAt OR
-                    target.IsLocked != source.IsLocked OR
-                    target.LastChapter != source.LastChapter OR
-                    target.LastVolume != source.LastVolume OR
-                    target.LatestUploadedChapter != source.LatestUploadedChapter OR
-                    target.OriginalLanguage != source.OriginalLanguage OR
-                    target.PublicationDemographic != source.PublicationDemographic OR
-                    target.State != source.State OR
-                    target.Status != source.Status OR
-                    target.Year != source.Year OR
-                    target.OfficialLinks != source.OfficialLinks
-                ) THEN
-                    UPDATE SET 
-                        Type = source.Type,
-                        TitleEn = source.TitleEn,
-                        ChapterNumbersResetOnNewVolume = source.ChapterNumbersResetOnNewVolume,
-                        ContentRating = source.ContentRating,
-                        CreatedAt = source.CreatedAt,
-                        UpdatedAt = source.UpdatedAt,
-                        IsLocked = source.IsLocked,
-                        LastChapter = source.LastChapter,
-                        LastVolume = source.LastVolume,
-                        LatestUploadedChapter = source.LatestUploadedChapter,
-                        OriginalLanguage = source.OriginalLanguage,
-                        PublicationDemographic = source.PublicationDemographic,
-                        State = source.State,
-                        Status = source.Status,
-                        Year = source.Year,
-                        OfficialLinks = source.OfficialLinks
-                WHEN NOT MATCHED THEN
-                    INSERT (MangaId, Type, TitleEn, ChapterNumbersResetOnNewVolume, ContentRating, CreatedAt, UpdatedAt, IsLocked, LastChapter, LastVolume, LatestUploadedChapter, OriginalLanguage, PublicationDemographic, State, Status, Year, OfficialLinks)
-                    VALUES (source.MangaId, source.Type, source.TitleEn, source.ChapterNumbersResetOnNewVolume, source.ContentRating, source.CreatedAt, source.UpdatedAt, source.IsLocked, source.LastChapter, source.LastVolume, source.LatestUploadedChapter, source.OriginalLanguage, source.PublicationDemographic, source.State, source.Status, source.Year, source.OfficialLinks);
-            """, (
-                manga_id_upper, manga['Type'], manga['TitleEn'], manga['ChapterNumbersResetOnNewVolume'],
-                manga['ContentRating'], manga['CreatedAt'], manga['UpdatedAt'], manga['IsLocked'],
-                manga['LastChapter'], manga['LastVolume'], manga['LatestUploadedChapter'], manga['OriginalLanguage'],
-                manga['PublicationDemographic'], manga['State'], manga['Status'], manga['Year'], manga['OfficialLinks']
-            ))
-            conn.commit()
-            logger.debug(f"Hoàn thành upsert Manga: {manga['TitleEn']}")
-        except pyodbc.Error as e:
-            conn.rollback()
-            logger.error(f"Lỗi upsert Manga ID {manga_id_upper}: {e}")
-            raise
-
-def upsert_manga_alt_title(conn, alt_titles):
-    cursor = conn.cursor()
-    for alt in alt_titles:
-        manga_id_upper = str(alt['MangaId']).upper()
-        logger.info(f"Xử lý upsert MangaAltTitle cho MangaId: {manga_id_upper}")
-        try:
-            cursor.execute("""
-                SELECT 1 FROM [dbo].[MangaAltTitle] WHERE MangaId = ? AND LangCode = ?
-            """, (manga_id_upper, alt['LangCode']))
-            exists = cursor.fetchone()
-            if not exists:
-                cursor.execute("""
-                    INSERT INTO [dbo].[MangaAltTitle] (MangaId, LangCode, AltTitle)
-                    VALUES (?, ?, ?)
-                """, (manga_id_upper, alt['LangCode'], alt['AltTitle']))
-            conn.commit()
-            logger.debug(f"Hoàn thành upsert MangaAltTitle cho MangaId: {manga_id_upper}")
-        except pyodbc.Error as e:
-            conn.rollback()
-            logger.error(f"Lỗi upsert MangaAltTitle cho MangaId {manga_id_upper}: {e}")
-            raise
-
-def upsert_manga_description(conn, descriptions):
-    cursor = conn.cursor()
-    for desc in descriptions:
-        manga_id_upper = str(desc['MangaId']).upper()
-        logger.info(f"Xử lý upsert MangaDescription cho MangaId: {manga_id_upper}")
-        try:
-            cursor.execute("""
-                SELECT 1 FROM [dbo].[MangaDescription] WHERE MangaId = ? AND LangCode = ?
-            """, (manga_id_upper, desc['LangCode']))
-            exists = cursor.fetchone()
-            if not exists:
-                cursor.execute("""
-                    INSERT INTO [dbo].[MangaDescription] (MangaId, LangCode, Description)
-                    VALUES (?, ?, ?)
-                """, (manga_id_upper, desc['LangCode'], desc['Description']))
-            conn.commit()
-            logger.debug(f"Hoàn thành upsert MangaDescription cho MangaId: {manga_id_upper}")
-        except pyodbc.Error as e:
-            conn.rollback()
-            logger.error(f"Lỗi upsert MangaDescription cho MangaId {manga_id_upper}: {e}")
-            raise
-
-def upsert_manga_available_language(conn, languages):
-    cursor = conn.cursor()
-    for lang in languages:
-        manga_id_upper = str(lang['MangaId']).upper()
-        logger.info(f"Xử lý upsert MangaAvailableLanguage cho MangaId: {manga_id_upper}")
-        try:
-            cursor.execute("""
-                SELECT 1 FROM [dbo].[MangaAvailableLanguage] WHERE MangaId = ? AND LangCode = ?
-            """, (manga_id_upper, lang['LangCode']))
-            exists = cursor.fetchone()
-            if not exists:
-                cursor.execute("""
-                    INSERT INTO [dbo].[MangaAvailableLanguage] (MangaId, LangCode)
-                    VALUES (?, ?)
-                """, (manga_id_upper, lang['LangCode']))
-            conn.commit()
-            logger.debug(f"Hoàn thành upsert MangaAvailableLanguage cho MangaId: {manga_id_upper}")
-        except pyodbc.Error as e:
-            conn.rollback()
-            logger.error(f"Lỗi upsert MangaAvailableLanguage cho MangaId {manga_id_upper}: {e}")
-            raise
-
-def upsert_manga_link(conn, links):
-    cursor = conn.cursor()
-    for link in links:
-        manga_id_upper = str(link['MangaId']).upper()
-        logger.info(f"Xử lý upsert MangaLink cho MangaId: {manga_id_upper}")
-        try:
-            cursor.execute("""
-                SELECT 1 FROM [dbo].[MangaLink] WHERE MangaId = ? AND Provider = ?
-            """, (manga_id_upper, link['Provider']))
-            exists = cursor.fetchone()
-            if not exists:
-                cursor.execute("""
-                    INSERT INTO [dbo].[MangaLink] (MangaId, Provider, Url)
-                    VALUES (?, ?, ?)
-                """, (manga_id_upper, link['Provider'], link['Url']))
-            conn.commit()
-            logger.debug(f"Hoàn thành upsert MangaLink cho MangaId: {manga_id_upper}")
-        except pyodbc.Error as e:
-            conn.rollback()
-            logger.error(f"Lỗi upsert MangaLink cho MangaId {manga_id_upper}: {e}")
-            raise
-
-def upsert_manga_statistics(conn, statistics):
-    cursor = conn.cursor()
-    for stat in statistics:
-        statistic_id_upper = str(stat['StatisticId']).upper()
-        manga_id_upper = str(stat['MangaId']).upper()
-        logger.info(f"Xử lý upsert MangaStatistics cho MangaId: {manga_id_upper}")
-        try:
-            cursor.execute("""
-                MERGE INTO [dbo].[MangaStatistics] AS target
-                USING (VALUES (?, ?, ?, ?, ?, ?, ?, ?)) 
-                AS source (StatisticId, MangaId, Source, Follows, AverageRating, BayesianRating, UnavailableChapters, FetchedAt)
-                ON target.StatisticId = source.StatisticId
-                WHEN MATCHED AND (
-                    target.MangaId != source.MangaId OR
-                    target.Source != source.Source OR
-                    target.Follows != source.Follows OR
-                    target.AverageRating != source.AverageRating OR
-                    target.BayesianRating != source.BayesianRating OR
-                    target.UnavailableChapters != source.UnavailableChapters OR
-                    target.FetchedAt != source.FetchedAt
-                ) THEN
-                    UPDATE SET 
-                        MangaId = source.MangaId,
-                        Source = source.Source,
-                        Follows = source.Follows,
-                        AverageRating = source.AverageRating,
-                        BayesianRating = source.BayesianRating,
-                        UnavailableChapters = source.UnavailableChapters,
-                        FetchedAt = source.FetchedAt
-                WHEN NOT MATCHED THEN
-                    INSERT (StatisticId, MangaId, Source, Follows, AverageRating, BayesianRating, UnavailableChapters, FetchedAt)
-                    VALUES (source.StatisticId, source.MangaId, source.Source, source.Follows, source.AverageRating, source.BayesianRating, source.UnavailableChapters, source.FetchedAt);
-            """, (
-                statistic_id_upper, manga_id_upper, stat['Source'], stat['Follows'], stat['AverageRating'],
-                stat['BayesianRating'], stat['UnavailableChapters'], stat['FetchedAt']
-            ))
-            conn.commit()
-            logger.debug(f"Hoàn thành upsert MangaStatistics cho MangaId: {manga_id_upper}")
-        except pyodbc.Error as e:
-            conn.rollback()
-            logger.error(f"Lỗi upsert MangaStatistics cho MangaId {manga_id_upper}: {e}")
-            raise
+# Upsert set-based: stage cả lô vào bảng tạm bằng fast_executemany rồi MERGE một lần,
+# thay vì một câu MERGE + một lần commit cho mỗi dòng
+def _row_changed(columns):
+    # so sánh NULL-safe: EXCEPT coi NULL = NULL, khác với "!="
+    source = ", ".join(f"source.[{c}]" for c in columns)
+    target = ", ".join(f"target.[{c}]" for c in columns)
+    return f"EXISTS (SELECT {source} EXCEPT SELECT {target})"
+
+def bulk_merge(conn, table, columns, rows, keys, update_columns=(), set_overrides=None,
+               extra_changed=None, output=None, commit=True):
+    """
+    MERGE `rows` (tuple theo thứ tự `columns`) vào [dbo].[table] theo `keys`.
+    update_columns: cột được cập nhật khi khớp khoá (rỗng = chỉ thêm dòng chưa có);
+    set_overrides: {cột: biểu thức SQL} thay cho "= source.cột"; extra_changed: điều kiện
+    cập nhật thêm (OR). Dòng trùng khoá trong lô: có update_columns thì giữ dòng cuối (như cập nhật
+    lần lượt), chỉ thêm thì giữ dòng đầu (như vòng "chưa có thì INSERT" cũ). output: mệnh đề OUTPUT,
+    trả về các dòng của nó. commit=False để caller tự quản transaction.
+    """
+    if not rows:
+        return []
+    key_index = [columns.index(k) for k in keys]
+    by_key = {}
+    for row in rows:
+        key = tuple(row[i] for i in key_index)
+        if update_columns:
+            by_key[key] = row
+        else:
+            by_key.setdefault(key, row)
+    staged = list(by_key.values())
+    stage = f"#Stage{table}"
+    column_list = ", ".join(f"[{c}]" for c in columns)
+    set_overrides = set_overrides or {}
+
+    sql = f"""
+        MERGE INTO [dbo].[{table}] AS target
+        USING {stage} AS source
+        ON {" AND ".join(f"target.[{k}] = source.[{k}]" for k in keys)}"""
+    if update_columns:
+        changed = _row_changed(update_columns)
+        if extra_changed:
+            changed = f"({changed} OR {extra_changed})"
+        assignments = [f"[{c}] = source.[{c}]" for c in update_columns if c not in set_overrides]
+        assignments += [f"[{c}] = {expr}" for c, expr in set_overrides.items()]
+        sql += f"""
+        WHEN MATCHED AND {changed} THEN
+            UPDATE SET {", ".join(assignments)}"""
+    sql += f"""
+        WHEN NOT MATCHED THEN
+            INSERT ({column_list})
+            VALUES ({", ".join(f"source.[{c}]" for c in columns)})"""
+    if output:
+        sql += f"""
+        OUTPUT {output}"""
+    sql += ";"
 
-def upsert_manga_tag(conn, manga_tags):
     cursor = conn.cursor()
-    for tag in manga_tags:
-        manga_id_upper = str(tag['MangaId']).upper()
-        tag_id_upper = str(tag['TagId']).upper()
-        logger.info(f"Xử lý upsert MangaTag cho MangaId: {manga_id_upper}, TagId: {tag_id_upper}")
-        try:
-            cursor.execute("""
-                SELECT 1 FROM [dbo].[MangaTag] WHERE MangaId = ? AND TagId = ?
-            """, (manga_id_upper, tag_id_upper))
-            exists = cursor.fetchone()
-            if not exists:
-                cursor.execute("""
-                    INSERT INTO [dbo].[MangaTag] (MangaId, TagId)
-                    VALUES (?, ?)
-                """, (manga_id_upper, tag_id_upper))
-            conn.commit()
-            logger.debug(f"Hoàn thành upsert MangaTag cho MangaId: {manga_id_upper}, TagId: {tag_id_upper}")
-        except pyodbc.Error as e:
-            conn.rollback()
-            logger.error(f"Lỗi upsert MangaTag cho MangaId {manga_id_upper}, TagId {tag_id_upper}: {e}")
-            raise
-
-def upsert_chapter(conn, chapters):
-    cursor = conn.cursor()
-    for chapter in chapters:
-        chapter_id_upper = str(chapter['ChapterId']).upper()
-        manga_id_upper = str(chapter['MangaId']).upper()
-        logger.info(f"Xử lý upsert Chapter cho ChapterId: {chapter_id_upper}")
-        try:
-            cursor.execute("""
-                MERGE INTO [dbo].[Chapter] AS target
-                USING (VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)) 
-                AS source (ChapterId, MangaId, Type, Volume, ChapterNumber, Title, TranslatedLang, Pages, PublishAt, ReadableAt, IsUnavailable, CreatedAt, UpdatedAt)
-                ON target.ChapterId = source.ChapterId
-                WHEN MATCHED AND (
-                    target.Type != source.Type OR
-                    target.Volume != source.Volume OR
-                    target.ChapterNumber != source.ChapterNumber OR
-                    target.Title != source.Title OR
-                    target.TranslatedLang != source.TranslatedLang OR
-                    target.Pages != source.Pages OR
-                    target.PublishAt != source.PublishAt OR
-                    target.ReadableAt != source.ReadableAt OR
-                    target.IsUnavailable != source.IsUnavailable OR
-                    target.CreatedAt != source.CreatedAt OR
-                    target.UpdatedAt != source.UpdatedAt
-                ) THEN
-                    UPDATE SET 
-                        Type = source.Type,
-                        Volume = source.Volume,
-                        ChapterNumber = source.ChapterNumber,
-                        Title = source.Title,
-                        TranslatedLang = source.TranslatedLang,
-                        Pages = source.Pages,
-                        PublishAt = source.PublishAt,
-                        ReadableAt = source.ReadableAt,
-                        IsUnavailable = source.IsUnavailable,
-                        CreatedAt = source.CreatedAt,
-                        UpdatedAt = source.UpdatedAt
-                WHEN NOT MATCHED THEN
-                    INSERT (ChapterId, MangaId, Type, Volume, ChapterNumber, Title, TranslatedLang, Pages, PublishAt, ReadableAt, IsUnavailable, CreatedAt, UpdatedAt)
-                    VALUES (source.ChapterId, source.MangaId, source.Type, source.Volume, source.ChapterNumber, source.Title, source.TranslatedLang, source.Pages, source.PublishAt, source.ReadableAt, source.IsUnavailable, source.CreatedAt, source.UpdatedAt);
-            """, (
-                chapter_id_upper, manga_id_upper, chapter['Type'], chapter['Volume'], chapter['ChapterNumber'],
-                chapter['Title'], chapter['TranslatedLang'], chapter['Pages'], chapter['PublishAt'], chapter['ReadableAt'],
-                chapter['IsUnavailable'], chapter['CreatedAt'], chapter['UpdatedAt']
-            ))
-            conn.commit()
-            logger.debug(f"Hoàn thành upsert Chapter cho ChapterId: {chapter_id_upper}")
-        except pyodbc.Error as e:
-            conn.rollback()
-            logger.error(f"Lỗi upsert Chapter cho ChapterId {chapter_id_upper}: {e}")
-            raise
-
-def upsert_covers(conn, covers):
-    cursor = conn.cursor()
-    for cover in covers:
-        cover_id_upper = str(cover['cover_id']).upper()
-        manga_id_upper = str(cover['manga_id']).upper()
-        logger.info(f"Xử lý upsert Covers cho cover_id: {cover_id_upper}")
-        try:
-            cursor.execute("""
-                MERGE INTO [dbo].[Covers] AS target
-                USING (VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)) 
-                AS source (cover_id, manga_id, type, description, volume, fileName, locale, createdAt, updatedAt, version, rel_user_id, url, image_data)
-                ON target.cover_id = source.cover_id
-                WHEN MATCHED AND (
-                    target.manga_id != source.manga_id OR
-                    target.type != source.type OR
-                    target.description != source.description OR
-                    target.volume != source.volume OR
-                    target.fileName != source.fileName OR
-                    target.locale != source.locale OR
-                    target.createdAt != source.createdAt OR
-                    target.updatedAt != source.updatedAt OR
-                    target.version != source.version OR
-                    target.rel_user_id != source.rel_user_id OR
-                    target.url != source.url OR
-                    (target.image_data IS NULL AND source.image_data IS NOT NULL)
-                ) THEN
-                    UPDATE SET 
-                        manga_id = source.manga_id,
-                        type = source.type,
-                        description = source.description,
-                        volume = source.volume,
-                        fileName = source.fileName,
-                        locale = source.locale,
-                        createdAt = source.createdAt,
-                        updatedAt = source.updatedAt,
-                        version = source.version,
-                        rel_user_id = source.rel_user_id,
-                        url = source.url,
-                        image_data = source.image_data
-                WHEN NOT MATCHED THEN
-                    INSERT (cover_id, manga_id, type, description, volume, fileName, locale, createdAt, updatedAt, version, rel_user_id, url, image_data)
-                    VALUES (source.cover_id, source.manga_id, source.type, source.description, source.volume, source.fileName, source.locale, source.createdAt, source.updatedAt, source.version, source.rel_user_id, source.url, source.image_data);
-            """, (
-                cover_id_upper, manga_id_upper, cover['type'], cover['description'], cover['volume'],
-                cover['fileName'], cover['locale'], cover['createdAt'], cover['updatedAt'], cover['version'],
-                cover['rel_user_id'] if cover['rel_user_id'] else None, cover['url'], cover['image_data']
-            ))
-            conn.commit()
-            logger.debug(f"Hoàn thành upsert Covers cho cover_id: {cover_id_upper}")
-        except pyodbc.Error as e:
-            conn.rollback()
-            logger.error(f"Lỗi upsert Covers cho cover_id {cover_id_upper}: {e}")
-            raise
-
-def upsert_creator(conn, creators):
-    cursor = conn.cursor()
-    for creator in creators:
-        creator_id_upper = str(creator['CreatorId']).upper()
-        logger.info(f"Xử lý upsert Creator cho CreatorId: {creator_id_upper}")
-        try:
-            cursor.execute("""
-                MERGE INTO [dbo].[Creator] AS target
-                USING (VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)) 
-                AS source (CreatorId, Type, Name, ImageUrl, BiographyEn, BiographyJa, BiographyPtBr, CreatedAt, UpdatedAt)
-                ON target.CreatorId = source.CreatorId
-                WHEN MATCHED AND (
-                    target.Type != source.Type OR
-                    target.Name != source.Name OR
-                    target.ImageUrl != source.ImageUrl OR
-                    target.BiographyEn != source.BiographyEn OR
-                    target.BiographyJa != source.BiographyJa OR
-                    target.BiographyPtBr != source.BiographyPtBr OR
-                    target.CreatedAt != source.CreatedAt OR
-                    target.UpdatedAt != source.UpdatedAt
-                ) THEN
-                    UPDATE SET 
-                        Type = source.Type,
-                        Name = source.Name,
-                        ImageUrl = source.ImageUrl,
-                        BiographyEn = source.BiographyEn,
-                        BiographyJa = source.BiographyJa,
-                        BiographyPtBr = source.BiographyPtBr,
-                        CreatedAt = source.CreatedAt,
-                        UpdatedAt = source.UpdatedAt
-                WHEN NOT MATCHED THEN
-                    INSERT (CreatorId, Type, Name, ImageUrl, BiographyEn, BiographyJa, BiographyPtBr, CreatedAt, UpdatedAt)
-                    VALUES (source.CreatorId, source.Type, source.Name, source.ImageUrl, source.BiographyEn, source.BiographyJa, source.BiographyPtBr, source.CreatedAt, source.UpdatedAt);
-            """, (
-                creator_id_upper, creator['Type'], creator['Name'], creator['ImageUrl'], creator['BiographyEn'],
-                creator['BiographyJa'], creator['BiographyPtBr'], creator['CreatedAt'], creator['UpdatedAt']
-            ))
-            conn.commit()
-            logger.debug(f"Hoàn thành upsert Creator cho CreatorId: {creator_id_upper}")
-        except pyodbc.Error as e:
-            conn.rollback()
-            logger.error(f"Lỗi upsert Creator cho CreatorId {creator_id_upper}: {e}")
-            raise
-
-def upsert_creator_relationship(conn, relationships):
-    cursor = conn.cursor()
-    for rel in relationships:
-        creator_id_upper = str(rel['CreatorId']).upper()
-        related_id_upper = str(rel['RelatedId']).upper()
-        logger.info(f"Xử lý upsert CreatorRelationship cho CreatorId: {creator_id_upper}, RelatedId: {related_id_upper}")
-        try:
-            cursor.execute("""
-                SELECT 1 FROM [dbo].[CreatorRelationship] WHERE CreatorId = ? AND RelatedId = ? AND RelatedType = ?
-            """, (creator_id_upper, related_id_upper, rel['RelatedType']))
-            exists = cursor.fetchone()
-            if not exists:
-                cursor.execute("""
-                    INSERT INTO [dbo].[CreatorRelationship] (CreatorId, RelatedId, RelatedType)
-                    VALUES (?, ?, ?)
-                """, (creator_id_upper, related_id_upper, rel['RelatedType']))
+    try:
+        cursor.execute(f"IF OBJECT_ID('tempdb..{stage}') IS NOT NULL DROP TABLE {stage}")
+        # bảng tạm cùng kiểu cột với bảng đích
+        cursor.execute(f"SELECT TOP 0 {column_list} INTO {stage} FROM [dbo].[{table}]")
+        cursor.fast_executemany = True
+        cursor.executemany(
+            f"INSERT INTO {stage} ({column_list}) VALUES ({', '.join('?' * len(columns))})", staged
+        )
+        cursor.execute(sql)
+        result = cursor.fetchall() if output else []
+        cursor.execute(f"DROP TABLE {stage}")
+        if commit:
             conn.commit()
-            logger.debug(f"Hoàn thành upsert CreatorRelationship cho CreatorId: {creator_id_upper}")
-        except pyodbc.Error as e:
-            conn.rollback()
-            logger.error(f"Lỗi upsert CreatorRelationship cho CreatorId {creator_id_upper}: {e}")
-            raise
+        logger.info(f"Đã upsert {len(staged)} dòng vào {table}.")
+        return result
+    except pyodbc.Error as e:
+        conn.rollback()
+        logger.error(f"Lỗi upsert {table} ({len(staged)} dòng): {e}")
+        raise
+    finally:
+        cursor.close()
 
-def upsert_manga_related(conn, related):
-    cursor = conn.cursor()
-    for rel in related:
-        manga_id_upper = str(rel['MangaId']).upper()
-        related_id_upper = str(rel['RelatedId']).upper()
-        logger.info(f"Xử lý upsert MangaRelated cho MangaId: {manga_id_upper}, RelatedId: {related_id_upper}")
-        try:
-            cursor.execute("""
-                SELECT 1 FROM [dbo].[MangaRelated] WHERE MangaId = ? AND RelatedId = ? AND Type = ?
-            """, (manga_id_upper, related_id_upper, rel['Type']))
-            exists = cursor.fetchone()
-            if not exists:
-                cursor.execute("""
-                    INSERT INTO [dbo].[MangaRelated] (MangaId, RelatedId, Type, Related, FetchedAt)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (manga_id_upper, related_id_upper, rel['Type'], rel['Related'], rel['FetchedAt']))
-            conn.commit()
-            logger.debug(f"Hoàn thành upsert MangaRelated cho MangaId: {manga_id_upper}")
-        except pyodbc.Error as e:
-            conn.rollback()
-            logger.error(f"Lỗi upsert MangaRelated cho MangaId {manga_id_upper}: {e}")
-            raise
+# Hàm upsert các bảng
+MANGA_COLUMNS = ["MangaId", "Type", "TitleEn", "ChapterNumbersResetOnNewVolume", "ContentRating", "CreatedAt",
+                 "UpdatedAt", "IsLocked", "LastChapter", "LastVolume", "LatestUploadedChapter", "OriginalLanguage",
+                 "PublicationDemographic", "State", "Status", "Year", "OfficialLinks"]
+STATISTICS_COLUMNS = ["StatisticId", "MangaId", "Source", "Follows", "AverageRating", "BayesianRating",
+                      "UnavailableChapters", "FetchedAt"]
+CHAPTER_COLUMNS = ["ChapterId", "MangaId", "Type", "Volume", "ChapterNumber", "Title", "TranslatedLang", "Pages",
+                   "PublishAt", "ReadableAt", "IsUnavailable", "CreatedAt", "UpdatedAt", "SortKey"]
+COVER_COLUMNS = ["cover_id", "manga_id", "type", "description", "volume", "fileName", "locale", "createdAt",
+                 "updatedAt", "version", "rel_user_id", "url", "content_hash"]
+CREATOR_COLUMNS = ["CreatorId", "Type", "Name", "ImageUrl", "BiographyEn", "BiographyJa", "BiographyPtBr",
+                   "CreatedAt", "UpdatedAt"]
+
+def upsert_manga(conn, manga_list, commit=True):
+    rows = [tuple(str(m[c]).upper() if c == "MangaId" else m.get(c) for c in MANGA_COLUMNS) for m in manga_list]
+    bulk_merge(conn, "Manga", MANGA_COLUMNS, rows, ["MangaId"],
+               update_columns=MANGA_COLUMNS[1:], commit=commit)
+
+def upsert_manga_alt_title(conn, alt_titles, commit=True):
+    rows = [(str(a['MangaId']).upper(), a['LangCode'], a['AltTitle']) for a in alt_titles]
+    bulk_merge(conn, "MangaAltTitle", ["MangaId", "LangCode", "AltTitle"], rows, ["MangaId", "LangCode"],
+               commit=commit)
+
+def upsert_manga_description(conn, descriptions, commit=True):
+    rows = [(str(d['MangaId']).upper(), d['LangCode'], d['Description']) for d in descriptions]
+    bulk_merge(conn, "MangaDescription", ["MangaId", "LangCode", "Description"], rows, ["MangaId", "LangCode"],
+               commit=commit)
+
+def upsert_manga_available_language(conn, languages, commit=True):
+    rows = [(str(l['MangaId']).upper(), l['LangCode']) for l in languages]
+    bulk_merge(conn, "MangaAvailableLanguage", ["MangaId", "LangCode"], rows, ["MangaId", "LangCode"],
+               commit=commit)
+
+def upsert_manga_link(conn, links, commit=True):
+    rows = [(str(l['MangaId']).upper(), l['Provider'], l['Url']) for l in links]
+    bulk_merge(conn, "MangaLink", ["MangaId", "Provider", "Url"], rows, ["MangaId", "Provider"],
+               commit=commit)
+
+def upsert_manga_statistics(conn, statistics, commit=True):
+    rows = [(str(s['StatisticId']).upper(), str(s['MangaId']).upper(), s['Source'], s['Follows'],
+             s['AverageRating'], s['BayesianRating'], s['UnavailableChapters'], s['FetchedAt']) for s in statistics]
+    # một dòng cho mỗi (MangaId, Source) (data/alter-statistics-unique.sql): StatisticId chỉ dùng khi thêm mới,
+    # số liệu không đổi thì không ghi lại (FetchedAt chỉ cập nhật cùng số liệu)
+    bulk_merge(conn, "MangaStatistics", STATISTICS_COLUMNS, rows, ["MangaId", "Source"],
+               update_columns=STATISTICS_COLUMNS[3:-1],
+               set_overrides={"FetchedAt": "source.[FetchedAt]"}, commit=commit)
+
+def upsert_manga_tag(conn, manga_tags, commit=True):
+    rows = [(str(t['MangaId']).upper(), str(t['TagId']).upper()) for t in manga_tags]
+    bulk_merge(conn, "MangaTag", ["MangaId", "TagId"], rows, ["MangaId", "TagId"], commit=commit)
+
+def upsert_chapter(conn, chapters, commit=True):
+    rows = [tuple(str(ch[c]).upper() if c in ("ChapterId", "MangaId") else ch[c] for c in CHAPTER_COLUMNS)
+            for ch in chapters]
+    bulk_merge(conn, "Chapter", CHAPTER_COLUMNS, rows, ["ChapterId"],
+               update_columns=CHAPTER_COLUMNS[2:], commit=commit)
+
+def upsert_covers(conn, covers, commit=True):
+    rows = [(str(c['cover_id']).upper(), str(c['manga_id']).upper(), c['type'], c['description'], c['volume'],
+             c['fileName'], c['locale'], c['createdAt'], c['updatedAt'], c['version'],
+             c['rel_user_id'] if c['rel_user_id'] else None, c['url'], c['content_hash']) for c in covers]
+    # content_hash chỉ ghi đè khi có ảnh mới; có hash thì bỏ binary cũ trong DB
+    bulk_merge(conn, "Covers", COVER_COLUMNS, rows, ["cover_id"],
+               update_columns=COVER_COLUMNS[1:-1],
+               set_overrides={
+                   "content_hash": "COALESCE(source.[content_hash], target.[content_hash])",
+                   "image_data": "CASE WHEN source.[content_hash] IS NULL THEN target.[image_data] END",
+               },
+               extra_changed="(target.[content_hash] IS NULL AND source.[content_hash] IS NOT NULL)",
+               commit=commit)
+
+def upsert_creator(conn, creators, commit=True):
+    rows = [tuple(str(cr[c]).upper() if c == "CreatorId" else cr[c] for c in CREATOR_COLUMNS) for cr in creators]
+    bulk_merge(conn, "Creator", CREATOR_COLUMNS, rows, ["CreatorId"],
+               update_columns=CREATOR_COLUMNS[1:], commit=commit)
+
+def upsert_creator_relationship(conn, relationships, commit=True):
+    rows = [(str(r['CreatorId']).upper(), str(r['RelatedId']).upper(), r['RelatedType']) for r in relationships]
+    bulk_merge(conn, "CreatorRelationship", ["CreatorId", "RelatedId", "RelatedType"], rows,
+               ["CreatorId", "RelatedId", "RelatedType"], commit=commit)
+
+def upsert_manga_related(conn, related, commit=True):
+    rows = [(str(r['MangaId']).upper(), str(r['RelatedId']).upper(), r['Type'], r['Related'], r['FetchedAt'])
+            for r in related]
+    bulk_merge(conn, "MangaRelated", ["MangaId", "RelatedId", "Type", "Related", "FetchedAt"], rows,
+               ["MangaId", "RelatedId", "Type"], commit=commit)
 
 # Hàm fetch dữ liệu từ API
 def search_manga(title):
@@ -531,6 +317,53 @@ def search_manga(title):
     logger.info(f"Tìm thấy {len(mangas)} manga.")
     return mangas
 
+def fetch_mangas_by_ids(manga_ids):
+    """Payload /manga (kèm cover_art, author, artist) cho một danh sách id, 100 id mỗi request."""
+    mangas = []
+    for i in range(0, len(manga_ids), 100):
+        params = {
+            "ids[]": [str(mid).lower() for mid in manga_ids[i:i + 100]],
+            "limit": 100,
+            "contentRating[]": CONTENT_RATINGS,
+            "includes[]": ["cover_art", "author", "artist"]
+        }
+        mangas.extend(request_api("/manga", params=params).get("data", []))
+    return mangas
+
+def iter_updated_since(endpoint, params, since, seen=(), limit=100):
+    """
+    Duyệt một endpoint list (/manga, /chapter, ...) theo updatedAt tăng dần từ mốc `since`
+    (định dạng YYYY-MM-DDTHH:MM:SS). updatedAtSince là điều kiện >=, nên cursor gồm cả các id
+    đã xử lý ở đúng mốc đó (`seen`) để không lặp lại. Yield (item mới, since, seen) sau mỗi trang;
+    caller lưu since/seen làm checkpoint khi đã ghi xong trang.
+    """
+    seen = set(seen)
+    offset = 0
+    while True:
+        page_params = dict(params, limit=limit, offset=offset, updatedAtSince=since)
+        page_params["order[updatedAt]"] = "asc"
+        page = request_api(endpoint, params=page_params).get("data", [])
+        if not page:
+            return
+        fresh = [item for item in page if str(item["id"]).upper() not in seen]
+        if not fresh and len(page) == limit:
+            # cả trang trùng mốc đã xử lý: lùi offset qua chúng
+            offset += limit
+            continue
+        offset = 0
+        last = since_param(page[-1]) or since
+        at_last = {str(item["id"]).upper() for item in page if since_param(item) == last}
+        seen = at_last | seen if last == since else at_last
+        since = last
+        yield fresh, since, sorted(seen)
+        if len(page) < limit:
+            return
+
+def since_param(item):
+    """updatedAt của item ở định dạng tham số updatedAtSince."""
+    dt = parse_dt(item.get("attributes", {}).get("updatedAt"))
+    return dt.strftime("%Y-%m-%dT%H:%M:%S") if dt else None
+
 def fetch_statistics(manga_ids):
     logger.info(f"Lấy thống kê cho {len(manga_ids)} manga.")
     stats = {}
@@ -544,7 +377,62 @@ def fetch_statistics(manga_ids):
     logger.info(f"Hoàn thành lấy thống kê.")
     return stats
 
-def fetch_chapters(manga_id):
+# Chapter.SortKey DECIMAL(18,4) (data/alter-chapter-sort-key.sql): số chapter dạng thập phân, manga đánh
+# số lại mỗi volume thì volume * SORT_KEY_VOLUME_STEP + số chapter. "5a", "5b" xếp ngay sau 5
+# (5.0001, 5.0002, ...). Chapter không có số ("Extra", oneshot) = 0; trùng SortKey thì ChapterId phân định.
+SORT_KEY_PLACES = decimal.Decimal("0.0001")
+SORT_KEY_VOLUME_STEP = 100000
+SORT_KEY_MAX = decimal.Decimal(10) ** 14
+_SORT_NUMBER_SUFFIX = re.compile(r"(\d+(?:\.\d+)?)\s*([a-z])$", re.IGNORECASE)
+
+def _sort_number(value):
+    """
+    Giá trị thập phân của "10", "10.5", "10a" ...; None nếu không phải số (giống TRY_CONVERT của
+    SQL Server, thêm trường hợp số + một chữ cái).
+    """
+    text = str(value).strip()
+    try:
+        number = decimal.Decimal(text).quantize(SORT_KEY_PLACES)
+    except (decimal.InvalidOperation, ValueError):
+        match = _SORT_NUMBER_SUFFIX.fullmatch(text)
+        if not match:
+            return None
+        letter = ord(match.group(2).lower()) - ord("a") + 1
+        number = decimal.Decimal(match.group(1)).quantize(SORT_KEY_PLACES) + letter * SORT_KEY_PLACES
+    return number if number.is_finite() and abs(number) < SORT_KEY_VOLUME_STEP else None
+
+def chapter_sort_key(volume, chapter, reset_on_new_volume=False):
+    """Khoá sắp xếp của một chapter; thứ tự đầy đủ là (SortKey, ChapterId)."""
+    chapter_number = _sort_number(chapter) if chapter is not None else None
+    key = chapter_number if chapter_number is not None else decimal.Decimal(0).quantize(SORT_KEY_PLACES)
+    volume_number = _sort_number(volume) if reset_on_new_volume and volume is not None else None
+    if volume_number is not None:
+        key += volume_number * SORT_KEY_VOLUME_STEP
+    return key if abs(key) < SORT_KEY_MAX else None
+
+def chapter_row(chap, manga_id=None, reset_on_new_volume=False):
+    """Dòng Chapter từ một item của /chapter hoặc /manga/{id}/feed; manga_id lấy từ relationships nếu không truyền."""
+    if manga_id is None:
+        manga_id = next((rel["id"] for rel in chap.get("relationships", []) if rel.get("type") == "manga"), None)
+    attr = chap.get("attributes", {})
+    return {
+        "ChapterId": str(chap.get("id")).upper(),
+        "MangaId": str(manga_id).upper(),
+        "Type": "chapter" if attr.get("chapter") else "oneshot",
+        "Volume": attr.get("volume"),
+        "ChapterNumber": attr.get("chapter"),
+        "Title": attr.get("title"),
+        "TranslatedLang": attr.get("translatedLanguage"),
+        "Pages": attr.get("pages"),
+        "PublishAt": parse_dt(attr.get("publishAt")),
+        "ReadableAt": parse_dt(attr.get("readableAt")),
+        "IsUnavailable": attr.get("isUnavailable", False),
+        "CreatedAt": parse_dt(attr.get("createdAt")),
+        "UpdatedAt": parse_dt(attr.get("updatedAt")),
+        "SortKey": chapter_sort_key(attr.get("volume"), attr.get("chapter"), reset_on_new_volume),
+    }
+
+def fetch_chapters(manga_id, reset_on_new_volume=False):
     manga_id_upper = str(manga_id).upper()
     logger.info(f"Lấy danh sách chương cho manga ID: {manga_id_upper}")
     chapters = []
@@ -562,27 +450,70 @@ def fetch_chapters(manga_id):
         if not chaps:
             break
         logger.debug(f"Tìm thấy {len(chaps)} chương tại offset {offset}.")
-        for chap in chaps:
-            attr = chap.get("attributes", {})
-            chapters.append({
-                "ChapterId": str(chap.get("id")).upper(),
-                "MangaId": manga_id_upper,
-                "Type": "chapter" if attr.get("chapter") else "oneshot",
-                "Volume": attr.get("volume"),
-                "ChapterNumber": attr.get("chapter"),
-                "Title": attr.get("title"),
-                "TranslatedLang": attr.get("translatedLanguage"),
-                "Pages": attr.get("pages"),
-                "PublishAt": parse_dt(attr.get("publishAt")),
-                "ReadableAt": parse_dt(attr.get("readableAt")),
-                "IsUnavailable": attr.get("isUnavailable", False),
-                "CreatedAt": parse_dt(attr.get("createdAt")),
-                "UpdatedAt": parse_dt(attr.get("updatedAt"))
-            })
+        chapters.extend(chapter_row(chap, manga_id_upper, reset_on_new_volume) for chap in chaps)
         offset += 100
     logger.info(f"Tổng cộng lấy được {len(chapters)} chương cho manga ID: {manga_id_upper}")
     return chapters
 
+def cover_row(cover, manga_id=None):
+    """
+    Tải ảnh bìa vào cover_store và trả về dòng Covers cho một item của /cover
+    (manga_id lấy từ relationships nếu không truyền); None nếu không có ảnh hợp lệ.
+    """
+    if manga_id is None:
+        manga_id = next((rel["id"] for rel in cover.get("relationships", []) if rel.get("type") == "manga"), None)
+    manga_id_lower = str(manga_id).lower()
+    manga_id_upper = str(manga_id).upper()
+    cover_id_upper = str(cover.get("id")).upper()
+    attr = cover.get("attributes", {})
+    file_name = attr.get("fileName", "")
+    if not file_name:
+        logger.warning(f"Không tìm thấy fileName cho cover ID: {cover_id_upper}")
+        return None
+    client = get_client()
+    cover_url = client.cover_url(manga_id_lower, file_name)
+    logger.debug(f"URL ảnh bìa: {cover_url}")
+    digest = None
+    try:
+        resp = client.download(cover_url, timeout=30)
+        if resp.status_code == 404:
+            logger.warning(f"Ảnh bìa không tồn tại (404) cho cover ID: {cover_id_upper}")
+            return None
+        resp.raise_for_status()
+        content_type = resp.headers.get('Content-Type', '')
+        if content_type not in ['image/jpeg', 'image/png']:
+            logger.warning(f"Định dạng ảnh không hợp lệ cho cover ID: {cover_id_upper} ({content_type})")
+            return None
+        content_length = int(resp.headers.get('Content-Length', 0))
+        if content_length > 10 * 1024 * 1024:
+            logger.warning(f"Ảnh bìa quá lớn ({content_length} bytes) cho cover ID: {cover_id_upper}")
+            return None
+        digest = store_cover(resp.content)
+        logger.info(f"Đã tải ảnh bìa cho cover ID: {cover_id_upper}, kích thước: {len(resp.content)} bytes, hash: {digest}")
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Lỗi khi tải ảnh bìa cho cover ID {cover_id_upper}: {e}")
+        return None
+    rel_user_id = None
+    for rel in cover.get("relationships", []):
+        if rel["type"] == "user":
+            rel_user_id = str(rel["id"]).upper()
+            break
+    return {
+        "cover_id": cover_id_upper,
+        "manga_id": manga_id_upper,
+        "type": "cover_art",
+        "description": attr.get("description"),
+        "volume": attr.get("volume"),
+        "fileName": file_name,
+        "locale": attr.get("locale"),
+        "createdAt": parse_dt(attr.get("createdAt")),
+        "updatedAt": parse_dt(attr.get("updatedAt")),
+        "version": attr.get("version"),
+        "rel_user_id": rel_user_id,
+        "url": cover_url,
+        "content_hash": digest
+    }
+
 def fetch_covers(manga_id):
     manga_id_lower = str(manga_id).lower()
     manga_id_upper = str(manga_id).upper()
@@ -603,67 +534,9 @@ def fetch_covers(manga_id):
                 break
             logger.debug(f"Tìm thấy {len(cover_list)} cover tại offset {offset}.")
             for cover in cover_list:
-                cover_id_upper = str(cover.get("id")).upper()
-                attr = cover.get("attributes", {})
-                file_name = attr.get("fileName", "")
-                if not file_name:
-                    logger.warning(f"Không tìm thấy fileName cho cover ID: {cover_id_upper}")
-                    continue
-                cover_url = f"https://uploads.mangadex.org/covers/{manga_id_lower}/{file_name}"
-                logger.debug(f"URL ảnh bìa: {cover_url}")
-                image_data = None
-                try:
-                    session = requests.Session()
-                    retries = Retry(total=7, backoff_factor=2, status_forcelist=[429, 500, 502, 503, 504])
-                    session.mount('https://', HTTPAdapter(max_retries=retries))
-                    time.sleep(MIN_DELAY)
-                    resp = session.get(cover_url, headers=HEADERS, timeout=30)
-                    if resp.status_code == 429:
-                        retry_after = int(resp.headers.get('Retry-After', 60))
-                        logger.warning(f"Rate limited khi tải ảnh bìa. Chờ {retry_after} giây.")
-                        time.sleep(retry_after)
-                        resp = session.get(cover_url, headers=HEADERS, timeout=30)
-                    if resp.status_code == 404:
-                        logger.warning(f"Ảnh bìa không tồn tại (404) cho cover ID: {cover_id_upper}")
-                        continue
-                    resp.raise_for_status()
-                    content_type = resp.headers.get('Content-Type', '')
-                    if content_type not in ['image/jpeg', 'image/png']:
-                        logger.warning(f"Định dạng ảnh không hợp lệ cho cover ID: {cover_id_upper} ({content_type})")
-                        continue
-                    content_length = int(resp.headers.get('Content-Length', 0))
-                    if content_length > 10 * 1024 * 1024:
-                        logger.warning(f"Ảnh bìa quá lớn ({content_length} bytes) cho cover ID: {cover_id_upper}")
-                        continue
-                    image_data = resp.content
-                    logger.info(f"Đã tải ảnh bìa cho cover ID: {cover_id_upper}, kích thước: {len(image_data)} bytes")
-                except requests.exceptions.RequestException as e:
-                    logger.error(f"Lỗi khi tải ảnh bìa cho cover ID {cover_id_upper}: {e}")
-                    continue
-                finally:
-                    session.close()
-                    logger.debug("Đã đóng session tải ảnh.")
-                rel_user_id = None
-                for rel in cover.get("relationships", []):
-                    if rel["type"] == "user":
-                        rel_user_id = str(rel["id"]).upper()
-                        break
-                cover_data = {
-                    "cover_id": cover_id_upper,
-                    "manga_id": manga_id_upper,
-                    "type": "cover_art",
-                    "description": attr.get("description"),
-                    "volume": attr.get("volume"),
-                    "fileName": file_name,
-                    "locale": attr.get("locale"),
-                    "createdAt": parse_dt(attr.get("createdAt")),
-                    "updatedAt": parse_dt(attr.get("updatedAt")),
-                    "version": attr.get("version"),
-                    "rel_user_id": rel_user_id,
-                    "url": cover_url,
-                    "image_data": image_data
-                }
-                covers.append(cover_data)
+                cover_data = cover_row(cover, manga_id_upper)
+                if cover_data:
+                    covers.append(cover_data)
             offset += limit
             if offset >= data.get("total", 0):
                 break
@@ -710,61 +583,98 @@ def fetch_related(manga_id, manga_data):
     logger.info(f"Tìm thấy {len(related)} manga liên quan.")
     return related
 
-def fetch_and_upsert_tags(conn, tag_ids, manga_id):
-    cursor = conn.cursor()
-    for tag_id in tag_ids:
-        tag_id_upper = str(tag_id).upper()
-        logger.info(f"Xử lý tag ID: {tag_id_upper} cho manga ID: {manga_id}")
-        try:
-            cursor.execute("SELECT 1 FROM [dbo].[Tag] WHERE TagId = ?", (tag_id_upper,))
-            if not cursor.fetchone():
-                logger.debug(f"Gửi yêu cầu API để lấy thông tin tag ID: {tag_id_upper}")
-                data = request_api(f"/manga/{manga_id}")
-                tags = [t for t in data.get("data", {}).get("attributes", {}).get("tags", []) if t["id"] == tag_id]
-                if not tags:
-                    logger.warning(f"Không tìm thấy tag ID {tag_id_upper} trong dữ liệu manga.")
-                    continue
-                tag = tags[0]
-                attr = tag.get("attributes", {})
-                tag_data = {
-                    "TagId": tag_id_upper,
-                    "NameEn": attr.get("name", {}).get("en", "Unknown"),
-                    "GroupName": attr.get("group", "unknown")
-                }
-                cursor.execute("""
-                    MERGE INTO [dbo].[Tag] AS target
-                    USING (VALUES (?, ?, ?))
-                    AS source (TagId, NameEn, GroupName)
-                    ON target.TagId = source.TagId
-                    WHEN MATCHED AND (
-                        target.NameEn != source.NameEn OR
-                        target.GroupName != source.GroupName
-                    ) THEN
-                        UPDATE SET
-                            NameEn = source.NameEn,
-                            GroupName = source.GroupName
-                    WHEN NOT MATCHED THEN
-                        INSERT (TagId, NameEn, GroupName)
-                        VALUES (source.TagId, source.NameEn, source.GroupName);
-                """, (
-                    tag_data['TagId'], tag_data['NameEn'], tag_data['GroupName']
-                ))
-                conn.commit()
-                logger.info(f"Đã upsert tag: {tag_data['NameEn']} (ID: {tag_id_upper})")
-        except pyodbc.Error as e:
-            conn.rollback()
-            logger.error(f"Lỗi upsert tag ID {tag_id_upper} cho manga ID {manga_id}: {e}")
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Lỗi khi lấy thông tin tag ID {tag_id_upper}: {e}")
+# Từ điển tag: /manga/tag trả về mọi tag trong một lời gọi. Giữ trong process và trong bảng Tag,
+# làm mới sau TAG_REFRESH_INTERVAL; gặp tag lạ thì làm mới sớm (tối đa một lần mỗi TAG_MIN_REFRESH_INTERVAL)
+TAG_REFRESH_INTERVAL = 24 * 60 * 60
+TAG_MIN_REFRESH_INTERVAL = 10 * 60
+
+_tag_lock = threading.Lock()
+_tag_refresh_lock = threading.Lock()
+_tag_dictionary = {}
+_tag_loaded_at = None
+_tags_persisted = set()   # TagId đã chắc chắn có trong bảng Tag
+
+def tag_row(tag):
+    """Dòng Tag từ một item tag (của /manga/tag hoặc attributes.tags của manga)."""
+    attr = tag.get("attributes", {})
+    return {
+        "TagId": str(tag["id"]).upper(),
+        "NameEn": attr.get("name", {}).get("en", "Unknown"),
+        "GroupName": attr.get("group", "unknown")
+    }
+
+def _mark_tags_persisted(tag_ids):
+    with _tag_lock:
+        _tags_persisted.update(tag_ids)
+
+def refresh_tag_dictionary(conn=None):
+    """Tải lại toàn bộ tag từ /manga/tag; có conn thì ghi luôn vào bảng Tag. Trả về từ điển mới."""
+    global _tag_dictionary, _tag_loaded_at
+    data = request_api("/manga/tag")
+    tags = {row["TagId"]: row for row in (tag_row(tag) for tag in data.get("data", []))}
+    with _tag_lock:
+        _tag_dictionary = tags
+        _tag_loaded_at = time.monotonic()
+    if conn is not None and tags:
+        new_tag_ids = upsert_tag(conn, list(tags.values()))
+        _mark_tags_persisted(tags)
+        if new_tag_ids:
+            tags_updated.send(None, tag_ids=new_tag_ids)
+    logger.info(f"Đã làm mới từ điển tag: {len(tags)} tag.")
+    return tags
+
+def get_tag_dictionary(conn=None, tag_ids=()):
+    """Từ điển TagId -> dòng Tag; tự làm mới khi hết hạn hoặc khi có tag trong tag_ids chưa biết."""
+    with _tag_lock:
+        tags, loaded_at = _tag_dictionary, _tag_loaded_at
+    age = None if loaded_at is None else time.monotonic() - loaded_at
+    unknown = any(tag_id not in tags for tag_id in tag_ids)
+    if age is None or age >= TAG_REFRESH_INTERVAL or (unknown and age >= TAG_MIN_REFRESH_INTERVAL):
+        with _tag_refresh_lock:
+            # thread khác có thể vừa làm mới xong trong lúc chờ lock
+            if _tag_loaded_at == loaded_at:
+                try:
+                    return refresh_tag_dictionary(conn)
+                except requests.exceptions.RequestException as e:
+                    logger.warning(f"Không làm mới được từ điển tag, dùng bản đang có: {e}")
+    with _tag_lock:
+        return _tag_dictionary
+
+def tags_from_manga(manga, conn=None):
+    """Tag của một manga lấy từ từ điển tag (payload manga chỉ dùng khi từ điển chưa có tag đó)."""
+    payload_tags = manga.get("attributes", {}).get("tags", [])
+    dictionary = get_tag_dictionary(conn, [str(tag["id"]).upper() for tag in payload_tags])
+    return [dictionary.get(str(tag["id"]).upper()) or tag_row(tag) for tag in payload_tags]
+
+def upsert_tag(conn, tags, commit=True):
+    """Upsert bảng Tag; trả về TagId của các tag mới thêm."""
+    rows = [(str(t['TagId']).upper(), t['NameEn'], t['GroupName']) for t in tags]
+    output = bulk_merge(conn, "Tag", ["TagId", "NameEn", "GroupName"], rows, ["TagId"],
+                        update_columns=["NameEn", "GroupName"], output="$action, inserted.TagId", commit=commit)
+    return [str(tag_id).upper() for action, tag_id in output if action == "INSERT"]
+
+def _gather(futures):
+    """Kết quả của các future theo thứ tự (None giữ chỗ); một cái lỗi thì huỷ các cái chưa chạy rồi raise."""
+    try:
+        return [future.result() if future is not None else None for future in futures]
+    except Exception:
+        for future in futures:
+            if future is not None:
+                future.cancel()
+        raise
 
 # Hàm chính để map và upsert manga
-def map_manga_to_db(manga, stats_dict, conn):
+def map_manga_to_db(manga, stats_dict, conn, sync_chapters=True, sync_covers=True):
+    """
+    Upsert một manga cùng các bảng con. sync_chapters / sync_covers = False để bỏ qua phần
+    chapter / cover (delta sync đồng bộ chúng riêng theo watermark của từng loại).
+    """
     manga_id = manga.get("id")
     manga_id_upper = str(manga_id).upper()
     logger.info(f"Bắt đầu mapping và upsert manga ID: {manga_id_upper}")
+    # Chuẩn bị dữ liệu; chỉ ghi DB khi mọi lời gọi API đã xong
     attr = manga.get("attributes", {})
     
-    # Manga table
     manga_db = {
         "MangaId": manga_id_upper,
         "Type": manga.get("type"),
@@ -784,32 +694,12 @@ def map_manga_to_db(manga, stats_dict, conn):
         "Year": attr.get("year"),
         "OfficialLinks": json.dumps(attr.get("links", {})) if attr.get("links") else None
     }
-    upsert_manga(conn, [manga_db])
-    logger.debug(f"Đã upsert Manga: {manga_db['TitleEn']}")
-
-    # MangaAltTitle
     alt_titles = [{"MangaId": manga_id_upper, "LangCode": lang, "AltTitle": title} for alt in attr.get("altTitles", []) for lang, title in alt.items()]
-    upsert_manga_alt_title(conn, alt_titles)
-    logger.debug(f"Đã upsert {len(alt_titles)} tiêu đề thay thế.")
-
-    # MangaDescription
     descriptions = [{"MangaId": manga_id_upper, "LangCode": lang, "Description": desc} for lang, desc in attr.get("description", {}).items()]
-    upsert_manga_description(conn, descriptions)
-    logger.debug(f"Đã upsert {len(descriptions)} mô tả.")
-
-    # MangaAvailableLanguage
     available_languages = [{"MangaId": manga_id_upper, "LangCode": lang} for lang in attr.get("availableTranslatedLanguages", [])]
-    upsert_manga_available_language(conn, available_languages)
-    logger.debug(f"Đã upsert {len(available_languages)} ngôn ngữ có sẵn.")
-
-    # MangaLink
     links = [{"MangaId": manga_id_upper, "Provider": provider, "Url": create_manga_link_url(provider, url)} for provider, url in attr.get("links", {}).items()]
-    upsert_manga_link(conn, links)
-    logger.debug(f"Đã upsert {len(links)} liên kết.")
 
-    # MangaRelated
     related = fetch_related(manga_id, manga)
-    upsert_manga_related(conn, related)
 
     # MangaStatistics
     stat = stats_dict.get(manga_id, {})
@@ -824,42 +714,102 @@ def map_manga_to_db(manga, stats_dict, conn):
         "UnavailableChapters": stat.get("unavailableChaptersCount", 0),
         "FetchedAt": parse_dt(datetime.datetime.now().isoformat())
     }
-    upsert_manga_statistics(conn, [statistics_db])
-    logger.debug(f"Đã upsert thống kê: Follows={statistics_db['Follows']}")
-
-    # MangaTag
-    tag_ids = [t["id"] for t in attr.get("tags", [])]
-    fetch_and_upsert_tags(conn, tag_ids, manga_id_upper)
-    manga_tags = [{"MangaId": manga_id_upper, "TagId": str(t["id"]).upper()} for t in attr.get("tags", [])]
-    upsert_manga_tag(conn, manga_tags)
-    logger.debug(f"Đã upsert {len(manga_tags)} liên kết MangaTag.")
-
-    # Chapter
-    chapters = fetch_chapters(manga_id)
-    upsert_chapter(conn, chapters)
-
-    # Covers and Creators
-    covers_db = fetch_covers(manga_id)
-    creators_db = []
+
+    # Tag: từ điển tag trong process, không gọi API theo từng manga
+    tags_db = tags_from_manga(manga, conn)
+    with _tag_lock:
+        unpersisted_tags = [tag for tag in tags_db if tag["TagId"] not in _tags_persisted]
+    manga_tags = [{"MangaId": manga_id_upper, "TagId": tag["TagId"]} for tag in tags_db]
+
+    # Chapter, Cover, Creator: gọi API song song trên pool chung (vẫn qua rate limiter của client)
+    pending = [
+        _fetch_pool.submit(fetch_chapters, manga_id, manga_db["ChapterNumbersResetOnNewVolume"]) if sync_chapters else None,
+        _fetch_pool.submit(fetch_covers, manga_id) if sync_covers else None,
+    ]
+    creator_types = {}
     creator_rels = []
-    creator_ids = set()
     for rel in manga.get("relationships", []):
         rtype = rel.get("type")
         rid = str(rel.get("id")).upper()
         if rtype in ["author", "artist"]:
-            if rid not in creator_ids:
-                creator_full = fetch_creator(rel["id"])
-                creator_full["Type"] = rtype
-                creators_db.append(creator_full)
-                creator_ids.add(rid)
+            if rid not in creator_types:
+                creator_types[rid] = rtype
+                pending.append(_fetch_pool.submit(fetch_creator, rel["id"]))
             creator_rels.append({
                 "CreatorId": rid,
                 "RelatedId": manga_id_upper,
                 "RelatedType": "manga"
             })
-    upsert_creator(conn, creators_db)
-    upsert_creator_relationship(conn, creator_rels)
-    upsert_covers(conn, covers_db)
-    logger.debug(f"Đã upsert {len(covers_db)} cover, {len(creators_db)} creator.")
+    chapters, covers_db, *creators_db = _gather(pending)
+    chapters, covers_db = chapters or [], covers_db or []
+    for creator in creators_db:
+        creator["Type"] = creator_types[creator["CreatorId"]]
+    logger.debug(f"Đã lấy {len(chapters)} chương, {len(covers_db)} cover, {len(creators_db)} creator.")
 
-    logger.info(f"Hoàn thành mapping và upsert manga ID: {manga_id_upper}")
\ No newline at end of file
+    # Ghi toàn bộ trong một transaction: lỗi ở bảng nào thì manga không bị ghi dở
+    try:
+        upsert_manga(conn, [manga_db], commit=False)
+        upsert_manga_alt_title(conn, alt_titles, commit=False)
+        upsert_manga_description(conn, descriptions, commit=False)
+        upsert_manga_available_language(conn, available_languages, commit=False)
+        upsert_manga_link(conn, links, commit=False)
+        upsert_manga_related(conn, related, commit=False)
+        upsert_manga_statistics(conn, [statistics_db], commit=False)
+        new_tag_ids = upsert_tag(conn, unpersisted_tags, commit=False)
+        upsert_manga_tag(conn, manga_tags, commit=False)
+        upsert_chapter(conn, chapters, commit=False)
+        upsert_creator(conn, creators_db, commit=False)
+        upsert_creator_relationship(conn, creator_rels, commit=False)
+        upsert_covers(conn, covers_db, commit=False)
+        conn.commit()
+    except pyodbc.Error:
+        conn.rollback()
+        raise
+    logger.debug(f"Đã upsert {len(alt_titles)} tiêu đề thay thế, {len(manga_tags)} tag, {len(chapters)} chương, "
+                 f"{len(covers_db)} cover, {len(creators_db)} creator.")
+
+    logger.info(f"Hoàn thành mapping và upsert manga ID: {manga_id_upper}")
+
+    # báo cho các index trong process (feed, ...) cập nhật manga này
+    _mark_tags_persisted(tag["TagId"] for tag in unpersisted_tags)
+    if new_tag_ids:
+        tags_updated.send(None, tag_ids=new_tag_ids)
+    manga_upserted.send(None, manga_id=manga_id_upper)
+
+# Ingest nhiều manga song song: mỗi worker một connection, mỗi manga một transaction
+def ingest_mangas(mangas, stats_dict=None, max_workers=INGEST_WORKERS, **options):
+    """
+    Trả về danh sách MangaId ingest lỗi (đã log), các manga khác vẫn được ghi.
+    options (sync_chapters, sync_covers) được chuyển cho map_manga_to_db.
+    """
+    if not mangas:
+        return []
+    if stats_dict is None:
+        stats_dict = fetch_statistics([manga["id"] for manga in mangas])
+    local = threading.local()
+    conns = []
+    conns_lock = threading.Lock()
+
+    def worker(manga):
+        conn = getattr(local, "conn", None)
+        if conn is None:
+            conn = local.conn = connect_db()
+            with conns_lock:
+                conns.append(conn)
+        map_manga_to_db(manga, stats_dict, conn, **options)
+
+    failed = []
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mangadex-ingest") as pool:
+            futures = {pool.submit(worker, manga): str(manga.get("id")).upper() for manga in mangas}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except (requests.exceptions.RequestException, pyodbc.Error) as e:
+                    logger.error(f"Lỗi ingest manga ID {futures[future]}: {e}")
+                    failed.append(futures[future])
+    finally:
+        for conn in conns:
+            conn.close()
+    logger.info(f"Đã ingest {len(mangas) - len(failed)}/{len(mangas)} manga.")
+    return failed
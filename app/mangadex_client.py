@@ -0,0 +1,144 @@
+"""
+Client HTTP dùng chung cho mọi lời gọi tới api.mangadex.org và uploads.mangadex.org.
+
+Một requests.Session duy nhất cho cả process: connection pool + keep-alive nên các lời gọi
+liên tiếp (vd. hàng chục request trong một lần map_manga_to_db) dùng lại kết nối TLS đã mở,
+thay vì bắt tay lại từ đầu mỗi lần. Adapter của urllib3 quản lý pool an toàn giữa các thread,
+nên web request, worker tải cover nền và pipeline ingestion dùng chung được một client.
+
+Mọi request đi qua RateLimiter của host tương ứng (token bucket + header X-RateLimit-*),
+nên nhiều worker cùng gọi vẫn không vượt giới hạn của MangaDex. Lời gọi trong request của người
+đọc dùng interactive=True: chờ limiter tối đa INTERACTIVE_MAX_WAIT giây, không retry 5xx / 429,
+lỗi thì trả về ngay để trang vẫn render (ingestion thì chờ và retry như cũ). Base URL và tốc độ lấy từ
+Config (đổi được qua biến môi trường), vd. trỏ MANGADEX_API_URL tới một stub server local.
+"""
+import logging
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config import Config
+from app.rate_limiter import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+API_BASE_URL = Config.MANGADEX_API_URL
+UPLOADS_BASE_URL = Config.MANGADEX_UPLOADS_URL
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0",
+    "Referer": "https://mangadex.org/"
+}
+# (connect, read) giây
+DEFAULT_TIMEOUT = (5, 15)
+# Số kết nối giữ sẵn cho mỗi host
+POOL_SIZE = 20
+MAX_RETRIES = 5
+RETRY_BACKOFF = 1
+# 429 không retry ở tầng urllib3: RateLimiter cần thấy để dừng mọi worker, không chỉ request này
+RETRY_STATUSES = (500, 502, 503, 504)
+# Số lần gửi lại một request bị 429 (sau khi đã chờ theo Retry-After)
+RATE_LIMIT_RETRIES = 3
+# interactive=True: số giây tối đa chờ tới lượt trong limiter
+INTERACTIVE_MAX_WAIT = 2
+# token cuối cùng của mỗi bucket để dành cho request interactive (ingestion / scheduler không lấy)
+INTERACTIVE_RESERVE = 1
+
+
+class MangaDexClient:
+    def __init__(self, api_base_url=API_BASE_URL, uploads_base_url=UPLOADS_BASE_URL,
+                 pool_size=POOL_SIZE, max_retries=MAX_RETRIES, timeout=DEFAULT_TIMEOUT,
+                 api_rate=Config.MANGADEX_API_RATE, uploads_rate=Config.MANGADEX_UPLOADS_RATE):
+        self.api_base_url = api_base_url.rstrip("/")
+        self.uploads_base_url = uploads_base_url.rstrip("/")
+        self.timeout = timeout
+        # mỗi host một limiter; host lạ (at-home node, ...) dùng chung limiter của uploads
+        self._limiters = {
+            urlsplit(self.api_base_url).netloc: RateLimiter(api_rate, reserve=INTERACTIVE_RESERVE),
+            urlsplit(self.uploads_base_url).netloc: RateLimiter(uploads_rate, reserve=INTERACTIVE_RESERVE),
+        }
+        self._default_limiter = self._limiters[urlsplit(self.uploads_base_url).netloc]
+
+        retries = Retry(
+            total=max_retries,
+            backoff_factor=RETRY_BACKOFF,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(["GET", "HEAD"]),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retries)
+        self.session = requests.Session()
+        self.session.headers.update(DEFAULT_HEADERS)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        # session riêng cho interactive: không retry ở tầng urllib3, request của người đọc có hạn chót rõ ràng
+        fast_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.interactive_session = requests.Session()
+        self.interactive_session.headers.update(DEFAULT_HEADERS)
+        self.interactive_session.mount("https://", fast_adapter)
+        self.interactive_session.mount("http://", fast_adapter)
+
+    def api_url(self, endpoint):
+        return self.api_base_url + endpoint
+
+    def cover_url(self, manga_id, file_name):
+        return f"{self.uploads_base_url}/covers/{manga_id}/{file_name}"
+
+    def limiter_for(self, url):
+        return self._limiters.get(urlsplit(url).netloc, self._default_limiter)
+
+    def get(self, url, params=None, timeout=None, interactive=False, max_wait=None, **kwargs):
+        """
+        GET thô qua rate limiter (trả về Response, không raise theo status).
+        Mặc định 429 được chờ và gửi lại; interactive=True thì đi làn ưu tiên của limiter, không retry
+        và chỉ chờ limiter tối đa max_wait (mặc định INTERACTIVE_MAX_WAIT) giây, quá thì raise RateLimitTimeout.
+        """
+        limiter = self.limiter_for(url)
+        session = self.interactive_session if interactive else self.session
+        if interactive and max_wait is None:
+            max_wait = INTERACTIVE_MAX_WAIT
+        retries = 0 if interactive else RATE_LIMIT_RETRIES
+        for attempt in range(retries + 1):
+            limiter.acquire(url, max_wait=max_wait, priority=interactive)
+            resp = session.get(url, params=params, timeout=timeout or self.timeout, **kwargs)
+            wait = limiter.observe(url, resp)
+            if resp.status_code != 429 or attempt == retries:
+                return resp
+            if max_wait is not None and wait > max_wait:
+                # chờ Retry-After rồi vẫn phải trả lỗi: trả luôn 429 cho caller
+                return resp
+            logger.warning(f"Rate limited (429) tại {url}. Chờ {wait:.0f} giây rồi gửi lại.")
+        return resp
+
+    def api_get(self, endpoint, params=None, timeout=None, interactive=False, max_wait=None):
+        """GET một endpoint của API (vd. "/manga"), raise nếu lỗi, trả về JSON."""
+        resp = self.get(self.api_url(endpoint), params=params, timeout=timeout,
+                        interactive=interactive, max_wait=max_wait)
+        resp.raise_for_status()
+        return resp.json()
+
+    def download(self, url, timeout=None, interactive=False, max_wait=None):
+        """Tải một file (ảnh bìa, ...) từ uploads.mangadex.org; trả về Response."""
+        return self.get(url, timeout=timeout, interactive=interactive, max_wait=max_wait)
+
+    def close(self):
+        self.session.close()
+        self.interactive_session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Client dùng chung của process (tạo lười ở lần gọi đầu)."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = MangaDexClient()
+    return _client
@@ -0,0 +1,66 @@
+# app/memory_index.py
+# Khung chung cho các index dựng trong bộ nhớ process (feed, search, ...):
+# build toàn bộ lần đầu / định kỳ, cập nhật từng manga khi ingestion báo thay đổi.
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from flask import current_app
+
+
+class InMemoryIndex(ABC):
+    # Build lại toàn bộ định kỳ để bắt các thay đổi ghi từ process khác (CLI ingestion, ...)
+    REBUILD_INTERVAL = 15 * 60
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        self._built_at = None
+        self._dirty = set()
+
+    @abstractmethod
+    def rebuild(self):
+        """Build lại toàn bộ index; subclass gọi _mark_built() khi swap xong."""
+
+    @abstractmethod
+    def refresh(self, keys):
+        """Cập nhật lại các manga (key = str(MangaId).lower()) đã bị đánh dấu dirty."""
+
+    def _mark_built(self):
+        self._built_at = time.monotonic()
+
+    def ensure_fresh(self):
+        if self._built_at is None:
+            with self._build_lock:
+                if self._built_at is None:
+                    self.rebuild()
+        elif time.monotonic() - self._built_at > self.REBUILD_INTERVAL and self._build_lock.acquire(blocking=False):
+            # build lại ở thread nền, các request tiếp tục đọc bản cũ
+            self._start_background_rebuild(current_app._get_current_object())
+        if self._dirty:
+            with self._lock:
+                dirty, self._dirty = self._dirty, set()
+            if dirty:
+                self.refresh(dirty)
+
+    def warm_up(self, app):
+        """Build lần đầu ở thread nền lúc khởi động app, để request đầu tiên không phải chờ."""
+        if self._built_at is None and self._build_lock.acquire(blocking=False):
+            self._start_background_rebuild(app)
+
+    def _start_background_rebuild(self, app):
+        # gọi khi đang giữ _build_lock; thread nền nhả lock khi xong
+        threading.Thread(target=self._rebuild_in_background, args=(app,), daemon=True).start()
+
+    def _rebuild_in_background(self, app):
+        try:
+            with app.app_context():
+                self.rebuild()
+        except Exception as e:
+            print(f"[{type(self).__name__}] Error rebuilding index: {e}")
+        finally:
+            self._build_lock.release()
+
+    def mark_dirty(self, manga_id):
+        with self._lock:
+            self._dirty.add(str(manga_id).lower())
@@ -2,8 +2,8 @@ from datetime import datetime
 import uuid
 from flask_login import UserMixin
 from sqlalchemy.dialects.mssql import UNIQUEIDENTIFIER
-from sqlalchemy import Column, LargeBinary, PrimaryKeyConstraint, String, Integer, Boolean, DateTime, Text, Float, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Index, LargeBinary, Numeric, PrimaryKeyConstraint, String, Integer, Boolean, DateTime, Text, Float, ForeignKey
+from sqlalchemy.orm import deferred, relationship
 from . import db
 
 # ------------------------
@@ -56,6 +56,8 @@ class Manga(db.Model):
     Status = Column(String(50))
     Year = Column(Integer)
     OfficialLinks = Column(Text)
+    LastSyncedAt = Column(DateTime)  # lần cuối chapter được đồng bộ (app/chapter_scheduler.py)
+    SyncRequestedAt = Column(DateTime)  # người đọc mở manga chưa có chapter, chờ worker sync
 
     # relationships
     chapters = relationship("Chapter", back_populates="manga")
@@ -75,7 +77,12 @@ class Manga(db.Model):
 # ------------------------
 class Chapter(db.Model):
     __tablename__ = "Chapter"
-    __table_args__ = {"schema": "dbo"}
+    __table_args__ = (
+        # next / prev / first chapter: một lần seek theo (MangaId, TranslatedLang, SortKey)
+        Index("IX_Chapter_MangaId_TranslatedLang_SortKey", "MangaId", "TranslatedLang", "SortKey",
+              mssql_include=["IsUnavailable", "ChapterNumber"]),
+        {"schema": "dbo"},
+    )
 
     ChapterId = Column(UNIQUEIDENTIFIER, primary_key=True, default=uuid.uuid4)
     MangaId = Column(UNIQUEIDENTIFIER, ForeignKey("dbo.Manga.MangaId"))
@@ -90,6 +97,8 @@ class Chapter(db.Model):
     IsUnavailable = Column(Boolean)
     CreatedAt = Column(DateTime)
     UpdatedAt = Column(DateTime)
+    # thứ tự đọc (app/mangadex_api.py: chapter_sort_key), hoà nhau thì theo ChapterId
+    SortKey = Column(Numeric(18, 4))
 
     manga = relationship("Manga", back_populates="chapters")
     comments = relationship("Comment", back_populates="chapter")
@@ -361,7 +370,9 @@ class MangaCover(db.Model):
     CoverId = Column(UNIQUEIDENTIFIER, nullable=False)
     FileName = Column(String(255), nullable=False)
     DownloadDate = Column(DateTime, nullable=False, default=datetime.utcnow)
-    ImageData = Column(LargeBinary, nullable=False)
+    # Blob chỉ được load khi thật sự phục vụ bytes (không kéo theo các query listing)
+    ImageData = deferred(Column(LargeBinary))  # chỉ còn ở các cover cũ, cover mới nằm trong cover_store
+    ContentHash = Column(String(64))  # sha256 của ảnh trong cover_store
 
 
 class Cover(db.Model):
@@ -379,4 +390,5 @@ class Cover(db.Model):
     version = db.Column(db.Integer)
     rel_user_id = db.Column(db.String(36))
     url = db.Column(db.String(500))
-    image_data = db.Column(db.LargeBinary)  # lưu binary ảnh
\ No newline at end of file
+    image_data = deferred(db.Column(db.LargeBinary))  # lưu binary ảnh (cover cũ), load khi cần
+    content_hash = db.Column(db.String(64))  # sha256 của ảnh trong cover_store
\ No newline at end of file
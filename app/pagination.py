@@ -0,0 +1,188 @@
+# app/pagination.py
+# ListPagination: phân trang theo số trang cho dữ liệu đọc từ index trong bộ nhớ
+# (feed_index, ...), cùng interface với Pagination của Flask-SQLAlchemy.
+# CursorPagination / keyset_paginate: phân trang keyset với cursor opaque.
+from datetime import datetime
+from decimal import Decimal
+import base64
+import json
+import math
+import uuid
+
+from sqlalchemy import and_, or_
+
+
+class ListPagination:
+    def __init__(self, items, page, per_page, total):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+
+    @property
+    def pages(self):
+        if self.total == 0 or self.per_page == 0:
+            return 0
+        return math.ceil(self.total / self.per_page)
+
+    @property
+    def has_prev(self):
+        return self.page > 1
+
+    @property
+    def prev_num(self):
+        return self.page - 1 if self.has_prev else None
+
+    @property
+    def has_next(self):
+        return self.page < self.pages
+
+    @property
+    def next_num(self):
+        return self.page + 1 if self.has_next else None
+
+    def iter_pages(self, *, left_edge=2, left_current=2, right_current=4, right_edge=2):
+        # cùng thuật toán với flask_sqlalchemy.pagination.Pagination.iter_pages
+        pages_end = self.pages + 1
+        if pages_end == 1:
+            return
+
+        left_end = min(1 + left_edge, pages_end)
+        yield from range(1, left_end)
+        if left_end == pages_end:
+            return
+
+        mid_start = max(left_end, self.page - left_current)
+        mid_end = min(self.page + right_current + 1, pages_end)
+        if mid_start - left_end > 0:
+            yield None
+        yield from range(mid_start, mid_end)
+        if mid_end == pages_end:
+            return
+
+        right_start = max(mid_end, pages_end - right_edge)
+        if right_start - mid_end > 0:
+            yield None
+        yield from range(right_start, pages_end)
+
+    @property
+    def first(self):
+        # số thứ tự (1-based) của item đầu trang
+        return (self.page - 1) * self.per_page + 1 if self.items else 0
+
+
+# ======================
+# Keyset (seek) pagination
+# ======================
+# Cursor là giá trị sort key của item ở mép trang (kèm MangaId/CommentId để phá hoà),
+# mã hoá base64 để client chỉ việc truyền lại ?cursor=... Trang sau lọc bằng
+# WHERE (key) > (cursor) thay vì OFFSET, nên trang sâu cũng nhanh như trang đầu.
+
+class CursorPagination:
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None, total=None, first=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        # total: None nếu không đếm (COUNT(*) là tuỳ chọn)
+        self.total = total
+        self._first = first
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    @property
+    def first(self):
+        # chỉ biết chính xác khi nguồn dữ liệu cho biết vị trí (vd. feed_index)
+        return self._first
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"$dt": value.isoformat()}
+    if isinstance(value, uuid.UUID):
+        return {"$uuid": str(value)}
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and "$dt" in value:
+        return datetime.fromisoformat(value["$dt"])
+    if isinstance(value, dict) and "$uuid" in value:
+        return uuid.UUID(value["$uuid"])
+    return value
+
+
+def encode_cursor(direction, values):
+    payload = json.dumps({"d": direction, "k": [_encode_value(v) for v in values]}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token):
+    """(direction, values) hoặc (None, None) nếu cursor rỗng/không hợp lệ."""
+    if not token:
+        return None, None
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        direction = payload["d"]
+        if direction not in ("next", "prev"):
+            return None, None
+        return direction, [_decode_value(v) for v in payload["k"]]
+    except (ValueError, KeyError, TypeError):
+        return None, None
+
+
+def _seek_condition(order, values, reverse):
+    # (a, b, id) > (va, vb, vid) viết thành OR các AND, theo hướng sort của từng cột
+    clauses = []
+    for i, ((expr, descending), value) in enumerate(zip(order, values)):
+        if descending != reverse:
+            step = expr < value
+        else:
+            step = expr > value
+        clauses.append(and_(*[order[j][0] == values[j] for j in range(i)], step))
+    return or_(*clauses)
+
+
+def keyset_paginate(query, order, key_of, per_page, cursor=None, count=False):
+    """
+    Phân trang keyset cho một query SQLAlchemy.
+
+    order: list (expression, descending); cột cuối phải duy nhất (MangaId/CommentId).
+        Expression không được NULL (bọc coalesce nếu cần) để so sánh tuple đúng.
+    key_of(item): tuple giá trị sort key của một item, cùng thứ tự với order.
+    count: có chạy COUNT(*) để điền total hay không.
+    """
+    direction, values = decode_cursor(cursor)
+    if values is not None and len(values) != len(order):
+        direction, values = None, None
+    reverse = direction == "prev"
+
+    page_query = query
+    if values is not None:
+        page_query = page_query.filter(_seek_condition(order, values, reverse))
+    page_query = page_query.order_by(*[
+        expr.desc() if descending != reverse else expr.asc()
+        for expr, descending in order
+    ])
+    items = page_query.limit(per_page + 1).all()
+    has_more = len(items) > per_page
+    items = items[:per_page]
+    if reverse:
+        items.reverse()
+
+    has_next = has_more if not reverse else values is not None
+    has_prev = has_more if reverse else values is not None
+    next_cursor = encode_cursor("next", key_of(items[-1])) if has_next and items else None
+    prev_cursor = encode_cursor("prev", key_of(items[0])) if has_prev and items else None
+
+    total = query.order_by(None).count() if count else None
+    return CursorPagination(items, per_page, next_cursor, prev_cursor, total)
@@ -0,0 +1,176 @@
+# app/rate_limiter.py
+# Giới hạn tốc độ gọi MangaDex dùng chung cho mọi thread trong process.
+# Token bucket cho giới hạn toàn cục của host (mặc định ~5 request/giây/IP), cộng với cửa sổ
+# theo từng route đọc từ header X-RateLimit-Limit / -Remaining / -Retry-After mà API trả về:
+# route nào báo hết lượt thì mọi worker chờ tới lúc cửa sổ mở lại, thay vì cứ gửi rồi ăn 429.
+# Module chỉ dùng thư viện chuẩn, nhưng `import app.rate_limiter` vẫn chạy app/__init__.py (Flask,
+# SQLAlchemy, models): script ngoài app cần cài đủ requirements, hoặc nạp file này theo đường dẫn
+# như tests/test_rate_limiter.py.
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+def _header_number(headers, name):
+    value = headers.get(name) if headers is not None else None
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimitTimeout(TimeoutError):
+    """Không tới lượt gửi trong `max_wait` giây (request của người đọc không chờ lâu hơn)."""
+
+
+def _remaining(deadline):
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def route_key(url):
+    """Khoá cửa sổ giới hạn của một URL: host + đoạn path đầu ("/manga", "/at-home", ...)."""
+    parts = urlsplit(url)
+    segment = parts.path.strip("/").split("/", 1)[0]
+    return f"{parts.netloc}/{segment}"
+
+
+class TokenBucket:
+    """
+    Bucket `rate` token/giây, tối đa `capacity` token; acquire() chặn tới khi có token.
+    Làn ưu tiên cho request của người đọc: acquire(priority=True) được cấp trước mọi lượt thường
+    đang chờ, và lượt thường không lấy `reserve` token cuối cùng trong bucket.
+    """
+
+    def __init__(self, rate, capacity=None, reserve=0):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.reserve = min(float(reserve), self.capacity - 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._priority_waiting = 0
+        self._cond = threading.Condition()
+
+    def _refill(self, now):
+        # gọi khi đang giữ _cond
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated = now
+
+    def acquire(self, tokens=1, max_wait=None, priority=False):
+        """
+        Lấy `tokens` token, chờ nếu bucket cạn hoặc đang bị tạm dừng; trả về số giây đã chờ.
+        max_wait: raise RateLimitTimeout ngay khi thấy phải chờ quá ngần này giây (không lấy token).
+        priority: làn ưu tiên (xem docstring của class).
+        """
+        start = time.monotonic()
+        deadline = None if max_wait is None else start + max_wait
+        needed = tokens if priority else tokens + self.reserve
+        with self._cond:
+            if priority:
+                self._priority_waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if now < self._paused_until:
+                        delay = self._paused_until - now
+                    elif not priority and self._priority_waiting:
+                        # nhường lượt ưu tiên; được notify khi lượt đó xong
+                        delay = tokens / self.rate
+                    elif self._tokens >= needed:
+                        self._tokens -= tokens
+                        return now - start
+                    else:
+                        delay = (needed - self._tokens) / self.rate
+                    if deadline is not None and now + delay > deadline:
+                        raise RateLimitTimeout(f"Rate limit: cần chờ {delay:.1f}s, quá max_wait={max_wait}s")
+                    self._cond.wait(delay)
+            finally:
+                if priority:
+                    self._priority_waiting -= 1
+                    self._cond.notify_all()
+
+    def pause(self, seconds):
+        """Không cấp token trong `seconds` giây (server vừa trả 429) và xả hết token đang có."""
+        with self._cond:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens = 0.0
+            self._paused_until = max(self._paused_until, now + seconds)
+            self._cond.notify_all()
+
+
+class RateLimiter:
+    """
+    Limiter của một host: token bucket toàn cục + cửa sổ theo route lấy từ header X-RateLimit-*.
+    Dùng: limiter.acquire(url) trước khi gửi, limiter.observe(url, resp) sau khi nhận.
+    """
+
+    # Chờ mặc định khi 429 mà không có header nào cho biết lúc được gọi lại
+    DEFAULT_RETRY_AFTER = 60
+
+    def __init__(self, rate, capacity=None, reserve=0):
+        self.bucket = TokenBucket(rate, capacity, reserve)
+        self._lock = threading.Lock()
+        self._blocked_until = {}   # route key -> time.monotonic() lúc cửa sổ mở lại
+
+    def acquire(self, url, max_wait=None, priority=False):
+        """
+        Chờ tới lượt gửi request tới `url`; trả về tổng số giây đã chờ.
+        max_wait: tổng thời gian chờ tối đa, quá thì raise RateLimitTimeout thay vì chờ tiếp.
+        priority: làn ưu tiên của bucket (request của người đọc).
+        """
+        start = time.monotonic()
+        deadline = None if max_wait is None else start + max_wait
+        key = route_key(url)
+        while True:
+            with self._lock:
+                until = self._blocked_until.get(key, 0.0)
+            delay = until - time.monotonic()
+            if delay <= 0:
+                break
+            if deadline is not None and time.monotonic() + delay > deadline:
+                raise RateLimitTimeout(f"{key} bị giới hạn thêm {delay:.1f}s, quá max_wait={max_wait}s")
+            time.sleep(delay)
+        remaining = _remaining(deadline)
+        if remaining is not None and remaining < 0:
+            raise RateLimitTimeout(f"{key}: hết max_wait={max_wait}s")
+        return (time.monotonic() - start) + self.bucket.acquire(max_wait=remaining, priority=priority)
+
+    def _retry_after(self, headers):
+        """Số giây tới khi được gọi lại, theo Retry-After (giây) hoặc X-RateLimit-Retry-After (epoch)."""
+        seconds = _header_number(headers, "Retry-After")
+        if seconds is not None:
+            return max(0.0, seconds)
+        reset_at = _header_number(headers, "X-RateLimit-Retry-After")
+        if reset_at is not None:
+            return max(0.0, reset_at - time.time())
+        return None
+
+    def observe(self, url, response):
+        """Cập nhật trạng thái theo status + header X-RateLimit-* của response vừa nhận."""
+        headers = getattr(response, "headers", None)
+        key = route_key(url)
+        if getattr(response, "status_code", None) == 429:
+            wait = self._retry_after(headers)
+            wait = self.DEFAULT_RETRY_AFTER if wait is None else wait
+            self.bucket.pause(wait)
+            self._block(key, wait)
+            return wait
+        remaining = _header_number(headers, "X-RateLimit-Remaining")
+        if remaining is not None and remaining <= 0:
+            wait = self._retry_after(headers)
+            if wait:
+                self._block(key, wait)
+                return wait
+        return 0.0
+
+    def _block(self, key, seconds):
+        with self._lock:
+            until = time.monotonic() + seconds
+            if until > self._blocked_until.get(key, 0.0):
+                self._blocked_until[key] = until
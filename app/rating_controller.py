@@ -0,0 +1,38 @@
+from flask import g
+from flask_login import current_user
+
+from . import db
+from .models import Rating
+
+
+def get_user_scores(manga_ids, user_id=None):
+    """
+    Điểm current_user đã chấm cho các manga trong manga_ids: {manga_id: score}.
+    Cả trang chỉ tốn một query (MangaId IN ...); kết quả được memo trong g
+    nên gọi lại trong cùng request không chạm DB. Manga chưa chấm không có trong dict.
+    """
+    if user_id is None:
+        if not current_user.is_authenticated:
+            return {}
+        user_id = current_user.UserId
+
+    memo = g.setdefault('_user_scores', {})
+    user_key = str(user_id).lower()
+    manga_ids = [mid for mid in manga_ids if mid]
+
+    missing = {str(mid).lower() for mid in manga_ids} - {mk for uk, mk in memo if uk == user_key}
+    if missing:
+        rows = db.session.query(Rating.MangaId, Rating.Score)\
+            .filter(Rating.UserId == user_id, Rating.MangaId.in_(missing))\
+            .all()
+        for key in missing:
+            memo[(user_key, key)] = None
+        for manga_id, score in rows:
+            memo[(user_key, str(manga_id).lower())] = int(score) if score is not None else None
+
+    scores = {}
+    for mid in manga_ids:
+        score = memo.get((user_key, str(mid).lower()))
+        if score is not None:
+            scores[mid] = score
+    return scores
@@ -1,142 +1,59 @@
 from . import db
 from .models import Chapter, ReadingHistory, Manga
+from .chapter_nav import get_nav
+from .chapter_scheduler import request_sync
 from sqlalchemy import func
 from uuid import uuid4
 from datetime import datetime
-import requests
-
-def sync_chapters(manga_id, timeout=5):
-    """
-    Best-effort: đồng bộ chapters từ MangaDex. 
-    IMPORTANT: do NOT call this on every page request - call it only when DB empty or via background job.
-    """
-    try:
-        params = {
-            "translatedLanguage[]": ["en", "vi"],
-            "limit": 100
-        }
-        resp = requests.get(
-            f"https://api.mangadex.org/manga/{manga_id}/feed",
-            params=params,
-            timeout=timeout
-        )
-        resp.raise_for_status()
-        data = resp.json()
-        chapters = data.get("data", [])
-
-        new_added = False
-        for chap in chapters:
-            chapter_id = chap.get("id")
-            attributes = chap.get("attributes", {})
-            if not chapter_id:
-                continue
-            existing = db.session.query(Chapter).filter_by(ChapterId=chapter_id).first()
-            if not existing:
-                new_chapter = Chapter(
-                    ChapterId=chapter_id,
-                    MangaId=manga_id,
-                    Type=attributes.get("type"),
-                    Volume=attributes.get("volume"),
-                    ChapterNumber=attributes.get("chapter"),
-                    Title=attributes.get("title"),
-                    TranslatedLang=attributes.get("translatedLanguage"),
-                    Pages=attributes.get("pages"),
-                    PublishAt=attributes.get("publishAt"),
-                    ReadableAt=attributes.get("readableAt"),
-                    IsUnavailable=False,
-                    CreatedAt=attributes.get("createdAt"),
-                    UpdatedAt=attributes.get("updatedAt")
-                )
-                db.session.add(new_chapter)
-                new_added = True
-
-        if new_added:
-            db.session.commit()
-        return True
-    except Exception as e:
-        # an toàn: rollback và log
-        try:
-            db.session.rollback()
-        except:
-            pass
-        print(f"[sync_chapters] Error syncing chapters for {manga_id}: {e}")
-        return False
-
 
 def get_available_langs(manga_id):
     manga_id_str = str(manga_id)
-    # **Guard**: chỉ sync khi DB không có chapter nào cho manga này
-    exists = db.session.query(Chapter).filter(Chapter.MangaId == manga_id_str).first()
-    if not exists:
-        sync_chapters(manga_id_str)
-
-    chapters = db.session.query(Chapter).filter(
-        Chapter.MangaId == manga_id_str,
-        Chapter.TranslatedLang.in_(['en', 'vi']),
-        Chapter.IsUnavailable == False
-    ).order_by(Chapter.ChapterNumber.asc()).all()
-
-    langs = sorted(list(set(c.TranslatedLang for c in chapters)))
-    return langs
+    nav = get_nav(manga_id_str)
+    # **Guard**: DB chưa có chapter nào cho manga này thì xếp hàng cho chapter_scheduler, request không chờ MangaDex
+    if not nav and not db.session.query(Chapter.ChapterId).filter(Chapter.MangaId == manga_id_str).first():
+        request_sync(manga_id_str)
+    return nav.langs()
 
 
 def get_chapter_list(manga_id, sort_order='asc'):
     manga_id_str = str(manga_id)
 
-    # **Guard**: không gọi sync vô tội vạ
+    # **Guard**: không gọi sync trong request, chỉ xếp hàng cho chapter_scheduler
     exists = db.session.query(Chapter).filter(Chapter.MangaId == manga_id_str).first()
     if not exists:
-        sync_chapters(manga_id_str)
+        request_sync(manga_id_str)
 
+    # SortKey (+ ChapterId) đã là thứ tự đọc, DB sắp sẵn nên không phải parse số chapter ở đây
+    order = (Chapter.SortKey.desc(), Chapter.ChapterId.desc()) if sort_order == 'desc' \
+        else (Chapter.SortKey.asc(), Chapter.ChapterId.asc())
     chapters = db.session.query(Chapter).filter(
         Chapter.MangaId == manga_id_str,
         Chapter.IsUnavailable == False
-    ).all()
+    ).order_by(*order).all()
 
-    # Group chapters by ChapterNumber (giữ logic cũ)
-    chapters_by_num = {}
+    # Group chapters by ChapterNumber (giữ logic cũ), dict giữ thứ tự chèn
+    sorted_chapters = {}
     for chap in chapters:
-        if chap.ChapterNumber not in chapters_by_num:
-            chapters_by_num[chap.ChapterNumber] = []
-        chapters_by_num[chap.ChapterNumber].append(chap)
-
-    # Sort by ChapterNumber: fallback an toàn khi chapter number không phải số
-    def chapter_key(item):
-        num = item[0]
-        try:
-            return float(str(num))
-        except Exception:
-            return str(num)
-
-    sorted_chapters = dict(sorted(chapters_by_num.items(), key=chapter_key, reverse=(sort_order == 'desc')))
+        sorted_chapters.setdefault(chap.ChapterNumber, []).append(chap)
     return sorted_chapters
 
-def get_first_chapter(manga_id, lang):
-    manga_id_str = str(manga_id)
-    fallback_lang = 'vi' if lang == 'en' else 'en'
-    chap = db.session.query(Chapter).filter(
-        Chapter.MangaId == manga_id_str,
-        Chapter.TranslatedLang == lang,
-        Chapter.IsUnavailable == False
-    ).order_by(Chapter.ChapterNumber.asc()).first()
-    if not chap:
-        chap = db.session.query(Chapter).filter(
-            Chapter.MangaId == manga_id_str,
-            Chapter.TranslatedLang == fallback_lang,
-            Chapter.IsUnavailable == False
-        ).order_by(Chapter.ChapterNumber.asc()).first()
-    return chap
+# Điều hướng (first / next / prev / continue) tra trên ChapterNav đã cache (app/chapter_nav.py), trả về ChapterId
+def get_first_chapter_id(manga_id, lang):
+    return get_nav(manga_id).first(lang)
 
 def get_continue_chapter(user_id, manga_id):
+    """(ChapterId, lang) để đọc tiếp: chapter trong lịch sử đọc gần nhất, không có thì chapter đầu tiên."""
     manga_id_str = str(manga_id)
-    history = db.session.query(ReadingHistory).filter(
+    history = db.session.query(ReadingHistory.ChapterId).filter(
         ReadingHistory.UserId == user_id,
         ReadingHistory.MangaId == manga_id_str
     ).order_by(ReadingHistory.ReadAt.desc()).first()
+    nav = get_nav(manga_id_str, history.ChapterId if history else None)
     if history:
-        chap = db.session.get(Chapter, history.ChapterId)
-        return chap, chap.TranslatedLang if chap else (None, None)
-    return get_first_chapter(manga_id_str, 'en') or get_first_chapter(manga_id_str, 'vi'), 'en'
+        lang = nav.lang_of(history.ChapterId)
+        if lang:
+            return str(history.ChapterId).lower(), lang
+    return nav.first('en'), 'en'
 
 def get_chapter(manga_id, chapter_id):
     manga_id_str = str(manga_id)
@@ -146,41 +63,13 @@ def get_chapter(manga_id, chapter_id):
         Chapter.IsUnavailable == False
     ).first()
 
-def get_next_chapter(manga_id, current_num, lang):
-    manga_id_str = str(manga_id)
-    fallback_lang = 'vi' if lang == 'en' else 'en'
-    next_chap = db.session.query(Chapter).filter(
-        Chapter.MangaId == manga_id_str,
-        Chapter.ChapterNumber > current_num,
-        Chapter.TranslatedLang == lang,
-        Chapter.IsUnavailable == False
-    ).order_by(Chapter.ChapterNumber.asc()).first()
-    if not next_chap:
-        next_chap = db.session.query(Chapter).filter(
-            Chapter.MangaId == manga_id_str,
-            Chapter.ChapterNumber > current_num,
-            Chapter.TranslatedLang == fallback_lang,
-            Chapter.IsUnavailable == False
-        ).order_by(Chapter.ChapterNumber.asc()).first()
-    return next_chap
+def get_next_chapter_id(manga_id, chapter_id, lang):
+    """Chapter đọc tiếp theo sau `chapter_id` (theo SortKey), ưu tiên `lang` rồi tới ngôn ngữ còn lại."""
+    return get_nav(manga_id, chapter_id).next(chapter_id, lang)
 
-def get_prev_chapter(manga_id, current_num, lang):
-    manga_id_str = str(manga_id)
-    fallback_lang = 'vi' if lang == 'en' else 'en'
-    prev_chap = db.session.query(Chapter).filter(
-        Chapter.MangaId == manga_id_str,
-        Chapter.ChapterNumber < current_num,
-        Chapter.TranslatedLang == lang,
-        Chapter.IsUnavailable == False
-    ).order_by(Chapter.ChapterNumber.desc()).first()
-    if not prev_chap:
-        prev_chap = db.session.query(Chapter).filter(
-            Chapter.MangaId == manga_id_str,
-            Chapter.ChapterNumber < current_num,
-            Chapter.TranslatedLang == fallback_lang,
-            Chapter.IsUnavailable == False
-        ).order_by(Chapter.ChapterNumber.desc()).first()
-    return prev_chap
+def get_prev_chapter_id(manga_id, chapter_id, lang):
+    """Chapter ngay trước `chapter_id` (theo SortKey), ưu tiên `lang` rồi tới ngôn ngữ còn lại."""
+    return get_nav(manga_id, chapter_id).prev(chapter_id, lang)
 
 def save_reading_history(user_id, manga_id, chapter_id, last_page):
     manga_id_str = str(manga_id)
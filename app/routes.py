@@ -1,22 +1,27 @@
-import base64
-from io import BytesIO
 import shutil
-from flask import Blueprint, abort, flash, jsonify, redirect, render_template, request, send_file, url_for
-from flask_login import current_user, login_required
 from datetime import datetime
-from dateutil.relativedelta import relativedelta  # Sử dụng relativedelta để tính chính xác hơn timedelta(months=4)
-import requests
-from sqlalchemy import case, desc, func, or_
-from flask_paginate import Pagination
+from flask import Blueprint, abort, flash, jsonify, redirect, render_template, request, url_for
+from flask_login import current_user, login_required
+from sqlalchemy import desc, func
 
 from werkzeug.security import generate_password_hash
 
 from app.comment_routes import now
+from app.cover_controller import default_cover_url, enqueue_cover_fetch, get_art_covers, get_cover_urls, image_response, load_cover_bytes, manga_cover_url
+from app.cover_store import COVER_VARIANTS, ORIGINAL, store_cover
+from app.facet_cache import get_options
+from app.creator_index import creator_index
+from app.facet_index import facet_index
+from app.feed_index import feed_index
+from app.mangadex_client import get_client
+from app.pagination import CursorPagination, ListPagination, decode_cursor, encode_cursor, keyset_paginate
+from app.rating_controller import get_user_scores
+from app.search_index import search_index
+from app.suggest_index import suggest_index
 from app.reader_controller import get_available_langs
 from .models import Chapter, Cover, Creator, List, Manga, MangaAltTitle, MangaCover, MangaDescription, MangaLink, MangaRelated, MangaStatistics, MangaTag, Rating, Report, Tag, Comment
 from . import db
 import os
-import uuid
 
 from app.models import ListManga
 
@@ -27,33 +32,35 @@ manga = Blueprint('manga', __name__)
 # Helper
 # ======================
 
-BASE_URL = "https://api.mangadex.org"
-
 # Helper: fetch cover từ MangaDex nếu DB chưa có
 def fetch_and_store_covers(manga_id):
+    client = get_client()
     limit, offset = 100, 0
     while True:
         params = {"manga[]": manga_id, "limit": limit, "offset": offset}
-        resp = requests.get(f"{BASE_URL}/cover", params=params)
-        resp.raise_for_status()
-        data = resp.json()
+        # chạy trong request của người đọc: interactive, không chờ limiter / retry lâu
+        data = client.api_get("/cover", params=params, interactive=True)
 
         if not data.get("data"):
             break
 
+        # kiểm tra tồn tại cho cả trang bằng một query chỉ lấy cover_id
+        page_ids = [item["id"] for item in data["data"]]
+        existing = {str(cid).lower() for (cid,) in db.session.query(Cover.cover_id).filter(Cover.cover_id.in_(page_ids)).all()}
+
         for item in data["data"]:
             cid = item["id"]
             attrs = item.get("attributes", {})
             filename = attrs.get("fileName")
-            url = f"https://uploads.mangadex.org/covers/{manga_id}/{filename}"
+            url = client.cover_url(manga_id, filename)
 
             # nếu chưa có trong DB thì insert
-            if not Cover.query.get(cid):
-                image_data = None
+            if str(cid).lower() not in existing:
+                digest = None
                 try:
-                    img_resp = requests.get(url)
+                    img_resp = client.download(url, interactive=True)
                     if img_resp.status_code == 200:
-                        image_data = img_resp.content
+                        digest = store_cover(img_resp.content)
                 except:
                     pass
 
@@ -70,7 +77,7 @@ def fetch_and_store_covers(manga_id):
                     version=attrs.get("version"),
                     rel_user_id=None,
                     url=url,
-                    image_data=image_data
+                    content_hash=digest
                 )
                 db.session.add(cover)
 
@@ -124,90 +131,55 @@ def resolve_manga_links(manga_id):
     return resolved_links
 
 
-@main.route('/')
-@main.route('/home')
-def home():
-    # Tính thời gian 4 tháng trước (dùng relativedelta, dựa trên thời gian thực tế 02:50 AM +07, 21/09/2025)
-    current_date = datetime(2025, 9, 21, 2, 50)  # Cập nhật theo thời gian hiện tại
-    four_months_ago = current_date - relativedelta(months=4)
-
-    # Query: Join Manga với MangaStatistics, filter UpdatedAt >= 4 tháng trước,
-    # loại bỏ null ở các cột required, order by Follows desc, paginate 10/page
-    page = request.args.get('page', 1, type=int)
-    query = (
-        db.session.query(Manga)
-        .join(MangaStatistics)
-        .filter(
-            Manga.UpdatedAt >= four_months_ago,
-            Manga.TitleEn.isnot(None),
-            Manga.ContentRating.isnot(None),
-            Manga.PublicationDemographic.isnot(None),
-            Manga.Status.isnot(None),
-            Manga.Year.isnot(None),
-            MangaStatistics.Follows.isnot(None),
-            MangaStatistics.AverageRating.isnot(None)
-        )
-        .order_by(MangaStatistics.Follows.desc())
-        .paginate(page=page, per_page=10, error_out=False)
-    )
+def feed_page(feed, per_page=10, only=None):
+    """
+    Đọc một trang từ feed_index và hydrate Manga của trang đó bằng một query IN.
+    Mặc định phân trang bằng cursor (?cursor=...); ?page=N vẫn được hỗ trợ cho link cũ.
+    Trả về (danh sách dict cho template, pagination).
+    """
+    if 'page' in request.args:
+        page = max(request.args.get('page', 1, type=int), 1)
+        entries, total = feed_index.page(feed, page, per_page, only=only)
+        pagination = ListPagination(None, page, per_page, total)
+    else:
+        direction, values = decode_cursor(request.args.get('cursor'))
+        entries, keys, start, total = feed_index.seek(feed, values, per_page, reverse=direction == 'prev', only=only)
+        next_cursor = encode_cursor('next', keys[-1]) if keys and start + len(keys) < total else None
+        prev_cursor = encode_cursor('prev', keys[0]) if keys and start > 0 else None
+        pagination = CursorPagination(None, per_page, next_cursor, prev_cursor, total, first=start + 1)
 
-    mangas = query.items
-    pagination = query
+    page_ids = [e.manga_id for e in entries]
+    by_id = {str(m.MangaId).lower(): m for m in Manga.query.filter(Manga.MangaId.in_(page_ids)).all()} if page_ids else {}
 
-    # Lấy URL cover cho mỗi manga từ bảng MangaCover
-    manga_data = []
-    for manga in mangas:
-        stats = manga.stats[0] if manga.stats else None
-        if not stats:
-            continue  # Skip nếu không có stats
-
-        # Tra cứu trong MangaCover theo MangaId, sắp xếp theo DownloadDate gần nhất
-        cover = MangaCover.query.filter_by(MangaId=manga.MangaId).order_by(MangaCover.DownloadDate.desc()).first()
-        if cover:
-            # Chuyển đổi ImageData thành URL base64 để nhúng vào HTML
-            image_data = base64.b64encode(cover.ImageData).decode('utf-8')
-            cover_url = f"data:image/jpeg;base64,{image_data}"  # Giả sử định dạng là JPEG, điều chỉnh nếu cần
-        else:
-            # Nếu không tìm thấy, tải ảnh và lưu vào bảng
-            cover_info = get_cover_info(str(manga.MangaId).lower())
-            if cover_info:
-                manga_id = cover_info['manga_id']
-                cover_id = cover_info['cover_id']
-                file_name = cover_info['file_name']
-                image_url = f"https://uploads.mangadex.org/covers/{manga_id}/{file_name}"
-                try:
-                    response = requests.get(image_url, stream=True)
-                    response.raise_for_status()
-                    image_data = response.content
-                    new_cover = MangaCover(
-                        MangaId=manga.MangaId,
-                        CoverId=cover_id,
-                        FileName=file_name,
-                        ImageData=image_data
-                    )
-                    db.session.add(new_cover)
-                    db.session.commit()
-                    # Chuyển đổi ImageData mới thành URL base64
-                    image_data = base64.b64encode(image_data).decode('utf-8')
-                    cover_url = f"data:image/jpeg;base64,{image_data}"
-                except Exception as e:
-                    print(f"Error downloading cover for {manga_id}: {e}")
-                    cover_url = url_for('static', filename='assets/default_cover.png')
-            else:
-                cover_url = url_for('static', filename='assets/default_cover.png')
-        
-        your_score = None
-        if current_user.is_authenticated:
-            r = Rating.query.filter_by(UserId=current_user.UserId, MangaId=manga.MangaId).first()
-            if r:
-                your_score = int(r.Score)
+    missing = [e.manga_id for e in entries if not e.cover_id]
+    cover_urls = get_cover_urls(missing) if missing else {}
+    your_scores = get_user_scores(page_ids)
 
-        manga_data.append({
+    mangas = []
+    for entry in entries:
+        manga = by_id.get(str(entry.manga_id).lower())
+        if manga is None:
+            continue  # đã bị xoá sau lần build index gần nhất
+        if entry.cover_id:
+            cover_url = manga_cover_url(entry.manga_id, entry.cover_id)
+        else:
+            cover_url = cover_urls[entry.manga_id]
+        mangas.append({
             'manga': manga,
-            'stats': stats,
             'cover_url': cover_url,
-            'your_score': your_score
+            'stats': {'AverageRating': entry.average_rating, 'Follows': entry.follows},
+            'your_score': your_scores.get(entry.manga_id)
         })
+    pagination.items = mangas
+    return mangas, pagination
+
+
+@main.route('/')
+@main.route('/home')
+def home():
+    # Manga hot (cập nhật trong 4 tháng, đủ thông tin, order by Follows desc), 10/page,
+    # đọc từ feed index dựng sẵn thay vì join + sort mỗi request
+    manga_data, pagination = feed_page('hot')
 
     return render_template('home.html', mangas=manga_data, pagination=pagination, is_authenticated=current_user.is_authenticated)
 
@@ -218,55 +190,17 @@ def search():
     if not title:
         return jsonify([])
 
-    # Step 1: Create a subquery to find unique Manga IDs matching the title
-    matching_manga_ids_subquery = db.session.query(Manga.MangaId)\
-        .outerjoin(MangaAltTitle, Manga.MangaId == MangaAltTitle.MangaId)\
-        .filter(or_(Manga.TitleEn.ilike(f"%{title}%"), MangaAltTitle.AltTitle.ilike(f"%{title}%")))\
-        .group_by(Manga.MangaId)\
-        .subquery()
+    # Step 1: Tìm MangaId theo search index (title, alt title, description; prefix + gõ sai), đã xếp hạng
+    manga_ids = search_index.search(title, limit=5)
 
-    # Step 2: Query for the full Manga objects using the IDs from the subquery
-    mangas = db.session.query(Manga)\
-        .join(matching_manga_ids_subquery, Manga.MangaId == matching_manga_ids_subquery.c.MangaId)\
-        .join(MangaStatistics, Manga.MangaId == MangaStatistics.MangaId)\
-        .order_by(desc(MangaStatistics.Follows))\
-        .limit(5).all()
+    # Step 2: Query for the full Manga objects, giữ nguyên thứ tự xếp hạng
+    by_id = {m.MangaId: m for m in Manga.query.filter(Manga.MangaId.in_(manga_ids)).all()} if manga_ids else {}
+    mangas = [by_id[mid] for mid in manga_ids if mid in by_id]
 
+    cover_urls = get_cover_urls([m.MangaId for m in mangas])
     results = []
     for m in mangas:
-        # --- BẮT ĐẦU THAY ĐỔI TẠI ĐÂY ---
-        # Logic lấy ảnh bìa, nếu không có thì tải về
-        cover = MangaCover.query.filter_by(MangaId=m.MangaId).order_by(MangaCover.DownloadDate.desc()).first()
-        if cover:
-            image_data_b64 = base64.b64encode(cover.ImageData).decode('utf-8')
-            cover_url = f"data:image/jpeg;base64,{image_data_b64}"
-        else:
-            cover_info = get_cover_info(str(m.MangaId).lower())
-            if cover_info:
-                manga_id_str = cover_info['manga_id']
-                cover_id_str = cover_info['cover_id']
-                file_name_str = cover_info['file_name']
-                image_url = f"https://uploads.mangadex.org/covers/{manga_id_str}/{file_name_str}"
-                try:
-                    response = requests.get(image_url, stream=True)
-                    response.raise_for_status()
-                    image_data = response.content
-                    new_cover = MangaCover(
-                        MangaId=m.MangaId,
-                        CoverId=uuid.UUID(cover_id_str),
-                        FileName=file_name_str,
-                        ImageData=image_data
-                    )
-                    db.session.add(new_cover)
-                    db.session.commit()
-                    image_data_b64 = base64.b64encode(image_data).decode('utf-8')
-                    cover_url = f"data:image/jpeg;base64,{image_data_b64}"
-                except Exception as e:
-                    print(f"Error downloading cover for {manga_id_str}: {e}")
-                    cover_url = url_for('static', filename='assets/default_cover.png')
-            else:
-                cover_url = url_for('static', filename='assets/default_cover.png')
-        # --- KẾT THÚC THAY ĐỔI ---
+        cover_url = cover_urls[m.MangaId]
 
         stats = MangaStatistics.query.filter_by(MangaId=m.MangaId).first()
         rating = stats.AverageRating if stats and stats.AverageRating else stats.BayesianRating if stats else 0
@@ -283,25 +217,25 @@ def search():
 
     return jsonify(results)
 
-def get_cover_info(manga_id):
-    """Lấy thông tin cover từ API Mangadex, bao gồm cover_id."""
-    api_url = "https://api.mangadex.org/cover"
-    params = {"manga[]": manga_id, "limit": 1}
-    headers = {"Referer": "https://mangadex.org"}
-    try:
-        resp = requests.get(api_url, params=params, headers=headers)
-        resp.raise_for_status()
-        data = resp.json()
-        if data.get("data"):
-            cover = data["data"][0]
-            file_name = cover["attributes"]["fileName"]
-            cover_id = cover["id"]
-            return {"manga_id": manga_id, "cover_id": cover_id, "file_name": file_name}
-    except Exception as e:
-        print(f"Error fetching cover info for {manga_id}: {e}")
-        pass
-    return None
+@main.route('/search/suggest', methods=['GET'])
+def search_suggest():
+    """Typeahead cho navbar: đọc hoàn toàn từ suggest_index trong bộ nhớ, không query DB."""
+    q = request.args.get('q', '').strip()
+    limit = max(1, min(request.args.get('limit', 8, type=int), 20))
+    if not q:
+        return jsonify([])
 
+    results = []
+    for entry in suggest_index.suggest(q, limit=limit):
+        results.append({
+            'id': str(entry.manga_id),
+            'title': entry.title,
+            'thumbnail_url': manga_cover_url(entry.manga_id, entry.cover_id) if entry.cover_id else default_cover_url(),
+            'rating': entry.rating,
+            'follows': entry.follows,
+            'status': entry.status or 'Unknown'
+        })
+    return jsonify(results)
 
 @main.route("/require-login")
 def require_login():
@@ -320,14 +254,8 @@ def advanced_search_options():
     return jsonify(load_options())
 
 def load_options():
-    return {
-        'tags': [(tag.TagId, tag.GroupName, tag.NameEn) for tag in db.session.query(Tag.TagId, Tag.GroupName, Tag.NameEn).distinct().all()],
-        'ratings': [(r[0],) for r in db.session.query(Manga.ContentRating).distinct().all() if r[0]],
-        'demographics': [(d[0],) for d in db.session.query(Manga.PublicationDemographic).distinct().all() if d[0]],
-        'original_langs': [(l[0],) for l in db.session.query(Manga.OriginalLanguage).distinct().all() if l[0]],
-        'translated_langs': [(l[0],) for l in db.session.query(Chapter.TranslatedLang).distinct().all() if l[0]],
-        'statuses': [(s[0],) for s in db.session.query(Manga.Status).distinct().all() if s[0]]
-    }
+    # facet option + số manga, lấy từ cache trong bộ nhớ (TTL, invalidate khi ingestion ghi dữ liệu mới)
+    return get_options()
 
 
 @main.route('/advanced_search', methods=['GET', 'POST'])
@@ -335,6 +263,7 @@ def advanced_search():
     options = load_options()
     mangas = None
     pagination = None
+    search_args = {}
     your_scores = {}
 
     if request.method == 'POST' or request.args:
@@ -353,134 +282,83 @@ def advanced_search():
         has_translated = request.form.get('has_translated') == 'on' or request.args.get('has_translated') == 'on'
         translated_langs = request.form.getlist('translated_langs') or request.args.getlist('translated_langs')
 
-        # --- BẮT ĐẦU PHẦN SỬA ĐỔI ---
-        # BƯỚC 1: Xây dựng truy vấn để lấy các MangaId duy nhất.
-        # Truy vấn này chỉ chọn các cột cần thiết cho việc lọc, sắp xếp và phân trang.
-        query_ids = db.session.query(
-            Manga.MangaId,
-            Manga.TitleEn,
-            Manga.Year,
-            MangaStatistics.Follows,
-            MangaStatistics.AverageRating
-        ).outerjoin(MangaStatistics).outerjoin(MangaAltTitle)
-
-        # Áp dụng các bộ lọc như cũ
+        # BƯỚC 1: Lọc hoàn toàn trong bộ nhớ bằng facet_index (bitmap cho mỗi giá trị facet).
+        # Cả truy vấn chạy trên một snapshot để bitmap và thứ hạng cùng một cách đánh số doc
+        facets = facet_index.snapshot()
+        restrict = None
+        ranked_ids = None
         if search_query:
-            query_ids = query_ids.filter(or_(Manga.TitleEn.ilike(f'%{search_query}%'), MangaAltTitle.AltTitle.ilike(f'%{search_query}%')))
-        if include_tags:
-            query_ids = query_ids.join(MangaTag).filter(MangaTag.TagId.in_(include_tags))
-        if exclude_tags:
-            exclude_mangas = db.session.query(MangaTag.MangaId).filter(MangaTag.TagId.in_(exclude_tags)).distinct().subquery()
-            query_ids = query_ids.filter(~Manga.MangaId.in_(exclude_mangas))
-        if content_ratings:
-            query_ids = query_ids.filter(Manga.ContentRating.in_(content_ratings))
-        if demographics:
-            query_ids = query_ids.filter(Manga.PublicationDemographic.in_(demographics))
-        if authors and any(a.strip() for a in authors):
-            query_ids = query_ids.join(Creator).filter(Creator.Name.ilike(f'%{authors[0].strip()}%'))
-        if artists and any(a.strip() for a in artists):
-            query_ids = query_ids.join(Creator).filter(Creator.Name.ilike(f'%{artists[0].strip()}%'))
-        if original_langs:
-            query_ids = query_ids.filter(Manga.OriginalLanguage.in_(original_langs))
+            # lấy mọi kết quả: lọc / phân trang làm trên bitmap nên không cần cắt bớt
+            ranked_ids = search_index.search(search_query, limit=None)
+            restrict = facets.bitmap_for(ranked_ids)
+        # authors / artists: nhiều tên cách nhau bởi dấu phẩy, khớp prefix theo từng từ trong tên;
+        # trong một ô là OR, giữa ô authors và ô artists là AND
+        for field in (authors, artists):
+            names = [name.strip() for name in field if name.strip()]
+            if names:
+                creator_bits = facets.bitmap_for(creator_index.manga_ids_for_names(names))
+                restrict = creator_bits if restrict is None else restrict & creator_bits
+        year_range = None
         if year_from or year_to:
             from_year = int(year_from) if year_from else 0
             to_year = int(year_to) if year_to else 9999
-            query_ids = query_ids.filter(Manga.Year.between(min(from_year, to_year), max(from_year, to_year)))
-        if statuses:
-            query_ids = query_ids.filter(Manga.Status.in_(statuses))
-        if has_translated and translated_langs:
-            query_ids = query_ids.join(Chapter).filter(Chapter.TranslatedLang.in_(translated_langs))
-
-        # Thêm biểu thức CASE vào SELECT để nó có thể được sử dụng trong ORDER BY với DISTINCT
-        if sort_by == 'Rating DESC' or sort_by == 'Follows DESC':
-            # Sử dụng label để có thể tham chiếu đến cột này trong ORDER BY
-            query_ids = query_ids.add_columns(case((MangaStatistics.Follows.is_(None), 1), else_=0).label('sort_helper'))
-
-        # Sử dụng distinct() trên truy vấn ID
-        query_ids = query_ids.distinct()
-
-        # Áp dụng sắp xếp trên truy vấn ID
-        if sort_by == 'Title ASC':
-            query_ids = query_ids.order_by(Manga.TitleEn.asc())
-        elif sort_by == 'Title DESC':
-            query_ids = query_ids.order_by(Manga.TitleEn.desc())
-        elif sort_by == 'Year ASC':
-            query_ids = query_ids.order_by(Manga.Year.asc())
-        elif sort_by == 'Year DESC':
-            query_ids = query_ids.order_by(Manga.Year.desc())
-        elif sort_by == 'Rating DESC':
-            # Sắp xếp theo cột ảo 'sort_helper' rồi mới đến AverageRating
-            query_ids = query_ids.order_by('sort_helper', desc(MangaStatistics.AverageRating))
-        elif sort_by == 'Follows DESC':
-            # Sắp xếp theo cột ảo 'sort_helper' rồi mới đến Follows
-            query_ids = query_ids.order_by('sort_helper', desc(MangaStatistics.Follows))
-        else: # Sắp xếp mặc định
-            query_ids = query_ids.order_by(Manga.MangaId.asc())
-
-        # Tính tổng số bản ghi trước khi phân trang
-        total = query_ids.count()
-        
-        # Phân trang
-        page = request.args.get('page', 1, type=int)
+            year_range = (min(from_year, to_year), max(from_year, to_year))
+
+        bits = facets.filter(
+            include_tags=include_tags, exclude_tags=exclude_tags,
+            content_ratings=content_ratings, demographics=demographics, statuses=statuses,
+            original_langs=original_langs,
+            translated_langs=translated_langs if has_translated else (),
+            year_range=year_range, restrict=restrict
+        )
+
+        # Phân trang keyset: ?cursor=... mang MangaId của item ở mép trang.
+        # Link trang sau/trước là GET nên mang theo toàn bộ bộ lọc dưới dạng query string.
+        direction, values = decode_cursor(request.args.get('cursor'))
+        edge = values[0] if values else None
+        search_args = {
+            'q': search_query, 'sort_by': sort_by,
+            'include_tags': include_tags, 'exclude_tags': exclude_tags,
+            'content_rating': content_ratings, 'demographic': demographics,
+            'authors': ','.join(authors), 'artists': ','.join(artists),
+            'original_langs': original_langs, 'year_from': year_from, 'year_to': year_to,
+            'status': statuses, 'translated_langs': translated_langs,
+        }
+        if has_translated:
+            search_args['has_translated'] = 'on'
+        search_args = {k: v for k, v in search_args.items() if v}
         per_page = 20
-        
-        # Lấy danh sách ID đã được phân trang
-        manga_ids_paginated = query_ids.offset((page - 1) * per_page).limit(per_page).all()
-        # manga_ids là danh sách các ID của manga trên trang hiện tại
-        manga_ids = [item.MangaId for item in manga_ids_paginated]
+        # không chọn sort thì kết quả search text giữ thứ tự độ liên quan
+        manga_ids, first_key, last_key, has_prev, has_next, total = facets.page(
+            bits, sort_by, per_page,
+            after=edge if direction == 'next' else None,
+            before=edge if direction == 'prev' else None,
+            ranked_ids=ranked_ids if sort_by in (None, '', 'None') else None
+        )
+        pagination = CursorPagination(
+            manga_ids, per_page,
+            next_cursor=encode_cursor('next', [last_key]) if has_next else None,
+            prev_cursor=encode_cursor('prev', [first_key]) if has_prev else None,
+            total=total
+        )
 
-        # BƯỚC 2: Tải lại các đối tượng đầy đủ dựa trên danh sách ID đã có
-        id_order = {id: index for index, id in enumerate(manga_ids)}
+        # BƯỚC 2: SQL chỉ hydrate đúng các manga của trang
+        id_order = {str(mid).lower(): index for index, mid in enumerate(manga_ids)}
         
         mangas_paginated_full_data = db.session.query(Manga, MangaStatistics)\
             .outerjoin(MangaStatistics)\
             .filter(Manga.MangaId.in_(manga_ids))\
-            .all()
+            .all() if manga_ids else []
 
         # Sắp xếp lại kết quả bằng Python để khớp với thứ tự đã phân trang
-        mangas_paginated_full_data.sort(key=lambda item: id_order[item[0].MangaId])
-
-        pagination = Pagination(page=page, total=total, per_page=per_page)
-        
-        # --- KẾT THÚC PHẦN SỬA ĐỔI ---
+        mangas_paginated_full_data.sort(key=lambda item: id_order[str(item[0].MangaId).lower()])
 
         # BẮT CHƯỚC LOGIC TẢI COVER TỪ /home
+        cover_urls = get_cover_urls(manga_ids)
+        your_scores = get_user_scores(manga_ids)
         mangas_with_covers = []
         for manga, stat in mangas_paginated_full_data:
-            # Tra cứu trong MangaCover theo MangaId
-            cover = MangaCover.query.filter_by(MangaId=manga.MangaId).order_by(MangaCover.DownloadDate.desc()).first()
-            if cover and cover.ImageData:
-                # Chuyển đổi ImageData thành URL base64
-                image_data = base64.b64encode(cover.ImageData).decode('utf-8')
-                cover_url = f"data:image/jpeg;base64,{image_data}"
-            else:
-                # Nếu không tìm thấy, tải ảnh và lưu vào bảng
-                cover_info = get_cover_info(str(manga.MangaId).lower())
-                if cover_info:
-                    manga_id_str = cover_info['manga_id']
-                    cover_id_str = cover_info['cover_id']
-                    file_name_str = cover_info['file_name']
-                    image_url = f"https://uploads.mangadex.org/covers/{manga_id_str}/{file_name_str}"
-                    try:
-                        response = requests.get(image_url, stream=True)
-                        response.raise_for_status()
-                        image_data = response.content
-                        new_cover = MangaCover(
-                            MangaId=manga.MangaId,
-                            CoverId=uuid.UUID(cover_id_str),
-                            FileName=file_name_str,
-                            ImageData=image_data,
-                            DownloadDate=datetime.utcnow()
-                        )
-                        db.session.add(new_cover)
-                        db.session.commit()
-                        image_data_b64 = base64.b64encode(image_data).decode('utf-8')
-                        cover_url = f"data:image/jpeg;base64,{image_data_b64}"
-                    except Exception as e:
-                        print(f"Error downloading cover for {manga_id_str}: {e}")
-                        cover_url = url_for('static', filename='assets/default_cover.png')
-                else:
-                    cover_url = url_for('static', filename='assets/default_cover.png')
+            cover_url = cover_urls[manga.MangaId]
 
             score = your_scores.get(manga.MangaId, 'N/A')
             mangas_with_covers.append({
@@ -492,75 +370,16 @@ def advanced_search():
         
         mangas = mangas_with_covers
 
-        if current_user.is_authenticated:
-            ratings = db.session.query(Rating.MangaId, Rating.Score).filter_by(UserId=current_user.UserId).all()
-            your_scores = dict(ratings)
-
         if year_from and year_to and int(year_from) > int(year_to):
             flash('warning', 'Swapped years for valid range.')
 
-    return render_template('advanced_search.html', options=options, mangas=mangas, pagination=pagination, your_scores=your_scores)
+    return render_template('advanced_search.html', options=options, mangas=mangas, pagination=pagination, search_args=search_args, your_scores=your_scores)
 
 
 @main.route('/recently_added')
 def recently_added():
-    page = request.args.get('page', 1, type=int)
-    per_page = 10
-    manga_query = db.session.query(Manga, MangaCover.ImageData, MangaStatistics.AverageRating, MangaStatistics.Follows)\
-        .outerjoin(MangaCover, Manga.MangaId == MangaCover.MangaId)\
-        .outerjoin(MangaStatistics, Manga.MangaId == MangaStatistics.MangaId)\
-        .order_by(Manga.CreatedAt.desc())
-    
-    pagination = manga_query.paginate(page=page, per_page=per_page, error_out=False)
-    mangas = []
-    
-    for item in pagination.items:
-        manga, image_data, avg_rating, follows = item
-        cover_url = url_for('static', filename='assets/default_cover.png')
-        
-        if image_data:
-            # Convert ImageData to base64 URL
-            image_data_b64 = base64.b64encode(image_data).decode('utf-8')
-            cover_url = f"data:image/jpeg;base64,{image_data_b64}"
-        else:
-            # Fetch cover from MangaDex API if not in MangaCover
-            cover_info = get_cover_info(str(manga.MangaId).lower())
-            if cover_info:
-                manga_id_str = cover_info['manga_id']
-                cover_id_str = cover_info['cover_id']
-                file_name_str = cover_info['file_name']
-                image_url = f"https://uploads.mangadex.org/covers/{manga_id_str}/{file_name_str}"
-                try:
-                    response = requests.get(image_url, stream=True)
-                    response.raise_for_status()
-                    image_data = response.content
-                    new_cover = MangaCover(
-                        MangaId=manga.MangaId,
-                        CoverId=uuid.UUID(cover_id_str),
-                        FileName=file_name_str,
-                        ImageData=image_data,
-                        DownloadDate=datetime.utcnow()
-                    )
-                    db.session.add(new_cover)
-                    db.session.commit()
-                    image_data_b64 = base64.b64encode(image_data).decode('utf-8')
-                    cover_url = f"data:image/jpeg;base64,{image_data_b64}"
-                except Exception as e:
-                    print(f"Error downloading cover for {manga_id_str}: {e}")
-        
-        your_score = None
-        if current_user.is_authenticated:
-            r = Rating.query.filter_by(UserId=current_user.UserId, MangaId=manga.MangaId).first()
-            if r:
-                your_score = int(r.Score)
-        
-        mangas.append({
-            'manga': manga,
-            'cover_url': cover_url,
-            'stats': {'AverageRating': avg_rating, 'Follows': follows},
-            'your_score': your_score
-        })
-    
+    mangas, pagination = feed_page('recent')
+
     return render_template(
         'recently_added.html',
         mangas=mangas,
@@ -570,62 +389,8 @@ def recently_added():
 
 @main.route('/latest_updates')
 def latest_updates():
-    page = request.args.get('page', 1, type=int)
-    per_page = 10
-    manga_query = db.session.query(Manga, MangaCover.ImageData, MangaStatistics.AverageRating, MangaStatistics.Follows)\
-        .outerjoin(MangaCover, Manga.MangaId == MangaCover.MangaId)\
-        .outerjoin(MangaStatistics, Manga.MangaId == MangaStatistics.MangaId)\
-        .order_by(Manga.UpdatedAt.desc())
-    
-    pagination = manga_query.paginate(page=page, per_page=per_page, error_out=False)
-    mangas = []
-    
-    for item in pagination.items:
-        manga, image_data, avg_rating, follows = item
-        cover_url = url_for('static', filename='assets/default_cover.png')
-        
-        if image_data:
-            # Convert ImageData to base64 URL
-            image_data_b64 = base64.b64encode(image_data).decode('utf-8')
-            cover_url = f"data:image/jpeg;base64,{image_data_b64}"
-        else:
-            # Fetch cover from MangaDex API if not in MangaCover
-            cover_info = get_cover_info(str(manga.MangaId).lower())
-            if cover_info:
-                manga_id_str = cover_info['manga_id']
-                cover_id_str = cover_info['cover_id']
-                file_name_str = cover_info['file_name']
-                image_url = f"https://uploads.mangadex.org/covers/{manga_id_str}/{file_name_str}"
-                try:
-                    response = requests.get(image_url, stream=True)
-                    response.raise_for_status()
-                    image_data = response.content
-                    new_cover = MangaCover(
-                        MangaId=manga.MangaId,
-                        CoverId=uuid.UUID(cover_id_str),
-                        FileName=file_name_str,
-                        ImageData=image_data,
-                        DownloadDate=datetime.utcnow()
-                    )
-                    db.session.add(new_cover)
-                    db.session.commit()
-                    image_data_b64 = base64.b64encode(image_data).decode('utf-8')
-                    cover_url = f"data:image/jpeg;base64,{image_data_b64}"
-                except Exception as e:
-                    print(f"Error downloading cover for {manga_id_str}: {e}")
-        
-        your_score = None
-        if current_user.is_authenticated:
-            rating = Rating.query.filter_by(UserId=current_user.UserId, MangaId=manga.MangaId).first()
-            your_score = rating.Score if rating else None
-        
-        mangas.append({
-            'manga': manga,
-            'cover_url': cover_url,
-            'stats': {'AverageRating': avg_rating, 'Follows': follows},
-            'your_score': your_score
-        })
-    
+    mangas, pagination = feed_page('latest')
+
     return render_template(
         'latest_updates.html',
         mangas=mangas,
@@ -648,68 +413,15 @@ def updates():
     if not current_user.is_authenticated:
         return render_template("require_login.html", title="Updates")
 
-    page = request.args.get("page", 1, type=int)
-    per_page = 10
-
-    # Chỉ lấy Manga có trong các list của user hiện tại
-    manga_query = (
-        db.session.query(Manga, MangaCover.ImageData, MangaStatistics.AverageRating, MangaStatistics.Follows)
-        .join(ListManga, ListManga.MangaId == Manga.MangaId)
+    # Chỉ lấy Manga có trong các list của user hiện tại, theo thứ tự của feed 'latest'
+    list_manga_ids = [
+        mid for (mid,) in db.session.query(ListManga.MangaId)
         .join(List, List.ListId == ListManga.ListId)
-        .outerjoin(MangaCover, Manga.MangaId == MangaCover.MangaId)
-        .outerjoin(MangaStatistics, Manga.MangaId == MangaStatistics.MangaId)
         .filter(List.UserId == current_user.UserId)
-        .order_by(Manga.UpdatedAt.desc())
-    )
-
-    pagination = manga_query.paginate(page=page, per_page=per_page, error_out=False)
-    mangas = []
-
-    for item in pagination.items:
-        manga, image_data, avg_rating, follows = item
-        cover_url = url_for("static", filename="assets/default_cover.png")
-
-        if image_data:
-            image_data_b64 = base64.b64encode(image_data).decode("utf-8")
-            cover_url = f"data:image/jpeg;base64,{image_data_b64}"
-        else:
-            cover_info = get_cover_info(str(manga.MangaId).lower())
-            if cover_info:
-                manga_id_str = cover_info["manga_id"]
-                cover_id_str = cover_info["cover_id"]
-                file_name_str = cover_info["file_name"]
-                image_url = f"https://uploads.mangadex.org/covers/{manga_id_str}/{file_name_str}"
-                try:
-                    response = requests.get(image_url, stream=True)
-                    response.raise_for_status()
-                    image_data = response.content
-                    new_cover = MangaCover(
-                        MangaId=manga.MangaId,
-                        CoverId=uuid.UUID(cover_id_str),
-                        FileName=file_name_str,
-                        ImageData=image_data,
-                        DownloadDate=datetime.utcnow(),
-                    )
-                    db.session.add(new_cover)
-                    db.session.commit()
-                    image_data_b64 = base64.b64encode(image_data).decode("utf-8")
-                    cover_url = f"data:image/jpeg;base64,{image_data_b64}"
-                except Exception as e:
-                    print(f"Error downloading cover for {manga_id_str}: {e}")
-
-        your_score = None
-        if current_user.is_authenticated:
-            rating = Rating.query.filter_by(UserId=current_user.UserId, MangaId=manga.MangaId).first()
-            your_score = rating.Score if rating else None
-
-        mangas.append(
-            {
-                "manga": manga,
-                "cover_url": cover_url,
-                "stats": {"AverageRating": avg_rating, "Follows": follows},
-                "your_score": your_score,
-            }
-        )
+        .distinct()
+        .all()
+    ]
+    mangas, pagination = feed_page("latest", only=list_manga_ids)
 
     return render_template(
         "updates.html",
@@ -755,7 +467,7 @@ def manga_detail(manga_id):
         print(f"Manga not found: {manga_id_str}")
         return render_template('error.html', message='Manga not found'), 404
 
-    # Check DB directly (tránh gọi sync_chapters khi render)
+    # Check DB directly (tránh gọi MangaDex khi render)
     has_chapters = db.session.query(Chapter).filter(
         Chapter.MangaId == manga_id_str,
         Chapter.IsUnavailable == False
@@ -763,14 +475,10 @@ def manga_detail(manga_id):
 
     print(f"has_chapters for manga {manga_id_str}: {has_chapters}")  # Debug
 
-    # --- cover logic (as in your original file) ---
-    cover = MangaCover.query.filter_by(MangaId=manga_id).order_by(MangaCover.DownloadDate.desc()).first()
-
-    if not cover:
-        # keep fallback logic from your project (use default cover)
-        manga_cover_url = url_for('static', filename='assets/default_cover.png')
-    else:
-        manga_cover_url = f"data:image/jpeg;base64,{base64.b64encode(cover.ImageData).decode('utf-8')}" if cover else url_for('static', filename='assets/default_cover.png')
+    # --- cover logic: trỏ tới endpoint ảnh bìa thay vì nhúng base64 ---
+    cover_id = db.session.query(MangaCover.CoverId).filter(MangaCover.MangaId == manga_id)\
+        .order_by(MangaCover.DownloadDate.desc()).limit(1).scalar()
+    cover_url = manga_cover_url(manga.MangaId, cover_id, size='medium') if cover_id else default_cover_url()
 
     manga_stats = MangaStatistics.query.filter_by(MangaId=manga_id).first()
 
@@ -806,21 +514,9 @@ def manga_detail(manga_id):
 
     alt_titles = MangaAltTitle.query.filter_by(MangaId=manga_id).all()
 
-    # --- COMMENTS: get current sort & page from querystring ---
+    # --- COMMENTS: get current sort & cursor from querystring ---
     sort = request.args.get('sort', 'newest')
-    page = request.args.get('page', 1, type=int)
-    per_page = 10
-
-    comments_query = Comment.query.filter_by(MangaId=str(manga_id), IsDeleted=False)
-
-    if sort == 'oldest':
-        comments_query = comments_query.order_by(Comment.CreatedAt.asc())
-    elif sort == 'most_liked':
-        comments_query = comments_query.order_by(Comment.LikeCount.desc(), Comment.CreatedAt.desc())
-    else:  # newest
-        comments_query = comments_query.order_by(Comment.CreatedAt.desc())
-
-    comments_pagination = comments_query.paginate(page=page, per_page=per_page, error_out=False)
+    comments_pagination = paginate_comments(manga_id, sort)
     comments = comments_pagination.items
 
     tab_contents = {
@@ -832,7 +528,7 @@ def manga_detail(manga_id):
 
     return render_template('manga_detail.html',
                            manga=manga,
-                           manga_cover_url=manga_cover_url,
+                           manga_cover_url=cover_url,
                            manga_stats=manga_stats,
                            content_tags=content_tags,
                            manga_description=manga_description,
@@ -854,6 +550,38 @@ def manga_detail(manga_id):
 # ======================
 # Comment helpers
 # ======================
+
+# Thứ tự sort của comments, cột cuối (CommentId) để phá hoà cho keyset.
+# CreatedAt cho phép NULL: keyset cần expression không NULL nên coi NULL là mốc rất cũ
+COMMENT_NULL_CREATED_AT = datetime(1900, 1, 1)
+_comment_created_at = func.coalesce(Comment.CreatedAt, COMMENT_NULL_CREATED_AT)
+COMMENT_ORDERS = {
+    'newest': [(_comment_created_at, True), (Comment.CommentId, True)],
+    'oldest': [(_comment_created_at, False), (Comment.CommentId, False)],
+    'most_liked': [(func.coalesce(Comment.LikeCount, 0), True), (_comment_created_at, True), (Comment.CommentId, True)],
+}
+
+
+def paginate_comments(manga_id, sort, per_page=10):
+    """
+    Comments của manga theo `sort`, phân trang bằng cursor (?cursor=...).
+    ?page=N vẫn chạy kiểu OFFSET cho link cũ.
+    """
+    comments_query = Comment.query.filter_by(MangaId=str(manga_id), IsDeleted=False)
+    order = COMMENT_ORDERS.get(sort, COMMENT_ORDERS['newest'])
+
+    if 'page' in request.args:
+        page = request.args.get('page', 1, type=int)
+        comments_query = comments_query.order_by(*[expr.desc() if descending else expr.asc() for expr, descending in order])
+        return comments_query.paginate(page=page, per_page=per_page, error_out=False)
+
+    if sort == 'most_liked':
+        key_of = lambda c: (c.LikeCount or 0, c.CreatedAt or COMMENT_NULL_CREATED_AT, c.CommentId)
+    else:
+        key_of = lambda c: (c.CreatedAt or COMMENT_NULL_CREATED_AT, c.CommentId)
+    return keyset_paginate(comments_query, order, key_of, per_page, cursor=request.args.get('cursor'))
+
+
 def serialize_comment(c):
     user = c.user
     username = user.Username if user else "Unknown"
@@ -899,19 +627,7 @@ def comments(manga_id):
     """
     # We'll reuse logic from manga_detail: fetch comments sorted/paginated
     sort = request.args.get('sort', 'newest')
-    page = request.args.get('page', 1, type=int)
-    per_page = 10
-
-    comments_query = Comment.query.filter_by(MangaId=str(manga_id), IsDeleted=False)
-
-    if sort == 'oldest':
-        comments_query = comments_query.order_by(Comment.CreatedAt.asc())
-    elif sort == 'most_liked':
-        comments_query = comments_query.order_by(Comment.LikeCount.desc(), Comment.CreatedAt.desc())
-    else:
-        comments_query = comments_query.order_by(Comment.CreatedAt.desc())
-
-    comments_pagination = comments_query.paginate(page=page, per_page=per_page, error_out=False)
+    comments_pagination = paginate_comments(manga_id, sort)
     comments = comments_pagination.items
 
     return render_template('comments.html',
@@ -926,10 +642,14 @@ def comments(manga_id):
 @manga.route("/manga/<manga_id>/art", methods=["GET"])
 def manga_art(manga_id):
     # Kiểm tra DB có dữ liệu chưa
-    covers = Cover.query.filter_by(manga_id=manga_id).all()
+    covers = get_art_covers(manga_id)
     if not covers:
-        fetch_and_store_covers(manga_id)
-        covers = Cover.query.filter_by(manga_id=manga_id).all()
+        try:
+            fetch_and_store_covers(manga_id)
+        except Exception as e:
+            db.session.rollback()
+            print(f"[manga_art] Error fetching covers for {manga_id}: {e}")
+        covers = get_art_covers(manga_id)
 
     # Lấy list locale unique
     all_locales = sorted({c.locale for c in covers if c.locale})
@@ -962,10 +682,62 @@ def manga_art(manga_id):
 
 @manga.route("/cover/<cover_id>/image")
 def cover_image(cover_id):
+    # image_data là cột deferred: chỉ được load khi kho đĩa chưa có ảnh
     cover = Cover.query.get(cover_id)
-    if not cover or not cover.image_data:
+    if not cover:
         abort(404)
-    return send_file(BytesIO(cover.image_data), mimetype="image/jpeg")
+    size = request.args.get('size', ORIGINAL)
+    if size not in COVER_VARIANTS:
+        size = ORIGINAL
+
+    def save_digest(digest):
+        cover.content_hash = digest
+        cover.image_data = None
+
+    etag = f"{cover.cover_id}-{cover.version or 0}-{size}"
+    response = image_response(etag, cover.updatedAt,
+                              lambda: load_cover_bytes(cover.content_hash, size, lambda: cover.image_data, save_digest))
+    if response is None:
+        abort(404)
+    return response
+
+
+@manga.route('/<uuid:manga_id>/cover')
+@manga.route('/<uuid:manga_id>/cover/<uuid:cover_id>')
+def manga_cover(manga_id, cover_id=None):
+    """Phục vụ ảnh bìa từ MangaCover với ETag/Last-Modified/Cache-Control, trả 304 khi browser đã có."""
+    size = request.args.get('size', ORIGINAL)
+    if size not in COVER_VARIANTS:
+        size = ORIGINAL
+
+    query = db.session.query(MangaCover.CoverId, MangaCover.FileName, MangaCover.DownloadDate, MangaCover.ContentHash)\
+        .filter(MangaCover.MangaId == manga_id)
+    if cover_id:
+        query = query.filter(MangaCover.CoverId == cover_id)
+    cover = query.order_by(MangaCover.DownloadDate.desc()).first()
+    if not cover:
+        enqueue_cover_fetch(manga_id)
+        return redirect(default_cover_url())
+
+    row_filter = (
+        MangaCover.MangaId == manga_id,
+        MangaCover.CoverId == cover.CoverId,
+        MangaCover.FileName == cover.FileName
+    )
+
+    def load_blob():
+        return db.session.query(MangaCover.ImageData).filter(*row_filter).scalar()
+
+    def save_digest(digest):
+        db.session.query(MangaCover).filter(*row_filter)\
+            .update({MangaCover.ContentHash: digest, MangaCover.ImageData: None}, synchronize_session=False)
+
+    etag = f"{cover.ContentHash or cover.CoverId}-{size}"
+    response = image_response(etag, cover.DownloadDate,
+                              lambda: load_cover_bytes(cover.ContentHash, size, load_blob, save_digest))
+    if response is None:
+        return redirect(default_cover_url())
+    return response
 
 
 @manga.route('/<uuid:manga_id>/related')
@@ -980,47 +752,20 @@ def related(manga_id):
 def creator_detail(creator_id):
     creator = Creator.query.get_or_404(creator_id)
 
-    # Truy vấn các manga của tác giả, join với MangaStatistics để lấy điểm số
+    # Manga của tác giả lấy từ creator_index (CreatorRelationship), join MangaStatistics để lấy điểm số
+    manga_ids = creator_index.manga_ids_of_creator(creator_id)
     mangas_query = (
         db.session.query(Manga, MangaStatistics)
-        .join(MangaRelated, Manga.MangaId == MangaRelated.MangaId) # Join với MangaRelated.MangaId
         .join(MangaStatistics, Manga.MangaId == MangaStatistics.MangaId)
-        .filter(MangaRelated.RelatedId == creator_id) # Sửa lỗi ở đây
+        .filter(Manga.MangaId.in_(manga_ids))
         .order_by(desc(MangaStatistics.Follows)) # Mặc định sắp xếp theo lượt theo dõi
         .all()
-    )
+    ) if manga_ids else []
 
+    cover_urls = get_cover_urls([manga.MangaId for manga, _ in mangas_query])
     manga_data = []
     for manga, stats in mangas_query:
-        cover_url = url_for('static', filename='assets/default_cover.png')
-        cover = MangaCover.query.filter_by(MangaId=manga.MangaId).order_by(desc(MangaCover.DownloadDate)).first()
-
-        if cover:
-            image_data = base64.b64encode(cover.ImageData).decode('utf-8')
-            cover_url = f"data:image/jpeg;base64,{image_data}"
-        else:
-            cover_info = get_cover_info(str(manga.MangaId).lower())
-            if cover_info:
-                manga_id_str = cover_info['manga_id']
-                cover_id_str = cover_info['cover_id']
-                file_name_str = cover_info['file_name']
-                image_url = f"https://uploads.mangadex.org/covers/{manga_id_str}/{file_name_str}"
-                try:
-                    response = requests.get(image_url, stream=True)
-                    response.raise_for_status()
-                    image_data = response.content
-                    new_cover = MangaCover(
-                        MangaId=manga.MangaId,
-                        CoverId=uuid.UUID(cover_id_str),
-                        FileName=file_name_str,
-                        ImageData=image_data
-                    )
-                    db.session.add(new_cover)
-                    db.session.commit()
-                    image_data_b64 = base64.b64encode(image_data).decode('utf-8')
-                    cover_url = f"data:image/jpeg;base64,{image_data_b64}"
-                except Exception as e:
-                    print(f"Error downloading cover for {manga_id_str}: {e}")
+        cover_url = cover_urls[manga.MangaId]
 
         manga_data.append({
             'manga': manga,
@@ -1041,15 +786,13 @@ def search_creators():
     if not query or len(query) < 2:
         return jsonify([])
 
-    # Lấy 5 creator có tên khớp với truy vấn, không phân biệt chữ hoa/thường
-    creators = Creator.query.filter(
-        func.lower(Creator.Name).like(f'%{query.lower()}%')
-    ).limit(5).all()
+    # Lấy 5 creator có một từ trong tên bắt đầu bằng truy vấn (creator_index, không chạm DB)
+    creators = creator_index.search(query, limit=5)
 
     creator_list = [{
-        'creator_id': creator.CreatorId,
-        'name': creator.Name
-    } for creator in creators]
+        'creator_id': creator_id,
+        'name': name
+    } for creator_id, name in creators]
     
     return jsonify(creator_list)
 
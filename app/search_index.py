@@ -0,0 +1,254 @@
+# app/search_index.py
+# Inverted index trong bộ nhớ cho tìm kiếm manga theo TitleEn, mọi MangaAltTitle và MangaDescription.
+# Thay cho ILIKE '%q%' (leading wildcard => full scan Manga JOIN MangaAltTitle mỗi lần gõ phím):
+# - match theo token, token cuối của query được match theo prefix (gõ dở vẫn ra kết quả)
+# - token không có trong từ điển được match gần đúng (khoảng cách sửa ≤ 1, ≤ 2 với từ dài)
+# - xếp hạng theo trọng số field × idf, cộng thêm độ phổ biến (Follows)
+# Index được cập nhật từng manga khi ingestion phát signal manga_upserted.
+from bisect import bisect_left, insort
+from itertools import islice
+import math
+import re
+import unicodedata
+
+from . import db
+from .memory_index import InMemoryIndex
+from .models import Manga, MangaAltTitle, MangaDescription, MangaStatistics
+from .signals import manga_upserted
+
+# Trọng số theo field: khớp ở tiêu đề chính quan trọng hơn alt title, rồi mới tới mô tả
+FIELD_WEIGHTS = {
+    'title': 3.0,
+    'alt': 2.0,
+    'description': 0.5,
+}
+PREFIX_FACTOR = 0.8
+TYPO_FACTOR = 0.5
+MAX_EXPANSIONS = 50
+MIN_TYPO_LENGTH = 4
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _is_cjk(ch):
+    code = ord(ch)
+    return (0x3040 <= code <= 0x30ff or 0x3400 <= code <= 0x4dbf or 0x4e00 <= code <= 0x9fff
+            or 0xac00 <= code <= 0xd7af or 0xf900 <= code <= 0xfaff)
+
+
+def normalize(text):
+    # bỏ dấu (tiếng Việt, Latin mở rộng), chữ thường; đ không tách dấu được nên đổi tay
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return text.lower().replace('đ', 'd')
+
+
+def words(text):
+    """Các từ của text sau khi chuẩn hoá (chưa tách bigram CJK)."""
+    return _TOKEN_RE.findall(normalize(text))
+
+
+def tokenize(text):
+    tokens = []
+    for token in words(text):
+        if any(_is_cjk(ch) for ch in token):
+            # tiếng Nhật/Trung/Hàn không có khoảng trắng: index theo bigram ký tự
+            if len(token) == 1:
+                tokens.append(token)
+            tokens.extend(token[i:i + 2] for i in range(len(token) - 1))
+        else:
+            tokens.append(token)
+    return tokens
+
+
+def _within_edit_distance(a, b, max_dist):
+    # Levenshtein có chặn: dừng sớm khi cả hàng đã vượt max_dist
+    if abs(len(a) - len(b)) > max_dist:
+        return False
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > max_dist:
+            return False
+        previous = current
+    return previous[-1] <= max_dist
+
+
+class SearchIndex(InMemoryIndex):
+    def __init__(self):
+        super().__init__()
+        self._postings = {}     # term -> {manga key: trọng số}
+        self._doc_terms = {}    # manga key -> set(term), để gỡ khi cập nhật
+        self._manga_ids = {}    # manga key -> MangaId
+        self._popularity = {}   # manga key -> hệ số theo Follows
+        self._vocab = []        # danh sách term đã sort, cho prefix / typo lookup
+
+    # ---------- build / refresh ----------
+
+    def _load_documents(self, manga_ids=None):
+        docs = {}
+
+        def doc(manga_id):
+            key = str(manga_id).lower()
+            if key not in docs:
+                docs[key] = {'manga_id': manga_id, 'fields': [], 'follows': None}
+            return docs[key]
+
+        titles = db.session.query(Manga.MangaId, Manga.TitleEn)
+        alt_titles = db.session.query(MangaAltTitle.MangaId, MangaAltTitle.AltTitle)
+        descriptions = db.session.query(MangaDescription.MangaId, MangaDescription.Description)
+        stats = db.session.query(MangaStatistics.MangaId, MangaStatistics.Follows)\
+            .order_by(MangaStatistics.FetchedAt.asc())
+        if manga_ids is not None:
+            titles = titles.filter(Manga.MangaId.in_(manga_ids))
+            alt_titles = alt_titles.filter(MangaAltTitle.MangaId.in_(manga_ids))
+            descriptions = descriptions.filter(MangaDescription.MangaId.in_(manga_ids))
+            stats = stats.filter(MangaStatistics.MangaId.in_(manga_ids))
+
+        for manga_id, title in titles.all():
+            doc(manga_id)['fields'].append(('title', title))
+        for manga_id, alt_title in alt_titles.all():
+            if str(manga_id).lower() in docs:
+                docs[str(manga_id).lower()]['fields'].append(('alt', alt_title))
+        for manga_id, description in descriptions.all():
+            if str(manga_id).lower() in docs:
+                docs[str(manga_id).lower()]['fields'].append(('description', description))
+        # nhiều dòng MangaStatistics: dòng FetchedAt mới nhất ghi đè sau cùng
+        for manga_id, follows in stats.all():
+            if str(manga_id).lower() in docs:
+                docs[str(manga_id).lower()]['follows'] = follows
+        return docs
+
+    @staticmethod
+    def _term_weights(fields):
+        weights = {}
+        for field, text in fields:
+            for term in set(tokenize(text)):
+                # mỗi field chỉ tính một lần cho mỗi term để mô tả dài không lấn át tiêu đề
+                weights[term] = weights.get(term, 0.0) + FIELD_WEIGHTS[field]
+        return weights
+
+    @staticmethod
+    def _popularity_of(follows):
+        return 1.0 + 0.1 * math.log1p(follows or 0)
+
+    def rebuild(self):
+        postings, doc_terms, manga_ids, popularity = {}, {}, {}, {}
+        for key, doc in self._load_documents().items():
+            weights = self._term_weights(doc['fields'])
+            for term, weight in weights.items():
+                postings.setdefault(term, {})[key] = weight
+            doc_terms[key] = set(weights)
+            manga_ids[key] = doc['manga_id']
+            popularity[key] = self._popularity_of(doc['follows'])
+        vocab = sorted(postings)
+        with self._lock:
+            self._postings, self._doc_terms = postings, doc_terms
+            self._manga_ids, self._popularity = manga_ids, popularity
+            self._vocab = vocab
+            self._mark_built()
+
+    def refresh(self, dirty):
+        docs = self._load_documents(list(dirty))
+        with self._lock:
+            for key in dirty:
+                for term in self._doc_terms.pop(key, ()):
+                    posting = self._postings.get(term)
+                    if posting is None:
+                        continue
+                    posting.pop(key, None)
+                    if not posting:
+                        del self._postings[term]
+                        i = bisect_left(self._vocab, term)
+                        if i < len(self._vocab) and self._vocab[i] == term:
+                            del self._vocab[i]
+                self._manga_ids.pop(key, None)
+                self._popularity.pop(key, None)
+
+                doc = docs.get(key)
+                if doc is None:
+                    continue  # manga đã bị xoá
+                weights = self._term_weights(doc['fields'])
+                for term, weight in weights.items():
+                    if term not in self._postings:
+                        self._postings[term] = {}
+                        insort(self._vocab, term)
+                    self._postings[term][key] = weight
+                self._doc_terms[key] = set(weights)
+                self._manga_ids[key] = doc['manga_id']
+                self._popularity[key] = self._popularity_of(doc['follows'])
+
+    # ---------- truy vấn ----------
+
+    def _iter_prefix(self, prefix):
+        i = bisect_left(self._vocab, prefix)
+        while i < len(self._vocab) and self._vocab[i].startswith(prefix):
+            yield self._vocab[i]
+            i += 1
+
+    def _prefix_terms(self, prefix):
+        return list(islice(self._iter_prefix(prefix), MAX_EXPANSIONS))
+
+    def _typo_terms(self, token):
+        # chỉ xét các term cùng ký tự đầu (lỗi gõ ở ký tự đầu hiếm gặp) để không quét cả từ điển
+        max_dist = 1 if len(token) < 8 else 2
+        terms = []
+        for term in self._iter_prefix(token[0]):
+            if term != token and _within_edit_distance(token, term, max_dist):
+                terms.append(term)
+                if len(terms) >= MAX_EXPANSIONS:
+                    break
+        return terms
+
+    def _expand(self, token, is_last):
+        """[(term, hệ số)] cho một token của query: khớp đúng, prefix (token cuối), gần đúng."""
+        expansions = []
+        if token in self._postings:
+            expansions.append((token, 1.0))
+        if is_last:
+            expansions.extend((term, PREFIX_FACTOR) for term in self._prefix_terms(token) if term != token)
+        if not expansions and len(token) >= MIN_TYPO_LENGTH:
+            expansions.extend((term, TYPO_FACTOR) for term in self._typo_terms(token))
+        return expansions
+
+    def search(self, query, limit=20):
+        """
+        MangaId khớp với query, xếp theo độ liên quan giảm dần (limit=None: lấy hết).
+        Mọi token của query đều phải khớp (AND); token cuối được match theo prefix.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        self.ensure_fresh()
+        with self._lock:
+            total_docs = max(len(self._doc_terms), 1)
+            scores = None
+            for position, token in enumerate(tokens):
+                token_scores = {}
+                for term, factor in self._expand(token, position == len(tokens) - 1):
+                    posting = self._postings[term]
+                    idf = math.log(1 + total_docs / len(posting))
+                    for key, weight in posting.items():
+                        score = factor * idf * weight
+                        if score > token_scores.get(key, 0.0):
+                            token_scores[key] = score
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {key: scores[key] + s for key, s in token_scores.items() if key in scores}
+                if not scores:
+                    return []
+
+            ranked = sorted(scores, key=lambda key: (-scores[key] * self._popularity[key], key))
+            return [self._manga_ids[key] for key in ranked[:limit]]
+
+
+search_index = SearchIndex()
+
+
+@manga_upserted.connect
+def _on_manga_upserted(sender, manga_id=None, **extra):
+    if manga_id:
+        search_index.mark_dirty(manga_id)
@@ -0,0 +1,15 @@
+# app/signals.py
+# Signal phát ra khi pipeline ingestion ghi dữ liệu mới, để các cache/index
+# trong process (feed, search, facet, ...) tự cập nhật thay vì build lại mỗi request.
+from blinker import Namespace
+
+_signals = Namespace()
+
+# kwargs: manga_id
+manga_upserted = _signals.signal('manga-upserted')
+
+# kwargs: manga_id
+chapters_synced = _signals.signal('chapters-synced')
+
+# kwargs: tag_ids
+tags_updated = _signals.signal('tags-updated')
@@ -5,9 +5,9 @@ document.addEventListener('DOMContentLoaded', () => {
         if (!includeContainer || !excludeContainer) return;
 
         const tagsByGroup = {};
-        data.tags.forEach(([tagId, groupName, nameEn]) => {
+        data.tags.forEach(([tagId, groupName, nameEn, count]) => {
             if (!tagsByGroup[groupName]) tagsByGroup[groupName] = [];
-            tagsByGroup[groupName].push({ tagId, nameEn });
+            tagsByGroup[groupName].push({ tagId, nameEn, count });
         });
 
         const createChecklist = (container, name) => {
@@ -25,7 +25,7 @@ document.addEventListener('DOMContentLoaded', () => {
                     checkWrapper.className = 'form-check';
                     checkWrapper.innerHTML = `
                         <input class="form-check-input" type="checkbox" name="${name}" value="${tag.tagId}" id="${name}_${tag.tagId}">
-                        <label class="form-check-label" for="${name}_${tag.tagId}">${tag.nameEn}</label>
+                        <label class="form-check-label" for="${name}_${tag.tagId}">${tag.nameEn} <small class="text-muted">(${tag.count ?? 0})</small></label>
                     `;
                     groupWrapper.appendChild(checkWrapper);
                 });
@@ -134,7 +134,7 @@ document.addEventListener('DOMContentLoaded', function () {
         try {
             // Gửi 2 yêu cầu API song song với Promise.all
             const [mangaResponse, creatorsResponse] = await Promise.all([
-                fetch(`/search?title=${encodeURIComponent(query)}`),
+                fetch(`/search/suggest?q=${encodeURIComponent(query)}&limit=5`),
                 fetch(`/search_creators?query=${encodeURIComponent(query)}`)
             ]);
 
@@ -153,7 +153,7 @@ document.addEventListener('DOMContentLoaded', function () {
                 mangaResults.forEach(r => {
                     htmlContent += `
                         <a href="/manga/${r.id}" class="search-result-item">
-                            <img src="${r.cover_url}" alt="${r.title}" class="search-result-cover">
+                            <img src="${r.thumbnail_url}" alt="${r.title}" class="search-result-cover">
                             <div class="search-result-info">
                                 <span class="search-result-title">${r.title}</span>
                                 <div class="search-result-stats">
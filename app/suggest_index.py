@@ -0,0 +1,121 @@
+# app/suggest_index.py
+# Index gợi ý (typeahead) cho ô search trên navbar: mảng đã sort các tiêu đề đã chuẩn hoá
+# (TitleEn + alt title), tra prefix bằng bisect. Mỗi phím gõ chỉ đọc bộ nhớ, không chạm SQL Server.
+import heapq
+from bisect import bisect_left, insort
+from collections import namedtuple
+
+from . import db
+from .cover_controller import get_latest_cover_ids
+from .memory_index import InMemoryIndex
+from .models import Manga, MangaAltTitle, MangaStatistics
+from .search_index import words
+from .signals import manga_upserted
+
+# Chỉ index các hậu tố bắt đầu ở MAX_WORD_STARTS từ đầu tiên và cắt ở MAX_KEY_LENGTH ký tự
+MAX_WORD_STARTS = 8
+MAX_KEY_LENGTH = 64
+# cận trên của mọi khoá bắt đầu bằng một prefix (khoá chuẩn hoá không chứa ký tự này)
+PREFIX_END = '\uffff'
+
+SuggestEntry = namedtuple('SuggestEntry', 'manga_id title cover_id follows rating status')
+
+
+def suggest_keys(text):
+    """Các khoá tra cứu của một tiêu đề: chuỗi chuẩn hoá bắt đầu từ mỗi đầu từ ("one piece", "piece")."""
+    parts = words(text)
+    return {' '.join(parts[i:])[:MAX_KEY_LENGTH] for i in range(min(len(parts), MAX_WORD_STARTS))}
+
+
+class SuggestIndex(InMemoryIndex):
+    def __init__(self):
+        super().__init__()
+        self._entries = {}    # manga key -> SuggestEntry
+        self._names = []      # [(khoá chuẩn hoá, manga key)] đã sort
+        self._doc_names = {}  # manga key -> [(khoá, manga key)], để gỡ khi cập nhật
+
+    # ---------- build / refresh ----------
+
+    def _load(self, manga_ids=None):
+        mangas = db.session.query(Manga.MangaId, Manga.TitleEn, Manga.Status)
+        alt_titles = db.session.query(MangaAltTitle.MangaId, MangaAltTitle.AltTitle)
+        stats = db.session.query(MangaStatistics.MangaId, MangaStatistics.Follows,
+                                 MangaStatistics.AverageRating, MangaStatistics.BayesianRating)\
+            .order_by(MangaStatistics.FetchedAt.asc())
+        if manga_ids is not None:
+            mangas = mangas.filter(Manga.MangaId.in_(manga_ids))
+            alt_titles = alt_titles.filter(MangaAltTitle.MangaId.in_(manga_ids))
+            stats = stats.filter(MangaStatistics.MangaId.in_(manga_ids))
+
+        titles = {}
+        for manga_id, alt_title in alt_titles.all():
+            if alt_title:
+                titles.setdefault(str(manga_id).lower(), []).append(alt_title)
+        # nhiều dòng MangaStatistics: dòng FetchedAt mới nhất ghi đè sau cùng
+        stat_rows = {str(row.MangaId).lower(): row for row in stats.all()}
+        cover_ids = get_latest_cover_ids(manga_ids)
+
+        entries, names = {}, {}
+        for manga_id, title_en, status in mangas.all():
+            key = str(manga_id).lower()
+            alts = titles.get(key, [])
+            display = title_en or (alts[0] if alts else None)
+            if not display:
+                continue
+            stat = stat_rows.get(key)
+            rating = (stat.AverageRating or stat.BayesianRating or 0) if stat else 0
+            entries[key] = SuggestEntry(manga_id, display, cover_ids.get(key),
+                                        (stat.Follows if stat else None) or 0, round(rating, 1), status)
+            doc_keys = set()
+            for text in [title_en] + alts:
+                if text:
+                    doc_keys |= suggest_keys(text)
+            names[key] = sorted((name, key) for name in doc_keys if name)
+        return entries, names
+
+    def rebuild(self):
+        entries, doc_names = self._load()
+        names = sorted(name for pairs in doc_names.values() for name in pairs)
+        with self._lock:
+            self._entries, self._doc_names, self._names = entries, doc_names, names
+            self._mark_built()
+
+    def refresh(self, dirty):
+        entries, doc_names = self._load(list(dirty))
+        with self._lock:
+            for key in dirty:
+                for pair in self._doc_names.pop(key, ()):
+                    i = bisect_left(self._names, pair)
+                    if i < len(self._names) and self._names[i] == pair:
+                        del self._names[i]
+                self._entries.pop(key, None)
+                if key in entries:
+                    self._entries[key] = entries[key]
+                    self._doc_names[key] = doc_names[key]
+                    for pair in doc_names[key]:
+                        insort(self._names, pair)
+
+    # ---------- truy vấn ----------
+
+    def suggest(self, query, limit=8):
+        """Manga có tiêu đề/alt title chứa một từ bắt đầu bằng query, xếp theo Follows giảm dần."""
+        prefix = ' '.join(words(query))
+        if not prefix:
+            return []
+        self.ensure_fresh()
+        with self._lock:
+            # cả khoảng khớp prefix (không cắt theo thứ tự chữ cái), rồi chỉ giữ `limit` manga nhiều follow nhất
+            lo = bisect_left(self._names, (prefix,))
+            hi = bisect_left(self._names, (prefix + PREFIX_END,), lo)
+            matched = {key for _, key in self._names[lo:hi]}
+            entries = [self._entries[key] for key in matched]
+        return heapq.nsmallest(limit, entries, key=lambda e: (-e.follows, e.title))
+
+
+suggest_index = SuggestIndex()
+
+
+@manga_upserted.connect
+def _on_manga_upserted(sender, manga_id=None, **extra):
+    if manga_id:
+        suggest_index.mark_dirty(manga_id)
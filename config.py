@@ -1,3 +1,4 @@
+import os
 import urllib
 
 class Config:
@@ -14,4 +15,17 @@ class Config:
     )
 
     SQLALCHEMY_DATABASE_URI = "mssql+pyodbc:///?odbc_connect=" + urllib.parse.quote_plus(connection_string)
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Thư mục kho ảnh bìa trên đĩa (mặc định: instance/covers)
+    COVER_STORE_DIR = os.environ.get("COVER_STORE_DIR")
+
+    # MangaDex: base URL (trỏ tới stub server local khi test) và số request/giây cho mỗi host
+    MANGADEX_API_URL = os.environ.get("MANGADEX_API_URL", "https://api.mangadex.org")
+    MANGADEX_UPLOADS_URL = os.environ.get("MANGADEX_UPLOADS_URL", "https://uploads.mangadex.org")
+    MANGADEX_API_RATE = float(os.environ.get("MANGADEX_API_RATE", 5))
+    MANGADEX_UPLOADS_RATE = float(os.environ.get("MANGADEX_UPLOADS_RATE", 10))
+
+    # Worker làm mới chapter (app/chapter_scheduler.py). Mặc định tắt: mỗi process có RateLimiter riêng nên
+    # chỉ bật cho đúng MỘT process web, hoặc chạy worker riêng `python -m app.chapter_scheduler`
+    CHAPTER_SCHEDULER_ENABLED = os.environ.get("CHAPTER_SCHEDULER_ENABLED", "0") == "1"
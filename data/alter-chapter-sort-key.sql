@@ -0,0 +1,28 @@
+USE [MangaLibrary]
+GO
+
+-- Thứ tự đọc của chapter dạng số (ChapterNumber là chuỗi nên "10" < "9"), tính lúc ingest
+-- (app/mangadex_api.py: chapter_sort_key). Hoà SortKey thì xếp theo ChapterId.
+--   SortKey = số chapter (chapter không có số: 0)
+--           + volume * 100000 nếu manga đánh số lại chapter mỗi volume (ChapterNumbersResetOnNewVolume)
+
+ALTER TABLE [dbo].[Chapter] ADD [SortKey] [DECIMAL](18, 4) NULL;
+GO
+
+-- Tính cho các chapter đã có (cùng quy tắc với chapter_sort_key)
+UPDATE c
+SET c.[SortKey] =
+    COALESCE(CASE WHEN ABS(TRY_CONVERT(DECIMAL(18, 4), LTRIM(RTRIM(c.[ChapterNumber])))) < 100000
+                  THEN TRY_CONVERT(DECIMAL(18, 4), LTRIM(RTRIM(c.[ChapterNumber]))) END, 0)
+    + CASE WHEN m.[ChapterNumbersResetOnNewVolume] = 1
+                AND ABS(TRY_CONVERT(DECIMAL(18, 4), LTRIM(RTRIM(c.[Volume])))) < 100000
+           THEN TRY_CONVERT(DECIMAL(18, 4), LTRIM(RTRIM(c.[Volume]))) * 100000
+           ELSE 0 END
+FROM [dbo].[Chapter] c
+JOIN [dbo].[Manga] m ON m.[MangaId] = c.[MangaId];
+GO
+
+CREATE NONCLUSTERED INDEX [IX_Chapter_MangaId_TranslatedLang_SortKey]
+    ON [dbo].[Chapter] ([MangaId] ASC, [TranslatedLang] ASC, [SortKey] ASC)
+    INCLUDE ([IsUnavailable], [ChapterNumber]);
+GO
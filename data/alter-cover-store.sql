@@ -0,0 +1,13 @@
+USE [MangaLibrary]
+GO
+
+-- Ảnh bìa chuyển sang kho trên đĩa (app/cover_store.py), DB chỉ giữ sha256 của ảnh.
+-- ImageData / image_data được giữ cho các cover cũ và tự chuyển sang kho ở lần phục vụ đầu tiên.
+
+ALTER TABLE [dbo].[MangaCover] ADD [ContentHash] [CHAR](64) NULL;
+GO
+ALTER TABLE [dbo].[MangaCover] ALTER COLUMN [ImageData] [VARBINARY](MAX) NULL;
+GO
+
+ALTER TABLE [dbo].[Covers] ADD [content_hash] [CHAR](64) NULL;
+GO
@@ -0,0 +1,11 @@
+USE [MangaLibrary]
+GO
+
+-- Lần cuối chapter của manga được đồng bộ từ MangaDex (app/chapter_scheduler.py).
+-- NULL = chưa sync lần nào, được worker ưu tiên lấy trước trong nhóm "lâu chưa sync".
+
+ALTER TABLE [dbo].[Manga] ADD [LastSyncedAt] [DATETIME2](7) NULL;
+GO
+
+CREATE NONCLUSTERED INDEX [IX_Manga_LastSyncedAt] ON [dbo].[Manga] ([LastSyncedAt] ASC);
+GO
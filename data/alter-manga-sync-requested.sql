@@ -0,0 +1,12 @@
+USE [MangaLibrary]
+GO
+
+-- Manga người đọc vừa mở mà DB chưa có chapter (app/chapter_scheduler.py request_sync).
+-- Ghi ở DB để worker chạy ở process khác cũng thấy; worker xoá về NULL sau khi sync xong.
+
+ALTER TABLE [dbo].[Manga] ADD [SyncRequestedAt] [DATETIME2](7) NULL;
+GO
+
+CREATE NONCLUSTERED INDEX [IX_Manga_SyncRequestedAt] ON [dbo].[Manga] ([SyncRequestedAt] ASC)
+    WHERE [SyncRequestedAt] IS NOT NULL;
+GO
@@ -0,0 +1,18 @@
+USE [MangaLibrary]
+GO
+
+-- MangaStatistics giữ một dòng cho mỗi (MangaId, Source): ingestion MERGE theo cặp này
+-- (app/mangadex_api.py: upsert_manga_statistics) thay vì thêm dòng mới với StatisticId ngẫu nhiên mỗi lần.
+
+-- Bỏ các dòng cũ, giữ dòng FetchedAt mới nhất của mỗi cặp
+;WITH ranked AS (
+    SELECT ROW_NUMBER() OVER (PARTITION BY [MangaId], [Source]
+                              ORDER BY [FetchedAt] DESC, [StatisticId] DESC) AS rn
+    FROM [dbo].[MangaStatistics]
+)
+DELETE FROM ranked WHERE rn > 1;
+GO
+
+CREATE UNIQUE NONCLUSTERED INDEX [UX_MangaStatistics_MangaId_Source]
+    ON [dbo].[MangaStatistics] ([MangaId] ASC, [Source] ASC);
+GO
@@ -1,4 +1,5 @@
 import os
+import sys
 import time
 import json
 import random
@@ -11,8 +12,12 @@ import requests
 import pyodbc
 from tqdm import tqdm
 
+# Dùng chung rate limiter với app (token bucket + header X-RateLimit-*)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from app.rate_limiter import RateLimiter
+
 # ====== CONFIG ======
-BASE_URL = "https://api.mangadex.org"  # Fixed typo: mangadex not mangadx
+BASE_URL = os.environ.get("MANGADEX_API_URL", "https://api.mangadex.org")  # Fixed typo: mangadex not mangadx
 COVER_ENDPOINT = "/cover"
 
 # API page params
@@ -28,6 +33,12 @@ JITTER_RANGE = 0.3    # Random jitter để tránh thundering herd
 # Download threads - giảm để tránh quá tải
 MAX_DOWNLOAD_WORKERS = 4
 
+# Token bucket (request/giây) dùng chung cho mọi thread: api.mangadex.org ~5 req/s/IP
+API_RATE = float(os.environ.get("MANGADEX_API_RATE", 5))
+IMAGE_RATE = float(os.environ.get("MANGADEX_UPLOADS_RATE", 10))
+api_limiter = RateLimiter(API_RATE)
+image_limiter = RateLimiter(IMAGE_RATE)
+
 # File storage
 BASE_COVER_DIR = "covers"
 
@@ -93,7 +104,7 @@ class EnhancedMangaDxCoverFetcher:
         retry_strategy = Retry(
             total=MAX_RETRIES,
             backoff_factor=BACKOFF_FACTOR,
-            status_forcelist=[429, 500, 502, 503, 504, 520, 521, 522, 523, 524]
+            status_forcelist=[500, 502, 503, 504, 520, 521, 522, 523, 524]
         )
         adapter = HTTPAdapter(max_retries=retry_strategy)
         self.session.mount('https://', adapter)
@@ -161,7 +172,7 @@ class EnhancedMangaDxCoverFetcher:
         retry_strategy = Retry(
             total=MAX_RETRIES,
             backoff_factor=BACKOFF_FACTOR,
-            status_forcelist=[429, 500, 502, 503, 504, 520, 521, 522, 523, 524]
+            status_forcelist=[500, 502, 503, 504, 520, 521, 522, 523, 524]
         )
         adapter = HTTPAdapter(max_retries=retry_strategy)
         self.session.mount('https://', adapter)
@@ -185,34 +196,26 @@ class EnhancedMangaDxCoverFetcher:
             logger.debug(f"Headers rotated at request #{self.request_count}")
         
         
+        limiter = image_limiter if is_image else api_limiter
+        rate_limited = False
         for attempt in range(MAX_RETRIES):
             try:
-                # Adaptive delay based on attempt number and recent failures
-                base_delay = MIN_DELAY * (BACKOFF_FACTOR ** attempt)
-                
-                # Add extra conservative delay for image downloads
-                if is_image:
-                    base_delay *= 1.5
-                
-                # Random jitter
-                jitter = random.uniform(-JITTER_RANGE, JITTER_RANGE) * base_delay
-                delay = min(MAX_DELAY, max(MIN_DELAY, base_delay + jitter))
-                
-                if attempt > 0:
+                if attempt > 0 and not rate_limited:
+                    # Backoff cho lỗi mạng / 5xx; 429 do limiter tự chờ theo header
+                    base_delay = MIN_DELAY * (BACKOFF_FACTOR ** (attempt - 1))
+                    jitter = random.uniform(-JITTER_RANGE, JITTER_RANGE) * base_delay
+                    delay = min(MAX_DELAY, max(MIN_DELAY, base_delay + jitter))
                     logger.info(f"Attempt {attempt + 1}/{MAX_RETRIES}, waiting {delay:.2f}s before retry...")
                     time.sleep(delay)
-                else:
-                    # Random delay for first request to look more human-like
-                    initial_delay = random.uniform(0.3, 1.2) if not is_image else random.uniform(0.5, 2.0)
-                    time.sleep(initial_delay)
 
+                limiter.acquire(url)
                 response = self.session.get(url, params=params, timeout=30)
-                
-                # Xử lý rate limit 429
+                wait = limiter.observe(url, response)
+                rate_limited = response.status_code == 429
+
+                # Xử lý rate limit 429: limiter đã dừng mọi thread tới khi hết Retry-After
                 if response.status_code == 429:
-                    retry_after = int(response.headers.get('Retry-After', 60))
-                    logger.warning(f"Rate limited (429). Waiting {retry_after}s as instructed by server...")
-                    time.sleep(retry_after + random.uniform(1, 5))  # Thêm buffer
+                    logger.warning(f"Rate limited (429). All workers paused {wait:.0f}s as instructed by server...")
                     continue
                 
                 # Success cases
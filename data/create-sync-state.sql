@@ -0,0 +1,13 @@
+USE [MangaLibrary]
+GO
+
+-- Trạng thái của các job đồng bộ với MangaDex (crawler toàn catalog, delta sync, ...):
+-- mỗi job một dòng, State là JSON (cursor / watermark) để chạy lại tiếp từ chỗ đã dừng.
+
+CREATE TABLE [dbo].[SyncState](
+	[Name] [NVARCHAR](100) NOT NULL,
+	[State] [NVARCHAR](MAX) NULL,
+	[UpdatedAt] [DATETIME2](7) NOT NULL CONSTRAINT [DF_SyncState_UpdatedAt] DEFAULT (SYSUTCDATETIME()),
+ CONSTRAINT [PK_SyncState] PRIMARY KEY CLUSTERED ([Name] ASC)
+) ON [PRIMARY]
+GO
@@ -0,0 +1,22 @@
+USE [MangaLibrary]
+GO
+
+-- Chapter đánh số dạng "5a", "5b" (số + một chữ cái) trước đây có SortKey = 0 (phần chapter không phải số).
+-- Tính lại theo app/mangadex_api.py: _sort_number: xếp ngay sau chapter 5 (5.0001, 5.0002, ...).
+
+UPDATE c
+SET c.[SortKey] =
+    t.[Number] + (ASCII(LOWER(t.[Letter])) - 96) * 0.0001
+    + CASE WHEN m.[ChapterNumbersResetOnNewVolume] = 1
+                AND ABS(TRY_CONVERT(DECIMAL(18, 4), LTRIM(RTRIM(c.[Volume])))) < 100000
+           THEN TRY_CONVERT(DECIMAL(18, 4), LTRIM(RTRIM(c.[Volume]))) * 100000
+           ELSE 0 END
+FROM [dbo].[Chapter] c
+JOIN [dbo].[Manga] m ON m.[MangaId] = c.[MangaId]
+CROSS APPLY (SELECT LTRIM(RTRIM(c.[ChapterNumber])) AS [Text]) n
+CROSS APPLY (SELECT TRY_CONVERT(DECIMAL(18, 4), RTRIM(LEFT(n.[Text], NULLIF(LEN(n.[Text]), 0) - 1))) AS [Number],
+                    RIGHT(n.[Text], 1) AS [Letter]) t
+WHERE TRY_CONVERT(DECIMAL(18, 4), n.[Text]) IS NULL
+  AND t.[Letter] LIKE '[a-zA-Z]'
+  AND ABS(t.[Number]) < 100000;
+GO
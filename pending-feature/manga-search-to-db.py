@@ -372,433 +372,158 @@ def fetch_covers(manga_id):
     return covers
 
 # -------------------------------
-# Hàm upsert dữ liệu
+# Bulk upsert: stage vào bảng tạm (fast_executemany) rồi MERGE set-based, commit một lần mỗi lô
 # -------------------------------
-def upsert_manga(conn, manga_list):
-    cursor = conn.cursor()
-    for manga in manga_list:
-        manga_id_upper = str(manga['MangaId']).upper()
-        logger.info(f"Xử lý upsert manga ID: {manga_id_upper}")
-        try:
-            cursor.execute("""
-                MERGE INTO [dbo].[Manga] AS target
-                USING (VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)) 
-                AS source (MangaId, Type, TitleEn, ChapterNumbersResetOnNewVolume, ContentRating, CreatedAt, UpdatedAt, IsLocked, LastChapter, LastVolume, LatestUploadedChapter, OriginalLanguage, PublicationDemographic, State, Status, Year, OfficialLinks)
-                ON target.MangaId = source.MangaId
-                WHEN MATCHED AND (
-                    target.Type != source.Type OR
-                    target.TitleEn != source.TitleEn OR
-                    target.ChapterNumbersResetOnNewVolume != source.ChapterNumbersResetOnNewVolume OR
-                    target.ContentRating != source.ContentRating OR
-                    target.CreatedAt != source.CreatedAt OR
-                    target.UpdatedAt != source.UpdatedAt OR
-                    target.IsLocked != source.IsLocked OR
-                    target.LastChapter != source.LastChapter OR
-                    target.LastVolume != source.LastVolume OR
-                    target.LatestUploadedChapter != source.LatestUploadedChapter OR
-                    target.OriginalLanguage != source.OriginalLanguage OR
-                    target.PublicationDemographic != source.PublicationDemographic OR
-                    target.State != source.State OR
-                    target.Status != source.Status OR
-                    target.Year != source.Year OR
-                    target.OfficialLinks != source.OfficialLinks
-                ) THEN
-                    UPDATE SET 
-                        Type = source.Type,
-                        TitleEn = source.TitleEn,
-                        ChapterNumbersResetOnNewVolume = source.ChapterNumbersResetOnNewVolume,
-                        ContentRating = source.ContentRating,
-                        CreatedAt = source.CreatedAt,
-                        UpdatedAt = source.UpdatedAt,
-                        IsLocked = source.IsLocked,
-                        LastChapter = source.LastChapter,
-                        LastVolume = source.LastVolume,
-                        LatestUploadedChapter = source.LatestUploadedChapter,
-                        OriginalLanguage = source.OriginalLanguage,
-                        PublicationDemographic = source.PublicationDemographic,
-                        State = source.State,
-                        Status = source.Status,
-                        Year = source.Year,
-                        OfficialLinks = source.OfficialLinks
-                WHEN NOT MATCHED THEN
-                    INSERT (MangaId, Type, TitleEn, ChapterNumbersResetOnNewVolume, ContentRating, CreatedAt, UpdatedAt, IsLocked, LastChapter, LastVolume, LatestUploadedChapter, OriginalLanguage, PublicationDemographic, State, Status, Year, OfficialLinks)
-                    VALUES (source.MangaId, source.Type, source.TitleEn, source.ChapterNumbersResetOnNewVolume, source.ContentRating, source.CreatedAt, source.UpdatedAt, source.IsLocked, source.LastChapter, source.LastVolume, source.LatestUploadedChapter, source.OriginalLanguage, source.PublicationDemographic, source.State, source.Status, source.Year, source.OfficialLinks);
-            """, (
-                manga_id_upper,
-                manga.get('Type'),
-                manga.get('TitleEn'),
-                manga.get('ChapterNumbersResetOnNewVolume'),
-                manga.get('ContentRating'),
-                manga.get('CreatedAt'),
-                manga.get('UpdatedAt'),
-                manga.get('IsLocked'),
-                manga.get('LastChapter'),
-                manga.get('LastVolume'),
-                manga.get('LatestUploadedChapter'),
-                manga.get('OriginalLanguage'),
-                manga.get('PublicationDemographic'),
-                manga.get('State'),
-                manga.get('Status'),
-                manga.get('Year'),
-                manga.get('OfficialLinks')
-            ))
-            conn.commit()
-            logger.info(f"Hoàn thành upsert manga ID: {manga_id_upper}")
-        except pyodbc.Error as e:
-            conn.rollback()
-            logger.error(f"Lỗi upsert manga ID {manga_id_upper}: {e}")
-            raise
-
-def upsert_manga_alt_title(conn, alt_titles):
-    cursor = conn.cursor()
-    for alt in alt_titles:
-        manga_id_upper = str(alt['MangaId']).upper()
-        logger.info(f"Xử lý upsert MangaAltTitle cho MangaId: {manga_id_upper}, LangCode: {alt['LangCode']}")
-        try:
-            cursor.execute("""
-                IF NOT EXISTS (SELECT 1 FROM [dbo].[MangaAltTitle] WHERE MangaId = ? AND LangCode = ? AND AltTitle = ?)
-                INSERT INTO [dbo].[MangaAltTitle] (MangaId, LangCode, AltTitle)
-                VALUES (?, ?, ?)
-            """, (
-                manga_id_upper, alt['LangCode'], alt['AltTitle'],
-                manga_id_upper, alt['LangCode'], alt['AltTitle']
-            ))
-            conn.commit()
-            logger.debug(f"Hoàn thành upsert MangaAltTitle cho MangaId: {manga_id_upper}")
-        except pyodbc.Error as e:
-            conn.rollback()
-            logger.error(f"Lỗi upsert MangaAltTitle cho MangaId {manga_id_upper}: {e}")
-            raise
-
-def upsert_manga_description(conn, descriptions):
-    cursor = conn.cursor()
-    for desc in descriptions:
-        manga_id_upper = str(desc['MangaId']).upper()
-        logger.info(f"Xử lý upsert MangaDescription cho MangaId: {manga_id_upper}, LangCode: {desc['LangCode']}")
-        try:
-            cursor.execute("""
-                IF NOT EXISTS (SELECT 1 FROM [dbo].[MangaDescription] WHERE MangaId = ? AND LangCode = ? AND Description = ?)
-                INSERT INTO [dbo].[MangaDescription] (MangaId, LangCode, Description)
-                VALUES (?, ?, ?)
-            """, (
-                manga_id_upper, desc['LangCode'], desc['Description'],
-                manga_id_upper, desc['LangCode'], desc['Description']
-            ))
-            conn.commit()
-            logger.debug(f"Hoàn thành upsert MangaDescription cho MangaId: {manga_id_upper}")
-        except pyodbc.Error as e:
-            conn.rollback()
-            logger.error(f"Lỗi upsert MangaDescription cho MangaId {manga_id_upper}: {e}")
-            raise
-
-def upsert_manga_available_language(conn, available_languages):
-    cursor = conn.cursor()
-    for lang in available_languages:
-        manga_id_upper = str(lang['MangaId']).upper()
-        logger.info(f"Xử lý upsert MangaAvailableLanguage cho MangaId: {manga_id_upper}, LangCode: {lang['LangCode']}")
-        try:
-            cursor.execute("""
-                IF NOT EXISTS (SELECT 1 FROM [dbo].[MangaAvailableLanguage] WHERE MangaId = ? AND LangCode = ?)
-                INSERT INTO [dbo].[MangaAvailableLanguage] (MangaId, LangCode)
-                VALUES (?, ?)
-            """, (
-                manga_id_upper, lang['LangCode'],
-                manga_id_upper, lang['LangCode']
-            ))
-            conn.commit()
-            logger.debug(f"Hoàn thành upsert MangaAvailableLanguage cho MangaId: {manga_id_upper}")
-        except pyodbc.Error as e:
-            conn.rollback()
-            logger.error(f"Lỗi upsert MangaAvailableLanguage cho MangaId {manga_id_upper}: {e}")
-            raise
+def _row_changed(columns):
+    # so sánh NULL-safe: EXCEPT coi NULL = NULL, khác với "!="
+    source = ", ".join(f"source.[{c}]" for c in columns)
+    target = ", ".join(f"target.[{c}]" for c in columns)
+    return f"EXISTS (SELECT {source} EXCEPT SELECT {target})"
+
+def bulk_merge(conn, table, columns, rows, keys, update_columns=(), set_overrides=None,
+               extra_changed=None, output=None, commit=True):
+    """
+    MERGE `rows` (tuple theo thứ tự `columns`) vào [dbo].[table] theo `keys`.
+    update_columns: cột được cập nhật khi khớp khoá (rỗng = chỉ thêm dòng chưa có);
+    set_overrides: {cột: biểu thức SQL} thay cho "= source.cột"; extra_changed: điều kiện
+    cập nhật thêm (OR). Dòng trùng khoá trong lô: giữ dòng cuối. output: mệnh đề OUTPUT,
+    trả về các dòng của nó. commit=False để caller tự quản transaction.
+    """
+    if not rows:
+        return []
+    key_index = [columns.index(k) for k in keys]
+    staged = list({tuple(row[i] for i in key_index): row for row in rows}.values())
+    stage = f"#Stage{table}"
+    column_list = ", ".join(f"[{c}]" for c in columns)
+    set_overrides = set_overrides or {}
+
+    sql = f"""
+        MERGE INTO [dbo].[{table}] AS target
+        USING {stage} AS source
+        ON {" AND ".join(f"target.[{k}] = source.[{k}]" for k in keys)}"""
+    if update_columns:
+        changed = _row_changed(update_columns)
+        if extra_changed:
+            changed = f"({changed} OR {extra_changed})"
+        assignments = [f"[{c}] = source.[{c}]" for c in update_columns if c not in set_overrides]
+        assignments += [f"[{c}] = {expr}" for c, expr in set_overrides.items()]
+        sql += f"""
+        WHEN MATCHED AND {changed} THEN
+            UPDATE SET {", ".join(assignments)}"""
+    sql += f"""
+        WHEN NOT MATCHED THEN
+            INSERT ({column_list})
+            VALUES ({", ".join(f"source.[{c}]" for c in columns)})"""
+    if output:
+        sql += f"""
+        OUTPUT {output}"""
+    sql += ";"
 
-def upsert_manga_link(conn, links):
     cursor = conn.cursor()
-    for link in links:
-        manga_id_upper = str(link['MangaId']).upper()
-        logger.info(f"Xử lý upsert MangaLink cho MangaId: {manga_id_upper}, Provider: {link['Provider']}")
-        try:
-            cursor.execute("""
-                IF NOT EXISTS (SELECT 1 FROM [dbo].[MangaLink] WHERE MangaId = ? AND Provider = ? AND Url = ?)
-                INSERT INTO [dbo].[MangaLink] (MangaId, Provider, Url)
-                VALUES (?, ?, ?)
-            """, (
-                manga_id_upper, link['Provider'], link['Url'],
-                manga_id_upper, link['Provider'], link['Url']
-            ))
-            conn.commit()
-            logger.debug(f"Hoàn thành upsert MangaLink cho MangaId: {manga_id_upper}")
-        except pyodbc.Error as e:
-            conn.rollback()
-            logger.error(f"Lỗi upsert MangaLink cho MangaId {manga_id_upper}: {e}")
-            raise
-
-def upsert_manga_related(conn, related_list):
-    cursor = conn.cursor()
-    for related in related_list:
-        manga_id_upper = str(related['MangaId']).upper()
-        related_id_upper = str(related['RelatedId']).upper()
-        logger.info(f"Xử lý upsert MangaRelated cho MangaId: {manga_id_upper}, RelatedId: {related_id_upper}")
-        try:
-            cursor.execute("""
-                MERGE INTO [dbo].[MangaRelated] AS target
-                USING (VALUES (?, ?, ?, ?, ?)) 
-                AS source (MangaId, RelatedId, Type, Related, FetchedAt)
-                ON target.MangaId = source.MangaId AND target.RelatedId = source.RelatedId AND target.Type = source.Type
-                WHEN MATCHED AND (
-                    target.Related != source.Related OR
-                    target.FetchedAt != source.FetchedAt
-                ) THEN
-                    UPDATE SET 
-                        Related = source.Related,
-                        FetchedAt = source.FetchedAt
-                WHEN NOT MATCHED THEN
-                    INSERT (MangaId, RelatedId, Type, Related, FetchedAt)
-                    VALUES (source.MangaId, source.RelatedId, source.Type, source.Related, source.FetchedAt);
-            """, (
-                manga_id_upper, related_id_upper, related['Type'], related['Related'], related['FetchedAt']
-            ))
-            conn.commit()
-            logger.debug(f"Hoàn thành upsert MangaRelated cho MangaId: {manga_id_upper}")
-        except pyodbc.Error as e:
-            conn.rollback()
-            logger.error(f"Lỗi upsert MangaRelated cho MangaId {manga_id_upper}: {e}")
-            raise
-
-def upsert_manga_statistics(conn, statistics_list):
-    cursor = conn.cursor()
-    for stat in statistics_list:
-        manga_id_upper = str(stat['MangaId']).upper()
-        statistic_id_upper = str(stat['StatisticId']).upper()
-        logger.info(f"Xử lý upsert MangaStatistics cho MangaId: {manga_id_upper}")
-        try:
-            cursor.execute("""
-                MERGE INTO [dbo].[MangaStatistics] AS target
-                USING (VALUES (?, ?, ?, ?, ?, ?, ?, ?)) 
-                AS source (StatisticId, MangaId, Source, Follows, AverageRating, BayesianRating, UnavailableChapters, FetchedAt)
-                ON target.StatisticId = source.StatisticId
-                WHEN MATCHED AND (
-                    target.Source != source.Source OR
-                    target.Follows != source.Follows OR
-                    target.AverageRating != source.AverageRating OR
-                    target.BayesianRating != source.BayesianRating OR
-                    target.UnavailableChapters != source.UnavailableChapters OR
-                    target.FetchedAt != source.FetchedAt
-                ) THEN
-                    UPDATE SET 
-                        Source = source.Source,
-                        Follows = source.Follows,
-                        AverageRating = source.AverageRating,
-                        BayesianRating = source.BayesianRating,
-                        UnavailableChapters = source.UnavailableChapters,
-                        FetchedAt = source.FetchedAt
-                WHEN NOT MATCHED THEN
-                    INSERT (StatisticId, MangaId, Source, Follows, AverageRating, BayesianRating, UnavailableChapters, FetchedAt)
-                    VALUES (source.StatisticId, source.MangaId, source.Source, source.Follows, source.AverageRating, source.BayesianRating, source.UnavailableChapters, source.FetchedAt);
-            """, (
-                statistic_id_upper, manga_id_upper, stat['Source'], stat['Follows'], stat['AverageRating'],
-                stat['BayesianRating'], stat['UnavailableChapters'], stat['FetchedAt']
-            ))
-            conn.commit()
-            logger.debug(f"Hoàn thành upsert MangaStatistics cho MangaId: {manga_id_upper}")
-        except pyodbc.Error as e:
-            conn.rollback()
-            logger.error(f"Lỗi upsert MangaStatistics cho MangaId {manga_id_upper}: {e}")
-            raise
-
-def upsert_manga_tag(conn, manga_tags):
-    cursor = conn.cursor()
-    for tag in manga_tags:
-        manga_id_upper = str(tag['MangaId']).upper()
-        tag_id_upper = str(tag['TagId']).upper()
-        logger.info(f"Xử lý upsert MangaTag cho MangaId: {manga_id_upper}, TagId: {tag_id_upper}")
-        try:
-            cursor.execute("""
-                IF NOT EXISTS (SELECT 1 FROM [dbo].[MangaTag] WHERE MangaId = ? AND TagId = ?)
-                INSERT INTO [dbo].[MangaTag] (MangaId, TagId)
-                VALUES (?, ?)
-            """, (
-                manga_id_upper, tag_id_upper,
-                manga_id_upper, tag_id_upper
-            ))
-            conn.commit()
-            logger.debug(f"Hoàn thành upsert MangaTag cho MangaId: {manga_id_upper}, TagId: {tag_id_upper}")
-        except pyodbc.Error as e:
-            conn.rollback()
-            logger.error(f"Lỗi upsert MangaTag cho MangaId {manga_id_upper}, TagId {tag_id_upper}: {e}")
-            raise
-
-def upsert_chapter(conn, chapters):
-    cursor = conn.cursor()
-    for chapter in chapters:
-        chapter_id_upper = str(chapter['ChapterId']).upper()
-        manga_id_upper = str(chapter['MangaId']).upper()
-        logger.info(f"Xử lý upsert Chapter cho ChapterId: {chapter_id_upper}")
-        try:
-            cursor.execute("""
-                MERGE INTO [dbo].[Chapter] AS target
-                USING (VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)) 
-                AS source (ChapterId, MangaId, Type, Volume, ChapterNumber, Title, TranslatedLang, Pages, PublishAt, ReadableAt, IsUnavailable, CreatedAt, UpdatedAt)
-                ON target.ChapterId = source.ChapterId
-                WHEN MATCHED AND (
-                    target.Type != source.Type OR
-                    target.Volume != source.Volume OR
-                    target.ChapterNumber != source.ChapterNumber OR
-                    target.Title != source.Title OR
-                    target.TranslatedLang != source.TranslatedLang OR
-                    target.Pages != source.Pages OR
-                    target.PublishAt != source.PublishAt OR
-                    target.ReadableAt != source.ReadableAt OR
-                    target.IsUnavailable != source.IsUnavailable OR
-                    target.CreatedAt != source.CreatedAt OR
-                    target.UpdatedAt != source.UpdatedAt
-                ) THEN
-                    UPDATE SET 
-                        Type = source.Type,
-                        Volume = source.Volume,
-                        ChapterNumber = source.ChapterNumber,
-                        Title = source.Title,
-                        TranslatedLang = source.TranslatedLang,
-                        Pages = source.Pages,
-                        PublishAt = source.PublishAt,
-                        ReadableAt = source.ReadableAt,
-                        IsUnavailable = source.IsUnavailable,
-                        CreatedAt = source.CreatedAt,
-                        UpdatedAt = source.UpdatedAt
-                WHEN NOT MATCHED THEN
-                    INSERT (ChapterId, MangaId, Type, Volume, ChapterNumber, Title, TranslatedLang, Pages, PublishAt, ReadableAt, IsUnavailable, CreatedAt, UpdatedAt)
-                    VALUES (source.ChapterId, source.MangaId, source.Type, source.Volume, source.ChapterNumber, source.Title, source.TranslatedLang, source.Pages, source.PublishAt, source.ReadableAt, source.IsUnavailable, source.CreatedAt, source.UpdatedAt);
-            """, (
-                chapter_id_upper, manga_id_upper, chapter['Type'], chapter['Volume'], chapter['ChapterNumber'],
-                chapter['Title'], chapter['TranslatedLang'], chapter['Pages'], chapter['PublishAt'], chapter['ReadableAt'],
-                chapter['IsUnavailable'], chapter['CreatedAt'], chapter['UpdatedAt']
-            ))
-            conn.commit()
-            logger.debug(f"Hoàn thành upsert Chapter cho ChapterId: {chapter_id_upper}")
-        except pyodbc.Error as e:
-            conn.rollback()
-            logger.error(f"Lỗi upsert Chapter cho ChapterId {chapter_id_upper}: {e}")
-            raise
-
-def upsert_covers(conn, covers):
-    cursor = conn.cursor()
-    for cover in covers:
-        cover_id_upper = str(cover['cover_id']).upper()
-        manga_id_upper = str(cover['manga_id']).upper()
-        logger.info(f"Xử lý upsert Covers cho cover_id: {cover_id_upper}")
-        try:
-            cursor.execute("""
-                MERGE INTO [dbo].[Covers] AS target
-                USING (VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)) 
-                AS source (cover_id, manga_id, type, description, volume, fileName, locale, createdAt, updatedAt, version, rel_user_id, url, image_data)
-                ON target.cover_id = source.cover_id
-                WHEN MATCHED AND (
-                    target.manga_id != source.manga_id OR
-                    target.type != source.type OR
-                    target.description != source.description OR
-                    target.volume != source.volume OR
-                    target.fileName != source.fileName OR
-                    target.locale != source.locale OR
-                    target.createdAt != source.createdAt OR
-                    target.updatedAt != source.updatedAt OR
-                    target.version != source.version OR
-                    target.rel_user_id != source.rel_user_id OR
-                    target.url != source.url OR
-                    (target.image_data IS NULL AND source.image_data IS NOT NULL)
-                ) THEN
-                    UPDATE SET 
-                        manga_id = source.manga_id,
-                        type = source.type,
-                        description = source.description,
-                        volume = source.volume,
-                        fileName = source.fileName,
-                        locale = source.locale,
-                        createdAt = source.createdAt,
-                        updatedAt = source.updatedAt,
-                        version = source.version,
-                        rel_user_id = source.rel_user_id,
-                        url = source.url,
-                        image_data = source.image_data
-                WHEN NOT MATCHED THEN
-                    INSERT (cover_id, manga_id, type, description, volume, fileName, locale, createdAt, updatedAt, version, rel_user_id, url, image_data)
-                    VALUES (source.cover_id, source.manga_id, source.type, source.description, source.volume, source.fileName, source.locale, source.createdAt, source.updatedAt, source.version, source.rel_user_id, source.url, source.image_data);
-            """, (
-                cover_id_upper, manga_id_upper, cover['type'], cover['description'], cover['volume'],
-                cover['fileName'], cover['locale'], cover['createdAt'], cover['updatedAt'], cover['version'],
-                cover['rel_user_id'] if cover['rel_user_id'] else None, cover['url'], cover['image_data']
-            ))
-            conn.commit()
-            logger.debug(f"Hoàn thành upsert Covers cho cover_id: {cover_id_upper}")
-        except pyodbc.Error as e:
-            conn.rollback()
-            logger.error(f"Lỗi upsert Covers cho cover_id {cover_id_upper}: {e}")
-            raise
-
-def upsert_creator(conn, creators):
-    cursor = conn.cursor()
-    for creator in creators:
-        creator_id_upper = str(creator['CreatorId']).upper()
-        logger.info(f"Xử lý upsert Creator cho CreatorId: {creator_id_upper}")
-        try:
-            cursor.execute("""
-                MERGE INTO [dbo].[Creator] AS target
-                USING (VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)) 
-                AS source (CreatorId, Type, Name, ImageUrl, BiographyEn, BiographyJa, BiographyPtBr, CreatedAt, UpdatedAt)
-                ON target.CreatorId = source.CreatorId
-                WHEN MATCHED AND (
-                    target.Type != source.Type OR
-                    target.Name != source.Name OR
-                    target.ImageUrl != source.ImageUrl OR
-                    target.BiographyEn != source.BiographyEn OR
-                    target.BiographyJa != source.BiographyJa OR
-                    target.BiographyPtBr != source.BiographyPtBr OR
-                    target.CreatedAt != source.CreatedAt OR
-                    target.UpdatedAt != source.UpdatedAt
-                ) THEN
-                    UPDATE SET 
-                        Type = source.Type,
-                        Name = source.Name,
-                        ImageUrl = source.ImageUrl,
-                        BiographyEn = source.BiographyEn,
-                        BiographyJa = source.BiographyJa,
-                        BiographyPtBr = source.BiographyPtBr,
-                        CreatedAt = source.CreatedAt,
-                        UpdatedAt = source.UpdatedAt
-                WHEN NOT MATCHED THEN
-                    INSERT (CreatorId, Type, Name, ImageUrl, BiographyEn, BiographyJa, BiographyPtBr, CreatedAt, UpdatedAt)
-                    VALUES (source.CreatorId, source.Type, source.Name, source.ImageUrl, source.BiographyEn, source.BiographyJa, source.BiographyPtBr, source.CreatedAt, source.UpdatedAt);
-            """, (
-                creator_id_upper, creator['Type'], creator['Name'], creator['ImageUrl'], creator['BiographyEn'],
-                creator['BiographyJa'], creator['BiographyPtBr'], creator['CreatedAt'], creator['UpdatedAt']
-            ))
+    try:
+        cursor.execute(f"IF OBJECT_ID('tempdb..{stage}') IS NOT NULL DROP TABLE {stage}")
+        # bảng tạm cùng kiểu cột với bảng đích
+        cursor.execute(f"SELECT TOP 0 {column_list} INTO {stage} FROM [dbo].[{table}]")
+        cursor.fast_executemany = True
+        cursor.executemany(
+            f"INSERT INTO {stage} ({column_list}) VALUES ({', '.join('?' * len(columns))})", staged
+        )
+        cursor.execute(sql)
+        result = cursor.fetchall() if output else []
+        cursor.execute(f"DROP TABLE {stage}")
+        if commit:
             conn.commit()
-            logger.debug(f"Hoàn thành upsert Creator cho CreatorId: {creator_id_upper}")
-        except pyodbc.Error as e:
-            conn.rollback()
-            logger.error(f"Lỗi upsert Creator cho CreatorId {creator_id_upper}: {e}")
-            raise
+        logger.info(f"Đã upsert {len(staged)} dòng vào {table}.")
+        return result
+    except pyodbc.Error as e:
+        conn.rollback()
+        logger.error(f"Lỗi upsert {table} ({len(staged)} dòng): {e}")
+        raise
+    finally:
+        cursor.close()
 
-def upsert_creator_relationship(conn, relationships):
-    cursor = conn.cursor()
-    for rel in relationships:
-        creator_id_upper = str(rel['CreatorId']).upper()
-        related_id_upper = str(rel['RelatedId']).upper()
-        logger.info(f"Xử lý upsert CreatorRelationship cho CreatorId: {creator_id_upper}, RelatedId: {related_id_upper}")
-        try:
-            cursor.execute("""
-                IF NOT EXISTS (SELECT 1 FROM [dbo].[CreatorRelationship] WHERE CreatorId = ? AND RelatedId = ? AND RelatedType = ?)
-                INSERT INTO [dbo].[CreatorRelationship] (CreatorId, RelatedId, RelatedType)
-                VALUES (?, ?, ?)
-            """, (
-                creator_id_upper, related_id_upper, rel['RelatedType'],
-                creator_id_upper, related_id_upper, rel['RelatedType']
-            ))
-            conn.commit()
-            logger.debug(f"Hoàn thành upsert CreatorRelationship cho CreatorId: {creator_id_upper}")
-        except pyodbc.Error as e:
-            conn.rollback()
-            logger.error(f"Lỗi upsert CreatorRelationship cho CreatorId {creator_id_upper}: {e}")
-            raise
+# -------------------------------
+# Hàm upsert dữ liệu
+# -------------------------------
+MANGA_COLUMNS = ["MangaId", "Type", "TitleEn", "ChapterNumbersResetOnNewVolume", "ContentRating", "CreatedAt",
+                 "UpdatedAt", "IsLocked", "LastChapter", "LastVolume", "LatestUploadedChapter", "OriginalLanguage",
+                 "PublicationDemographic", "State", "Status", "Year", "OfficialLinks"]
+STATISTICS_COLUMNS = ["StatisticId", "MangaId", "Source", "Follows", "AverageRating", "BayesianRating",
+                      "UnavailableChapters", "FetchedAt"]
+CHAPTER_COLUMNS = ["ChapterId", "MangaId", "Type", "Volume", "ChapterNumber", "Title", "TranslatedLang", "Pages",
+                   "PublishAt", "ReadableAt", "IsUnavailable", "CreatedAt", "UpdatedAt"]
+COVER_COLUMNS = ["cover_id", "manga_id", "type", "description", "volume", "fileName", "locale", "createdAt",
+                 "updatedAt", "version", "rel_user_id", "url", "image_data"]
+CREATOR_COLUMNS = ["CreatorId", "Type", "Name", "ImageUrl", "BiographyEn", "BiographyJa", "BiographyPtBr",
+                   "CreatedAt", "UpdatedAt"]
+
+def upsert_manga(conn, manga_list, commit=True):
+    rows = [tuple(str(m[c]).upper() if c == "MangaId" else m.get(c) for c in MANGA_COLUMNS) for m in manga_list]
+    bulk_merge(conn, "Manga", MANGA_COLUMNS, rows, ["MangaId"],
+               update_columns=MANGA_COLUMNS[1:], commit=commit)
+
+def upsert_manga_alt_title(conn, alt_titles, commit=True):
+    rows = [(str(a['MangaId']).upper(), a['LangCode'], a['AltTitle']) for a in alt_titles]
+    bulk_merge(conn, "MangaAltTitle", ["MangaId", "LangCode", "AltTitle"], rows,
+               ["MangaId", "LangCode", "AltTitle"], commit=commit)
+
+def upsert_manga_description(conn, descriptions, commit=True):
+    rows = [(str(d['MangaId']).upper(), d['LangCode'], d['Description']) for d in descriptions]
+    bulk_merge(conn, "MangaDescription", ["MangaId", "LangCode", "Description"], rows,
+               ["MangaId", "LangCode", "Description"], commit=commit)
+
+def upsert_manga_available_language(conn, available_languages, commit=True):
+    rows = [(str(l['MangaId']).upper(), l['LangCode']) for l in available_languages]
+    bulk_merge(conn, "MangaAvailableLanguage", ["MangaId", "LangCode"], rows, ["MangaId", "LangCode"],
+               commit=commit)
+
+def upsert_manga_link(conn, links, commit=True):
+    rows = [(str(l['MangaId']).upper(), l['Provider'], l['Url']) for l in links]
+    bulk_merge(conn, "MangaLink", ["MangaId", "Provider", "Url"], rows,
+               ["MangaId", "Provider", "Url"], commit=commit)
+
+def upsert_manga_statistics(conn, statistics_list, commit=True):
+    rows = [(str(s['StatisticId']).upper(), str(s['MangaId']).upper(), s['Source'], s['Follows'],
+             s['AverageRating'], s['BayesianRating'], s['UnavailableChapters'], s['FetchedAt']) for s in statistics_list]
+    bulk_merge(conn, "MangaStatistics", STATISTICS_COLUMNS, rows, ["StatisticId"],
+               update_columns=STATISTICS_COLUMNS[1:], commit=commit)
+
+def upsert_manga_tag(conn, manga_tags, commit=True):
+    rows = [(str(t['MangaId']).upper(), str(t['TagId']).upper()) for t in manga_tags]
+    bulk_merge(conn, "MangaTag", ["MangaId", "TagId"], rows, ["MangaId", "TagId"], commit=commit)
+
+def upsert_chapter(conn, chapters, commit=True):
+    rows = [tuple(str(ch[c]).upper() if c in ("ChapterId", "MangaId") else ch[c] for c in CHAPTER_COLUMNS)
+            for ch in chapters]
+    bulk_merge(conn, "Chapter", CHAPTER_COLUMNS, rows, ["ChapterId"],
+               update_columns=CHAPTER_COLUMNS[2:], commit=commit)
+
+def upsert_covers(conn, covers, commit=True):
+    rows = [(str(c['cover_id']).upper(), str(c['manga_id']).upper(), c['type'], c['description'], c['volume'],
+             c['fileName'], c['locale'], c['createdAt'], c['updatedAt'], c['version'],
+             c['rel_user_id'] if c['rel_user_id'] else None, c['url'], c['image_data']) for c in covers]
+    # image_data (varbinary) không đưa vào phép so sánh EXCEPT: chỉ ghi khi DB chưa có ảnh
+    bulk_merge(conn, "Covers", COVER_COLUMNS, rows, ["cover_id"],
+               update_columns=COVER_COLUMNS[1:-1],
+               set_overrides={"image_data": "source.[image_data]"},
+               extra_changed="(target.[image_data] IS NULL AND source.[image_data] IS NOT NULL)",
+               commit=commit)
+
+def upsert_creator(conn, creators, commit=True):
+    rows = [tuple(str(cr[c]).upper() if c == "CreatorId" else cr[c] for c in CREATOR_COLUMNS) for cr in creators]
+    bulk_merge(conn, "Creator", CREATOR_COLUMNS, rows, ["CreatorId"],
+               update_columns=CREATOR_COLUMNS[1:], commit=commit)
+
+def upsert_creator_relationship(conn, relationships, commit=True):
+    rows = [(str(r['CreatorId']).upper(), str(r['RelatedId']).upper(), r['RelatedType']) for r in relationships]
+    bulk_merge(conn, "CreatorRelationship", ["CreatorId", "RelatedId", "RelatedType"], rows,
+               ["CreatorId", "RelatedId", "RelatedType"], commit=commit)
+
+def upsert_manga_related(conn, related_list, commit=True):
+    rows = [(str(r['MangaId']).upper(), str(r['RelatedId']).upper(), r['Type'], r['Related'], r['FetchedAt'])
+            for r in related_list]
+    bulk_merge(conn, "MangaRelated", ["MangaId", "RelatedId", "Type", "Related", "FetchedAt"], rows,
+               ["MangaId", "RelatedId", "Type"], update_columns=["Related", "FetchedAt"], commit=commit)
 
 # -------------------------------
 # Map manga to DB structures and upsert
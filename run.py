@@ -1,3 +1,9 @@
+import os
+
+if __name__ == "__main__" and os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+    # dev server một process: chạy luôn worker chapter (app/chapter_scheduler.py) trong process con của reloader
+    os.environ.setdefault("CHAPTER_SCHEDULER_ENABLED", "1")
+
 from app import create_app
 
 app = create_app()
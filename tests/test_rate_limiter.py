@@ -0,0 +1,142 @@
+# tests/test_rate_limiter.py
+# RateLimiter chạy với một stub server local trả 429 / header X-RateLimit-*.
+# Nạp app/rate_limiter.py theo đường dẫn để không kéo theo app/__init__.py (Flask, DB).
+import importlib.util
+import os
+import threading
+import time
+import unittest
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+_spec = importlib.util.spec_from_file_location(
+    "rate_limiter", os.path.join(os.path.dirname(__file__), "..", "app", "rate_limiter.py"))
+rate_limiter = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(rate_limiter)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # path -> (status, headers)
+    routes = {}
+
+    def do_GET(self):
+        status, headers = self.routes.get(self.path, (200, {}))
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def fetch(url):
+    """GET tới stub server, trả về object giống requests.Response (status_code, headers)."""
+    try:
+        with urllib.request.urlopen(url) as resp:
+            return SimpleNamespace(status_code=resp.status, headers=resp.headers)
+    except urllib.error.HTTPError as e:
+        return SimpleNamespace(status_code=e.code, headers=e.headers)
+
+
+class RateLimiterStubServerTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        cls.base = f"http://127.0.0.1:{cls.server.server_port}"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        StubHandler.routes = {}
+
+    def test_429_with_retry_after_pauses_whole_host(self):
+        StubHandler.routes["/manga"] = (429, {"Retry-After": "1"})
+        limiter = rate_limiter.RateLimiter(rate=100)
+        url = self.base + "/manga"
+
+        limiter.acquire(url)
+        wait = limiter.observe(url, fetch(url))
+        self.assertAlmostEqual(wait, 1.0, delta=0.05)
+
+        # route khác cùng host cũng chờ vì bucket của host bị tạm dừng
+        start = time.monotonic()
+        limiter.acquire(self.base + "/chapter")
+        self.assertGreaterEqual(time.monotonic() - start, 0.9)
+
+    def test_429_without_headers_uses_default_retry_after(self):
+        StubHandler.routes["/cover"] = (429, {})
+        limiter = rate_limiter.RateLimiter(rate=100)
+        url = self.base + "/cover"
+        self.assertEqual(limiter.observe(url, fetch(url)), rate_limiter.RateLimiter.DEFAULT_RETRY_AFTER)
+
+    def test_exhausted_route_window_blocks_only_that_route(self):
+        reset_at = time.time() + 1
+        StubHandler.routes["/at-home/server/x"] = (200, {
+            "X-RateLimit-Limit": "40",
+            "X-RateLimit-Remaining": "0",
+            "X-RateLimit-Retry-After": str(int(reset_at) + 1),
+        })
+        limiter = rate_limiter.RateLimiter(rate=100)
+        url = self.base + "/at-home/server/x"
+        self.assertGreater(limiter.observe(url, fetch(url)), 0)
+
+        start = time.monotonic()
+        limiter.acquire(self.base + "/manga")
+        self.assertLess(time.monotonic() - start, 0.2)
+        with self.assertRaises(rate_limiter.RateLimitTimeout):
+            limiter.acquire(self.base + "/at-home/server/y", max_wait=0.2)
+
+    def test_remaining_requests_do_not_block(self):
+        StubHandler.routes["/manga"] = (200, {"X-RateLimit-Limit": "40", "X-RateLimit-Remaining": "39"})
+        limiter = rate_limiter.RateLimiter(rate=100)
+        url = self.base + "/manga"
+        self.assertEqual(limiter.observe(url, fetch(url)), 0.0)
+
+    def test_max_wait_fails_fast_while_paused(self):
+        StubHandler.routes["/manga"] = (429, {"Retry-After": "30"})
+        limiter = rate_limiter.RateLimiter(rate=100)
+        url = self.base + "/manga"
+        limiter.observe(url, fetch(url))
+
+        start = time.monotonic()
+        with self.assertRaises(rate_limiter.RateLimitTimeout):
+            limiter.acquire(self.base + "/at-home/server/x", max_wait=0.5)
+        self.assertLess(time.monotonic() - start, 0.1)
+
+    def test_token_bucket_rate(self):
+        bucket = rate_limiter.TokenBucket(rate=20, capacity=1)
+        start = time.monotonic()
+        for _ in range(11):
+            bucket.acquire()
+        self.assertAlmostEqual(time.monotonic() - start, 0.5, delta=0.15)
+
+    def test_priority_lane_keeps_reserve_and_goes_first(self):
+        bucket = rate_limiter.TokenBucket(rate=5, capacity=5, reserve=1)
+        for _ in range(4):
+            self.assertLess(bucket.acquire(), 0.05)
+        # lượt thường không lấy token dành riêng, lượt ưu tiên lấy ngay
+        with self.assertRaises(rate_limiter.RateLimitTimeout):
+            bucket.acquire(max_wait=0.05)
+        self.assertLess(bucket.acquire(priority=True), 0.05)
+
+        # cả hai cùng chờ token tiếp theo: lượt ưu tiên được cấp trước
+        order = []
+        background = threading.Thread(target=lambda: (bucket.acquire(), order.append("background")))
+        background.start()
+        time.sleep(0.02)
+        bucket.acquire(priority=True)
+        order.append("priority")
+        background.join()
+        self.assertEqual(order, ["priority", "background"])
+
+
+if __name__ == "__main__":
+    unittest.main()